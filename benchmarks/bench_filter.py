@@ -0,0 +1,61 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from q2_alignment import mask, PackedAlignment, SparseAlignment
+from q2_alignment._filter import (
+    _column_counts, _compute_gap_mask, _compute_conservation_mask,
+    _apply_mask)
+
+from .synthetic import simulate_alignment, to_tabular_msa
+
+
+_REPRESENTATIONS = {
+    'tabular': lambda msa: msa,
+    'packed': PackedAlignment.from_tabular_msa,
+    'sparse': SparseAlignment.from_tabular_msa,
+}
+
+
+class MaskStages:
+    params = ([(100, 500), (1000, 1500), (4000, 500)],
+              [0.1, 0.9],
+              [0.01, 0.3],
+              list(_REPRESENTATIONS))
+    param_names = ['shape', 'gap_density', 'divergence', 'representation']
+    timeout = 600
+
+    def setup(self, shape, gap_density, divergence, representation):
+        n_sequences, length = shape
+        msa = to_tabular_msa(simulate_alignment(n_sequences, length,
+                                                gap_density=gap_density,
+                                                divergence=divergence))
+        self.alignment = _REPRESENTATIONS[representation](msa)
+        # Keep the gap filter meaningful (but not empty) at each density.
+        self.max_gap_frequency = min(1.0, gap_density + 0.1)
+        self.counts = _column_counts(self.alignment)
+        self.gap_mask = _compute_gap_mask(self.counts, self.max_gap_frequency)
+        self.conservation_mask = _compute_conservation_mask(self.counts, 0.4)
+        self.mask = self.gap_mask & self.conservation_mask
+
+    def time_column_counts(self, *args):
+        _column_counts(self.alignment)
+
+    def time_compute_gap_mask(self, *args):
+        _compute_gap_mask(self.counts, self.max_gap_frequency)
+
+    def time_compute_conservation_mask(self, *args):
+        _compute_conservation_mask(self.counts, 0.4)
+
+    def time_apply_mask(self, *args):
+        _apply_mask(self.alignment, self.mask)
+
+    def time_mask(self, *args):
+        mask(self.alignment, max_gap_frequency=self.max_gap_frequency)
+
+    def peakmem_mask(self, *args):
+        mask(self.alignment, max_gap_frequency=self.max_gap_frequency)
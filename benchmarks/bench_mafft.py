@@ -0,0 +1,68 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import resource
+import tempfile
+
+from qiime2.util import redirected_stdio
+from q2_types.feature_data import DNAFASTAFormat, AlignedDNAFASTAFormat
+
+from q2_alignment import mafft, mafft_add
+
+from .synthetic import simulate_alignment, write_fasta
+
+
+class Mafft:
+    params = [(100, 300), (1000, 300), (1000, 1500)]
+    param_names = ['shape']
+    timeout = 1800
+
+    def setup(self, shape):
+        n_sequences, length = shape
+        self.temp_dir = tempfile.TemporaryDirectory()
+        alignment = simulate_alignment(2 * n_sequences, length)
+
+        # The first half of the simulated sequences make up the reference
+        # alignment for mafft_add, and the second half are added to it.
+        self.alignment_fp = os.path.join(self.temp_dir.name, 'aligned.fasta')
+        write_fasta(alignment[:n_sequences], self.alignment_fp)
+        self.sequences_fp = os.path.join(self.temp_dir.name,
+                                         'unaligned.fasta')
+        write_fasta(alignment[n_sequences:], self.sequences_fp, degap=True)
+
+        self.sequences = DNAFASTAFormat(self.sequences_fp, mode='r')
+        self.alignment = AlignedDNAFASTAFormat(self.alignment_fp, mode='r')
+
+    def teardown(self, shape):
+        self.temp_dir.cleanup()
+
+    def time_mafft(self, shape):
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            mafft(self.sequences)
+
+    def peakmem_mafft(self, shape):
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            mafft(self.sequences)
+
+    def time_mafft_add(self, shape):
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            mafft_add(self.alignment, self.sequences)
+
+    def peakmem_mafft_add(self, shape):
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            mafft_add(self.alignment, self.sequences)
+
+    def track_mafft_peak_rss(self, shape):
+        # peakmem_* only measures this process, but most of the memory is
+        # used by the mafft subprocess. ru_maxrss is reported in kilobytes.
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            mafft(self.sequences)
+        return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+    track_mafft_peak_rss.unit = 'bytes'
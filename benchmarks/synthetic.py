@@ -0,0 +1,60 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import skbio
+
+
+_NUCLEOTIDES = np.frombuffer(b'ACGT', dtype=np.uint8)
+_GAP = ord('-')
+
+
+def simulate_alignment(n_sequences, length, gap_density=0.1,
+                       divergence=0.05, mean_indel_length=3, seed=0):
+    """Simulate a DNA alignment as an ``(n_sequences, length)`` ASCII array.
+
+    Every sequence is derived from one random root sequence. Each position is
+    substituted with probability ``divergence``, and gaps are introduced as
+    runs with geometrically distributed lengths (mean ``mean_indel_length``)
+    until roughly ``gap_density`` of each row is gapped. Runs of gaps at the
+    ends of rows are common in real amplicon alignments, so the first and
+    last indel of each row are anchored to its ends.
+    """
+    rng = np.random.RandomState(seed)
+    root = rng.choice(_NUCLEOTIDES, size=length)
+    alignment = np.tile(root, (n_sequences, 1))
+
+    substituted = rng.random_sample((n_sequences, length)) < divergence
+    alignment[substituted] = rng.choice(_NUCLEOTIDES,
+                                        size=substituted.sum())
+
+    n_indels = max(1, int(gap_density * length / mean_indel_length))
+    for row in alignment:
+        indel_lengths = rng.geometric(1 / mean_indel_length, size=n_indels)
+        indel_starts = rng.randint(0, length, size=n_indels)
+        indel_starts[0] = 0
+        indel_starts[-1] = length - indel_lengths[-1]
+        for start, indel_length in zip(indel_starts, indel_lengths):
+            row[max(start, 0):start + indel_length] = _GAP
+    return alignment
+
+
+def to_tabular_msa(alignment):
+    return skbio.TabularMSA(
+        [skbio.DNA(row.tobytes().decode(),
+                   metadata={'id': 'seq%d' % i, 'description': ''})
+         for i, row in enumerate(alignment)])
+
+
+def write_fasta(alignment, fp, degap=False):
+    """Write the simulated alignment (or its unaligned sequences) as FASTA."""
+    with open(fp, 'wb') as fh:
+        for i, row in enumerate(alignment):
+            if degap:
+                row = row[row != _GAP]
+            fh.write(b'>seq%d\n%s\n' % (i, row.tobytes()))
@@ -6,12 +6,75 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-from ._mafft import mafft, mafft_add
-from ._filter import mask
+import importlib
+import sys
+import types
+
 from ._version import get_versions
 
 
 __version__ = get_versions()['version']
 del get_versions
 
-__all__ = ['mafft', 'mask', 'mafft_add']
+# The public API is imported lazily (on first attribute access), so that
+# importing the package doesn't pull in skbio, numpy or q2_types. This keeps
+# plugin discovery cheap for QIIME 2 commands that never run an action.
+_LAZY_ATTRS = {
+    'mafft': '._mafft',
+    'mafft_add': '._mafft',
+    'mafft_merge': '._mafft',
+    'mafft_with_profile': '._mafft',
+    'mafft_add_with_profile': '._mafft',
+    'mafft_with_orientation': '._mafft',
+    'mafft_add_with_orientation': '._mafft',
+    'align_and_mask': '._mafft',
+    'align_and_mask_with_alignment': '._mafft',
+    'mask': '._filter',
+    'compute_mask': '._filter',
+    'apply_mask': '._filter',
+    'consensus': '._consensus',
+    'distance_matrix': '._distance',
+    'summarize': '._summary',
+    'PackedAlignment': '._packed',
+    'SparseAlignment': '._sparse',
+    'MappedAlignment': '._mapped',
+    'add_stage_hook': '._profile',
+    'remove_stage_hook': '._profile',
+    'enable_column_cache': '._cache',
+    'disable_column_cache': '._cache',
+}
+
+__all__ = ['mafft', 'mask', 'compute_mask', 'apply_mask', 'mafft_add',
+           'mafft_merge', 'align_and_mask', 'align_and_mask_with_alignment',
+           'mafft_with_profile', 'mafft_add_with_profile',
+           'mafft_with_orientation', 'mafft_add_with_orientation',
+           'consensus', 'distance_matrix', 'summarize', 'PackedAlignment',
+           'SparseAlignment', 'MappedAlignment', 'add_stage_hook',
+           'remove_stage_hook', 'enable_column_cache', 'disable_column_cache']
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__),
+                    name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
+
+
+if sys.version_info < (3, 7):
+    # Module-level __getattr__ and __dir__ (PEP 562) are only looked up from
+    # Python 3.7, so on earlier versions the module's class provides them.
+    class _LazyModule(types.ModuleType):
+        def __getattr__(self, name):
+            return __getattr__(name)
+
+        def __dir__(self):
+            return __dir__()
+
+    sys.modules[__name__].__class__ = _LazyModule
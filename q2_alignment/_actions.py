@@ -0,0 +1,197 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# The actions as registered with QIIME 2. QIIME 2 reads each action's
+# signature when the plugin is loaded, but the implementations (and
+# everything they import) are only needed when an action is run. So these
+# functions only declare the signatures, and each call is forwarded to the
+# implementation of the same name, whose module is imported on first use.
+# The signatures are checked against the implementations' in
+# tests/test_actions.py.
+
+import functools
+import importlib
+
+import numpy as np
+import pandas as pd
+import skbio
+from q2_types.feature_data import (
+    DNAFASTAFormat, AlignedDNAFASTAFormat, DNAIterator)
+
+import q2_alignment
+from ._packed import PackedAlignment
+
+
+def _deferred(signature):
+    name = signature.__name__
+
+    @functools.wraps(signature)
+    def action(*args, **kwargs):
+        module = importlib.import_module(q2_alignment._LAZY_ATTRS[name],
+                                         q2_alignment.__name__)
+        return getattr(module, name)(*args, **kwargs)
+    return action
+
+
+@_deferred
+def mafft(sequences: DNAFASTAFormat,
+          n_threads: int = 1,
+          parttree: bool = False,
+          max_cluster_size: int = None,
+          scratch_dir: str = None) -> AlignedDNAFASTAFormat:
+    ...
+
+
+@_deferred
+def mafft_add(alignment: AlignedDNAFASTAFormat,
+              sequences: DNAFASTAFormat,
+              n_threads: int = 1,
+              parttree: bool = False,
+              chunk_size: int = None,
+              checkpoint_dir: str = None,
+              scratch_dir: str = None) -> AlignedDNAFASTAFormat:
+    ...
+
+
+@_deferred
+def mafft_with_profile(sequences: DNAFASTAFormat,
+                       n_threads: int = 1,
+                       parttree: bool = False,
+                       max_cluster_size: int = None,
+                       scratch_dir: str = None) -> (AlignedDNAFASTAFormat,
+                                                    pd.DataFrame):
+    ...
+
+
+@_deferred
+def mafft_add_with_profile(alignment: AlignedDNAFASTAFormat,
+                           sequences: DNAFASTAFormat,
+                           n_threads: int = 1,
+                           parttree: bool = False,
+                           chunk_size: int = None,
+                           checkpoint_dir: str = None,
+                           scratch_dir: str = None) -> (AlignedDNAFASTAFormat,
+                                                        pd.DataFrame):
+    ...
+
+
+@_deferred
+def mafft_with_orientation(sequences: DNAFASTAFormat,
+                           reference: AlignedDNAFASTAFormat = None,
+                           n_threads: int = 1,
+                           parttree: bool = False,
+                           max_cluster_size: int = None,
+                           scratch_dir: str = None) -> (AlignedDNAFASTAFormat,
+                                                        pd.DataFrame):
+    ...
+
+
+@_deferred
+def mafft_add_with_orientation(alignment: AlignedDNAFASTAFormat,
+                               sequences: DNAFASTAFormat,
+                               n_threads: int = 1,
+                               parttree: bool = False,
+                               chunk_size: int = None,
+                               checkpoint_dir: str = None,
+                               scratch_dir: str = None
+                               ) -> (AlignedDNAFASTAFormat, pd.DataFrame):
+    ...
+
+
+@_deferred
+def mafft_merge(alignments: AlignedDNAFASTAFormat,
+                n_threads: int = 1) -> AlignedDNAFASTAFormat:
+    ...
+
+
+@_deferred
+def mask(alignment: PackedAlignment, max_gap_frequency: float = 1.0,
+         min_conservation: float = 0.40,
+         column_profile: pd.DataFrame = None,
+         min_terminal_coverage: float = 0.0,
+         trim_terminal_gaps: bool = False,
+         window_size: int = 1,
+         window_step: int = 1,
+         min_minor_allele_count: int = 0,
+         parsimony_informative: bool = False) -> PackedAlignment:
+    ...
+
+
+@_deferred
+def compute_mask(alignment: PackedAlignment, max_gap_frequency: float = 1.0,
+                 min_conservation: float = 0.40,
+                 column_profile: pd.DataFrame = None,
+                 min_terminal_coverage: float = 0.0,
+                 trim_terminal_gaps: bool = False,
+                 window_size: int = 1,
+                 window_step: int = 1,
+                 min_minor_allele_count: int = 0,
+                 parsimony_informative: bool = False) -> np.ndarray:
+    ...
+
+
+@_deferred
+def apply_mask(alignment: AlignedDNAFASTAFormat,
+               mask: np.ndarray) -> AlignedDNAFASTAFormat:
+    ...
+
+
+@_deferred
+def align_and_mask(sequences: DNAFASTAFormat,
+                   n_threads: int = 1,
+                   parttree: bool = False,
+                   max_cluster_size: int = None,
+                   max_gap_frequency: float = 1.0,
+                   min_conservation: float = 0.40,
+                   min_terminal_coverage: float = 0.0,
+                   trim_terminal_gaps: bool = False,
+                   window_size: int = 1,
+                   window_step: int = 1,
+                   min_minor_allele_count: int = 0,
+                   parsimony_informative: bool = False
+                   ) -> AlignedDNAFASTAFormat:
+    ...
+
+
+@_deferred
+def align_and_mask_with_alignment(sequences: DNAFASTAFormat,
+                                  n_threads: int = 1,
+                                  parttree: bool = False,
+                                  max_cluster_size: int = None,
+                                  max_gap_frequency: float = 1.0,
+                                  min_conservation: float = 0.40,
+                                  min_terminal_coverage: float = 0.0,
+                                  trim_terminal_gaps: bool = False,
+                                  window_size: int = 1,
+                                  window_step: int = 1,
+                                  min_minor_allele_count: int = 0,
+                                  parsimony_informative: bool = False
+                                  ) -> (AlignedDNAFASTAFormat,
+                                        AlignedDNAFASTAFormat):
+    ...
+
+
+@_deferred
+def consensus(alignment: PackedAlignment,
+              method: str = 'majority',
+              threshold: float = 0.5,
+              max_gap_frequency: float = 0.5,
+              consensus_id: str = 'consensus') -> DNAIterator:
+    ...
+
+
+@_deferred
+def distance_matrix(alignment: PackedAlignment,
+                    metric: str = 'p-distance',
+                    n_jobs: int = 1) -> skbio.DistanceMatrix:
+    ...
+
+
+@_deferred
+def summarize(output_dir: str, alignment: PackedAlignment) -> None:
+    ...
@@ -0,0 +1,120 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import collections
+import hashlib
+import threading
+
+from ._packed import PackedAlignment
+from ._sparse import SparseAlignment
+from ._mapped import MappedAlignment
+
+
+_DEFAULT_MAX_BYTES = 256 * 2 ** 20
+
+_lock = threading.Lock()
+_cache = None
+
+
+class _ColumnCountCache:
+    """Column counts keyed by alignment content, with LRU eviction.
+
+    The total size of the cached count arrays is kept at or below
+    ``max_bytes``, evicting the least recently used entries first.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        counts = self.entries.get(key)
+        if counts is not None:
+            self.entries.move_to_end(key)
+        return counts
+
+    def put(self, key, counts):
+        if counts.nbytes > self.max_bytes or key in self.entries:
+            return
+        self.entries[key] = counts
+        self.n_bytes += counts.nbytes
+        while self.n_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.n_bytes -= evicted.nbytes
+
+
+def enable_column_cache(max_bytes=_DEFAULT_MAX_BYTES):
+    """Cache the column counts of alignments passed to ``mask``.
+
+    Counts are keyed by a hash of the alignment's characters, so calling
+    ``mask`` again on an unchanged alignment (e.g., while tuning thresholds
+    in a notebook) skips counting its columns. At most ``max_bytes`` of
+    counts are kept, and the least recently used are evicted first.
+    Enabling the cache again replaces it (and its contents).
+    """
+    global _cache
+    if max_bytes < 0:
+        raise ValueError('max_bytes must be at least 0: %d' % max_bytes)
+    with _lock:
+        _cache = _ColumnCountCache(max_bytes)
+
+
+def disable_column_cache():
+    """Disable and empty the cache enabled by ``enable_column_cache``."""
+    global _cache
+    with _lock:
+        _cache = None
+
+
+def _column_cache_enabled():
+    return _cache is not None
+
+
+def _content_key(alignment):
+    # A digest of everything that determines an alignment's column counts.
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(alignment, PackedAlignment):
+        digest.update(b'packed %d %d' % (len(alignment),
+                                         alignment.n_positions))
+        digest.update(alignment.data.tobytes())
+    elif isinstance(alignment, SparseAlignment):
+        digest.update(b'sparse %d %d' % (len(alignment),
+                                         alignment.n_positions))
+        for array in (alignment.starts, alignment.ends,
+                      alignment.run_offsets, alignment.residues):
+            digest.update(array.tobytes())
+            digest.update(b'|')
+    elif isinstance(alignment, MappedAlignment):
+        digest.update(b'mapped %d %d' % (len(alignment),
+                                         alignment.n_positions))
+        for start in range(0, len(alignment), 10000):
+            digest.update(alignment.chars[start:start + 10000].tobytes())
+    else:
+        digest.update(b'msa %d %d' % tuple(alignment.shape))
+        for sequence in alignment:
+            digest.update(sequence.values.tobytes())
+    return digest.digest()
+
+
+def _cached_column_counts(alignment, compute):
+    """Return ``compute(alignment)``, reusing cached counts if enabled."""
+    cache = _cache
+    if cache is None:
+        return compute(alignment)
+    key = _content_key(alignment)
+    with _lock:
+        counts = cache.get(key)
+    if counts is None:
+        counts = compute(alignment)
+        # Cached arrays are shared between calls, so guard against callers
+        # modifying them in place.
+        counts.setflags(write=False)
+        with _lock:
+            cache.put(key, counts)
+    return counts
@@ -0,0 +1,101 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import skbio
+from q2_types.feature_data import DNAIterator
+
+from ._filter import _column_counts
+from ._packed import IUPAC_BY_BASES, PackedAlignment, _BASE_BITS
+from ._profile import _stage, _profiled
+from ._metrics import _count, _metered
+
+
+_BASES = 'ACGT'
+_METHODS = ('majority', 'threshold', 'degenerate')
+
+# The IUPAC character for each set of bases, indexed by a bitmask with A, C,
+# G and T as bits 0 to 3. An empty set (i.e., a position with no bases) is N.
+_IUPAC = np.frombuffer(IUPAC_BY_BASES, dtype=np.uint8)
+
+# The fraction of each ALPHABET character attributed to each base. Ambiguous
+# characters are split evenly between the bases they represent, and gaps
+# contribute nothing.
+_BASE_WEIGHTS = (_BASE_BITS[:, np.newaxis] >> np.arange(len(_BASES))) & 1
+_BASE_WEIGHTS = _BASE_WEIGHTS / np.maximum(
+    _BASE_WEIGHTS.sum(axis=1, keepdims=True), 1)
+
+
+def _base_sets(base_counts, method, threshold):
+    # Return a bitmask of the bases represented at each position.
+    totals = base_counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fractions = np.where(totals > 0, base_counts / totals, 0.0)
+    bits = 1 << np.arange(len(_BASES))
+
+    if method == 'majority':
+        # The most frequent base, or all of the bases tied for most frequent.
+        selected = (fractions == fractions.max(axis=1, keepdims=True)) & \
+            (fractions > 0)
+    elif method == 'threshold':
+        # The base whose frequency is at least `threshold`. If there isn't
+        # exactly one, the position is N.
+        selected = fractions >= threshold
+        selected[selected.sum(axis=1) != 1] = False
+    else:
+        # The smallest set of (most frequent) bases whose combined frequency
+        # is at least `threshold`, plus any bases tied with the least
+        # frequent base in that set.
+        descending = -np.sort(-fractions, axis=1)
+        # Allow for rounding error in the cumulative sums.
+        n_selected = (np.cumsum(descending, axis=1) <
+                      threshold - 1e-9).sum(axis=1)
+        n_selected = np.minimum(n_selected, len(_BASES) - 1)
+        cutoff = np.take_along_axis(descending, n_selected[:, np.newaxis],
+                                    axis=1)
+        selected = (fractions >= cutoff) & (fractions > 0)
+    return (selected * bits).sum(axis=1)
+
+
+def consensus(alignment: PackedAlignment, method: str = 'majority',
+              threshold: float = 0.5, max_gap_frequency: float = 0.5,
+              consensus_id: str = 'consensus') -> DNAIterator:
+    with _profiled('consensus'), _metered('consensus'):
+        if method not in _METHODS:
+            raise ValueError('Unknown consensus method: %r. Supported methods '
+                             'are %s.' % (method, ', '.join(_METHODS)))
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError('threshold out of range (0.0, 1.0]: %f'
+                             % threshold)
+        if max_gap_frequency < 0.0 or max_gap_frequency > 1.0:
+            raise ValueError('max_gap_frequency out of range [0.0, 1.0]: %f'
+                             % max_gap_frequency)
+        if alignment.shape.sequence == 0 or alignment.shape.position == 0:
+            raise ValueError('Input alignment is empty (i.e., there are zero '
+                             'sequences or positions in the input '
+                             'alignment).')
+        _count('sequences_in', alignment.shape.sequence)
+        _count('positions_in', alignment.shape.position)
+
+        with _stage('consensus.frequencies'):
+            counts = _column_counts(alignment)
+        retained = counts[:, 0] / alignment.shape.sequence <= \
+            max_gap_frequency
+        if not retained.any():
+            raise ValueError('No alignment positions remain after filtering '
+                             'with max_gap_frequency=%r. The threshold will '
+                             'need to be relaxed.' % max_gap_frequency)
+        with _stage('consensus.call'):
+            base_counts = counts[retained] @ _BASE_WEIGHTS
+            base_sets = _base_sets(base_counts, method, threshold)
+            chars = _IUPAC[base_sets]
+
+        _count('positions_out', len(chars))
+        return DNAIterator([skbio.DNA(chars.tobytes().decode(),
+                                      metadata={'id': consensus_id,
+                                                'description': ''})])
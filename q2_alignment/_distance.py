@@ -0,0 +1,164 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import multiprocessing
+
+import numpy as np
+import skbio
+
+from ._fasta import _forked_executor
+from ._packed import PackedAlignment, _BASE_BITS, _unpack
+from ._profile import _stage, _profiled
+from ._metrics import _count, _metered
+
+
+_METRICS = ('p-distance', 'jc69')
+
+# The largest temporary array created when comparing a block of rows to
+# another, which bounds memory use independently of the alignment's size.
+_MAX_BLOCK_BYTES = 32 * 2 ** 20
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(words):
+        return np.bitwise_count(words)
+else:  # numpy < 2.0
+    _BYTE_POPCOUNTS = np.array([bin(i).count('1') for i in range(256)],
+                               dtype=np.uint8)
+
+    def _popcount(words):
+        counts = _BYTE_POPCOUNTS[words.view(np.uint8)]
+        return counts.reshape(words.shape + (8,)).sum(axis=-1)
+
+
+def _bit_planes(alignment, block_size=1000):
+    """Encode an alignment as five planes of 64-bit words.
+
+    Planes 0 to 3 have a bit set for each position where a sequence could be
+    A, C, G or T, respectively (so ambiguous characters set several bits, and
+    gaps set none). Plane 4 has a bit set for each non-gap position.
+    """
+    n_positions = alignment.n_positions
+    n_words = (n_positions + 63) // 64
+    planes = np.zeros((5, len(alignment), n_words), dtype=np.uint64)
+    for start in range(0, len(alignment), block_size):
+        block = alignment.data[start:start + block_size]
+        rows = slice(start, start + len(block))
+        bits = np.zeros((len(block), n_words * 64), dtype=np.uint8)
+        bits[:, :n_positions] = _BASE_BITS[_unpack(block, n_positions)]
+        for plane in range(4):
+            planes[plane, rows] = np.packbits(
+                bits >> plane & 1, axis=1, bitorder='little').view(np.uint64)
+        planes[4, rows] = np.bitwise_or.reduce(planes[:4, rows], axis=0)
+    return planes
+
+
+def _compare_blocks(planes, i_start, i_stop, j_start, j_stop):
+    # Count, for each pair of rows, the positions where neither is a gap and
+    # the positions where they also share no possible base.
+    a = planes[:, i_start:i_stop, np.newaxis, :]
+    b = planes[:, np.newaxis, j_start:j_stop, :]
+    compared = _popcount(a[4] & b[4]).sum(axis=-1, dtype=np.int64)
+    shared = (a[0] & b[0]) | (a[1] & b[1]) | (a[2] & b[2]) | (a[3] & b[3])
+    matches = _popcount(shared).sum(axis=-1, dtype=np.int64)
+    return i_start, j_start, compared, compared - matches
+
+
+# The bit planes of the current comparison, which forked workers inherit.
+_worker_planes = None
+
+
+def _compare_blocks_in_worker(i_start, i_stop, j_start, j_stop):
+    return _compare_blocks(_worker_planes, i_start, i_stop, j_start, j_stop)
+
+
+def _block_distances(ids, metric, i_start, j_start, compared, differences):
+    # The distances between a block of rows and another, from their counts.
+    if i_start == j_start:
+        # A sequence is compared with itself even if it is all gaps.
+        np.fill_diagonal(compared, np.maximum(compared.diagonal(), 1))
+    no_overlap = np.argwhere(compared == 0)
+    if len(no_overlap):
+        i, j = no_overlap[0]
+        raise ValueError(
+            'Sequences %r and %r have no aligned positions where neither has '
+            'a gap, so the distance between them is undefined.'
+            % (ids[i_start + i], ids[j_start + j]))
+    distances = differences / compared
+    if metric == 'jc69':
+        saturated = np.argwhere(distances >= 0.75)
+        if len(saturated):
+            i, j = saturated[0]
+            raise ValueError(
+                'The p-distance between sequences %r and %r is %f, so their '
+                'Jukes-Cantor distance is undefined (it must be less than '
+                '0.75).' % (ids[i_start + i], ids[j_start + j],
+                            distances[i, j]))
+        distances = -0.75 * np.log1p(-4 / 3 * distances)
+    return distances
+
+
+def _pairwise_distances(planes, ids, metric, n_jobs=1):
+    # The distances are computed a pair of blocks at a time and stored
+    # straight into the output, so beyond the output, memory use is bounded
+    # by _MAX_BLOCK_BYTES (per process).
+    n_rows, n_words = planes.shape[1], max(planes.shape[2], 1)
+    # Comparing two blocks creates arrays of block_size ** 2 * n_words words.
+    block_size = max(1, int(np.sqrt(_MAX_BLOCK_BYTES / (8 * n_words))))
+    blocks = [(start, min(start + block_size, n_rows))
+              for start in range(0, n_rows, block_size)]
+    # Only the blocks on and above the diagonal are computed.
+    tasks = [(i_start, i_stop, j_start, j_stop)
+             for n, (i_start, i_stop) in enumerate(blocks)
+             for j_start, j_stop in blocks[n:]]
+
+    distances = np.zeros((n_rows, n_rows), dtype=np.float64)
+
+    def store(result):
+        i_start, j_start, compared, differences = result
+        block = _block_distances(ids, metric, i_start, j_start, compared,
+                                 differences)
+        i_stop = i_start + block.shape[0]
+        j_stop = j_start + block.shape[1]
+        distances[i_start:i_stop, j_start:j_stop] = block
+        distances[j_start:j_stop, i_start:i_stop] = block.T
+
+    if n_jobs == 1 or len(tasks) == 1 or \
+            'fork' not in multiprocessing.get_all_start_methods():
+        for task in tasks:
+            store(_compare_blocks(planes, *task))
+    else:
+        global _worker_planes
+        _worker_planes = planes
+        try:
+            with _forked_executor(n_jobs) as executor:
+                for result in executor.map(_compare_blocks_in_worker,
+                                           *zip(*tasks)):
+                    store(result)
+        finally:
+            _worker_planes = None
+    np.fill_diagonal(distances, 0.0)
+    return distances
+
+
+def distance_matrix(alignment: PackedAlignment, metric: str = 'p-distance',
+                    n_jobs: int = 1) -> skbio.DistanceMatrix:
+    with _profiled('distance_matrix'), _metered('distance_matrix'):
+        if metric not in _METRICS:
+            raise ValueError('Unknown metric: %r. Supported metrics are %s.'
+                             % (metric, ', '.join(_METRICS)))
+        if n_jobs < 1:
+            raise ValueError('n_jobs must be at least 1: %d' % n_jobs)
+        _count('sequences_in', alignment.shape.sequence)
+        _count('positions_in', alignment.shape.position)
+
+        with _stage('distance_matrix.encode'):
+            planes = _bit_planes(alignment)
+        with _stage('distance_matrix.distances'):
+            distances = _pairwise_distances(planes, alignment.ids, metric,
+                                            n_jobs)
+        return skbio.DistanceMatrix(distances, ids=alignment.ids)
@@ -0,0 +1,222 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import collections
+import mmap
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from ._packed import _encode, _pack
+
+
+# Files are split into chunks of about this many bytes, each parsed as one
+# (worker) task, so files smaller than this are parsed in a single process.
+_CHUNK_BYTES = 16 * 2 ** 20
+# The number of records encoded at a time within a chunk.
+_BLOCK_RECORDS = 10000
+_WHITESPACE = b' \t\r\n\v\f'
+
+
+def _chunk_bounds(buf, n_chunks):
+    # Split the file into byte ranges which each start at a record, skipping
+    # any blank lines at the start of the file.
+    head = bytes(buf[:1024])
+    bounds = [len(head) - len(head.lstrip())]
+    for n in range(1, n_chunks):
+        boundary = buf.find(b'\n>', max(len(buf) * n // n_chunks,
+                                        bounds[-1]))
+        if boundary == -1:
+            break
+        if boundary + 1 > bounds[-1]:
+            bounds.append(boundary + 1)
+    bounds.append(len(buf))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _read_range(fp, start, stop):
+    with open(fp, 'rb') as fh:
+        fh.seek(start)
+        return fh.read(stop - start)
+
+
+def _count_records(fp, start, stop):
+    chunk = _read_range(fp, start, stop)
+    return chunk.count(b'\n>') + chunk.startswith(b'>')
+
+
+def _parse_records(fp, chunk, n_positions):
+    # Yield the IDs and concatenated sequences of blocks of records.
+    if not chunk.startswith(b'>'):
+        raise ValueError('%r is not a FASTA file: it does not start with a '
+                         'header line (beginning with ">").' % fp)
+    records = chunk.split(b'\n>')
+    records[0] = records[0][1:]
+    for block_start in range(0, len(records), _BLOCK_RECORDS):
+        ids = []
+        seqs = []
+        for record in records[block_start:block_start + _BLOCK_RECORDS]:
+            header, _, seq = record.partition(b'\n')
+            # As in skbio, the ID is the header up to the first whitespace.
+            id_ = header.split(None, 1)[0].decode() if header.strip() else ''
+            seq = seq.translate(None, _WHITESPACE)
+            if len(seq) != n_positions:
+                raise ValueError('The sequences in %r are not aligned: %r '
+                                 'has length %d, but the first sequence has '
+                                 'length %d.' % (fp, id_, len(seq),
+                                                 n_positions))
+            ids.append(id_)
+            seqs.append(seq)
+        yield ids, np.frombuffer(b''.join(seqs), dtype=np.uint8).reshape(
+            len(seqs), n_positions)
+
+
+def _parse_range(fp, start, stop, out, first_row, n_positions, packed):
+    # Encode the records in a byte range into `out`, starting at `first_row`.
+    chunk = _read_range(fp, start, stop)
+    all_ids = []
+    row = first_row
+    for ids, chars in _parse_records(fp, chunk, n_positions):
+        codes = _encode(chars)
+        out[row:row + len(ids)] = _pack(codes) if packed else codes
+        row += len(ids)
+        all_ids.extend(ids)
+    return all_ids
+
+
+# The output matrix of the current read, which forked workers inherit.
+_worker_out = None
+
+
+def _parse_range_in_worker(fp, start, stop, first_row, n_positions, packed):
+    return _parse_range(fp, start, stop, _worker_out, first_row, n_positions,
+                        packed)
+
+
+def _forked_executor(n_jobs):
+    # A process pool whose workers are forked (when its first task is
+    # submitted), and so inherit the module's globals. mp_context is only
+    # accepted from Python 3.7, before which fork was the default.
+    if sys.version_info < (3, 7):
+        return ProcessPoolExecutor(max_workers=n_jobs)
+    return ProcessPoolExecutor(max_workers=n_jobs,
+                               mp_context=multiprocessing.get_context('fork'))
+
+
+def _shared_matrix(shape):
+    # An array backed by anonymous shared memory, which forked workers write
+    # into directly and which is freed once the array is garbage collected.
+    n_bytes = shape[0] * shape[1]
+    buf = mmap.mmap(-1, max(n_bytes, 1))
+    return np.frombuffer(buf, dtype=np.uint8, count=n_bytes).reshape(shape)
+
+
+def _read_fasta(fp, n_jobs=1, packed=False):
+    """Read an aligned FASTA file into a matrix of ``ALPHABET`` codes.
+
+    The file is split into byte ranges on record boundaries, which are
+    parsed by up to ``n_jobs`` worker processes into a preallocated matrix
+    with one row per sequence. If ``packed``, rows are packed two codes per
+    byte, as in ``PackedAlignment``. Returns ``(ids, matrix, n_positions)``.
+    """
+    size = os.path.getsize(fp)
+    if size == 0:
+        return [], np.empty((0, 0), dtype=np.uint8), 0
+    # The number of chunks depends only on the file's size, so that the
+    # memory used to parse each one is bounded, and n_jobs only limits how
+    # many are parsed at once.
+    n_chunks = max(1, -(-size // _CHUNK_BYTES))
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        # The workers inherit the output matrix, so they must be forked.
+        n_jobs = 1
+
+    with open(fp, 'rb') as fh, \
+            mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        bounds = _chunk_bounds(buf, n_chunks)
+        first_record = buf[bounds[0][0]:
+                           buf.find(b'\n>', bounds[0][0]) + 1 or len(buf)]
+    if not bounds[0][0] < bounds[0][1]:
+        return [], np.empty((0, 0), dtype=np.uint8), 0
+    # Every sequence must be as long as the first.
+    n_positions = len(first_record.partition(b'\n')[2].translate(
+        None, _WHITESPACE))
+    n_columns = (n_positions + 1) // 2 if packed else n_positions
+
+    fps = [fp] * len(bounds)
+    starts, stops = zip(*bounds)
+    if n_jobs == 1 or len(bounds) == 1:
+        n_records = list(map(_count_records, fps, starts, stops))
+        out = np.empty((sum(n_records), n_columns), dtype=np.uint8)
+        first_rows = np.concatenate([[0], np.cumsum(n_records)[:-1]])
+        ids = []
+        for start, stop, first_row in zip(starts, stops, first_rows):
+            ids.extend(_parse_range(fp, start, stop, out, first_row,
+                                    n_positions, packed))
+        return ids, out, n_positions
+
+    global _worker_out
+    with _forked_executor(n_jobs) as executor:
+        n_records = list(executor.map(_count_records, fps, starts, stops))
+    first_rows = np.concatenate([[0], np.cumsum(n_records)[:-1]])
+    _worker_out = out = _shared_matrix((sum(n_records), n_columns))
+    try:
+        with _forked_executor(n_jobs) as executor:
+            ids = []
+            for chunk_ids in executor.map(
+                    _parse_range_in_worker, fps, starts, stops, first_rows,
+                    [n_positions] * len(bounds), [packed] * len(bounds)):
+                ids.extend(chunk_ids)
+    finally:
+        _worker_out = None
+    return ids, out, n_positions
+
+
+def _format_records(ids, chars):
+    # Format a block of records as unwrapped FASTA in a single buffer. The
+    # sequence lines are laid out in one array (with a column of newlines),
+    # and are joined with the headers without copying each line separately.
+    lines = np.empty((chars.shape[0], chars.shape[1] + 1), dtype=np.uint8)
+    lines[:, :-1] = chars
+    lines[:, -1] = ord('\n')
+    width = lines.shape[1]
+    lines = memoryview(lines.reshape(-1))
+    return b''.join(piece for n, id_ in enumerate(ids)
+                    for piece in (b'>%s\n' % id_.encode(),
+                                  lines[n * width:(n + 1) * width]))
+
+
+def _write_fasta(fp, ids, rows, n_jobs=1, block_size=10000):
+    """Write an alignment as unwrapped FASTA.
+
+    ``rows(start, stop)`` returns the ASCII characters of a block of rows.
+    Blocks are decoded and formatted into buffers by up to ``n_jobs``
+    threads, and written in order, one buffer per block.
+    """
+    def format_block(start):
+        return _format_records(ids[start:start + block_size],
+                               rows(start, min(start + block_size, len(ids))))
+
+    starts = range(0, len(ids), block_size)
+    with open(fp, 'wb') as fh:
+        if n_jobs == 1:
+            for start in starts:
+                fh.write(format_block(start))
+            return
+        # Keep a bounded number of formatted blocks in flight, so that memory
+        # use doesn't grow with the size of the alignment.
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            for start in starts:
+                pending.append(executor.submit(format_block, start))
+                if len(pending) > 2 * n_jobs:
+                    fh.write(pending.popleft().result())
+            while pending:
+                fh.write(pending.popleft().result())
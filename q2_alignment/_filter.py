@@ -6,62 +6,273 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-import skbio
+import os
+
 import numpy as np
+import pandas as pd
+from q2_types.feature_data import AlignedDNAFASTAFormat
+
+from ._fasta import _write_fasta
+from ._packed import (ALPHABET, PackedAlignment, _DECODE, _block_rows,
+                      _encode, _unpack)
+from ._sparse import SparseAlignment
+from ._mapped import MappedAlignment
+from ._profile import _stage, _profiled
+from ._metrics import _count, _metered
+from ._cache import _cached_column_counts, _column_cache_enabled
+
+# Alignment representations which count and mask their own columns, rather
+# than going through skbio.TabularMSA.
+_COLUMNAR = (PackedAlignment, SparseAlignment, MappedAlignment)
 
 
-def _most_conserved(frequencies, sequence_dtype, gap_mode='ignore'):
+# The indices of the gap and the unambiguous bases in ALPHABET, i.e., the
+# columns of a count matrix.
+_GAP = ALPHABET.index(b'-')
+_BASES = [ALPHABET.index(base) for base in b'ACGT']
+
+
+def _most_conserved(counts, gap_mode='ignore'):
+    # The relative frequency of the most common non-gap character at each
+    # position of a positions x ALPHABET count matrix.
     if gap_mode != 'ignore':
         raise ValueError('Unknown gap_mode: %s. ignore is currently the only '
                          'supported gap_mode.' % gap_mode)
-    result = []
-    for frequency_vector in frequencies:
-        for gap in sequence_dtype.gap_chars:
-            if gap in frequency_vector:
-                del frequency_vector[gap]
-        frequency_values = list(frequency_vector.values())
-        if len(frequency_values) == 0:
-            result.append(0.0)
-        else:
-            result.append(np.max(frequency_values) / np.sum(frequency_values))
-    return result
+    non_gap = np.delete(counts, _GAP, axis=1)
+    totals = non_gap.sum(axis=1)
+    conservation = np.zeros(len(counts))
+    np.divide(non_gap.max(axis=1, initial=0), totals, out=conservation,
+              where=totals > 0)
+    return conservation
+
+
+def _compute_conservation_mask(counts, min_conservation):
+    return _most_conserved(counts) >= min_conservation
+
+
+def _gap_frequencies(counts):
+    return counts[:, _GAP] / counts.sum(axis=1)
+
 
+def _compute_gap_mask(counts, max_gap_frequency):
+    return _gap_frequencies(counts) <= max_gap_frequency
 
-def _compute_conservation_mask(frequencies, sequence_dtype, min_conservation):
-    mask = [c >= min_conservation
-            for c in _most_conserved(frequencies, sequence_dtype)]
-    return np.array(mask)
 
+def _compute_site_mask(counts, min_minor_allele_count, parsimony_informative):
+    # The positions which vary enough to be informative. Only the
+    # unambiguous bases are counted as states; gaps and degenerate characters
+    # are treated as missing data.
+    states = counts[:, _BASES]
+    site_mask = np.ones(len(counts), dtype=bool)
+    if min_minor_allele_count > 0:
+        minor_allele_counts = states.sum(axis=1) - states.max(axis=1)
+        site_mask &= minor_allele_counts >= min_minor_allele_count
+    if parsimony_informative:
+        # at least two states, each present in at least two sequences
+        site_mask &= (states >= 2).sum(axis=1) >= 2
+    return site_mask
 
-def _compute_gap_mask(frequencies, sequence_dtype, max_gap_frequency):
-    gap_frequencies = []
-    num_sequences = np.sum(list(frequencies[0].values()))
-    for f in frequencies:
-        gap_frequency = np.sum([f.get(gc, 0.0)
-                                for gc in sequence_dtype.gap_chars])
-        gap_frequencies.append(gap_frequency/num_sequences)
-    mask = [f <= max_gap_frequency for f in gap_frequencies]
-    return np.array(mask)
+
+def _windows(num_positions, window_size, window_step):
+    # The [start, stop) bounds of windows of window_size positions, every
+    # window_step positions. The last window is aligned with the end of the
+    # alignment, so that every position is in at least one window.
+    last_start = max(num_positions - window_size, 0)
+    starts = np.arange(0, last_start + 1, window_step)
+    if starts[-1] != last_start:
+        starts = np.append(starts, last_start)
+    return starts, np.minimum(starts + window_size, num_positions)
+
+
+def _window_means(scores, starts, stops):
+    # The mean score in each window, from prefix sums of the scores, so the
+    # cost doesn't depend on the window size.
+    prefix_sums = np.concatenate([[0.0], np.cumsum(scores)])
+    return (prefix_sums[stops] - prefix_sums[starts]) / (stops - starts)
+
+
+def _windows_to_mask(starts, stops, selected, num_positions):
+    # The positions in at least one selected window.
+    coverage = np.zeros(num_positions + 1, dtype=np.int64)
+    np.add.at(coverage, starts[selected], 1)
+    np.add.at(coverage, stops[selected], -1)
+    return np.cumsum(coverage[:-1]) > 0
 
 
 def _apply_mask(alignment, mask):
+    if isinstance(alignment, _COLUMNAR):
+        return alignment.masked(mask)
     return alignment[:, mask]
 
 
-def _compute_frequencies(alignment):
-    # this try/accept allows us to support the ignore_metadata optimization
-    # available in scikit-bio 0.5.0 and later, but be backward compatible
-    # with scikit-bio 0.4.2, which some plugins depend on.
-    try:
-        return [c.frequencies()
-                for c in alignment.iter_positions(ignore_metadata=True)]
-    except TypeError:
-        return [c.frequencies()
-                for c in alignment.iter_positions()]
+def _profile_from_counts(counts):
+    # The column profile is the count matrix as a DataFrame, with one row per
+    # position and one column per ALPHABET character.
+    profile = pd.DataFrame(counts, columns=list(ALPHABET.decode()))
+    profile.index.name = 'position'
+    return profile
+
+
+def _counts_from_profile(profile, alignment):
+    counts = profile[list(ALPHABET.decode())].to_numpy(dtype=np.int64)
+    if counts.shape[0] != alignment.shape.position or \
+            (counts.sum(axis=1) != alignment.shape.sequence).any():
+        raise ValueError('The column profile does not match the alignment: '
+                         'the profile describes %d positions, and the '
+                         'alignment has %d sequences and %d positions.'
+                         % (counts.shape[0], alignment.shape.sequence,
+                            alignment.shape.position))
+    return counts
+
+
+def _column_counts(alignment):
+    # The positions x ALPHABET count matrix of any alignment representation.
+    if isinstance(alignment, _COLUMNAR):
+        return alignment.column_counts()
+    # A TabularMSA's characters are encoded and counted a block of rows at a
+    # time, with one bincount per block over every (position, code) pair.
+    n_positions = alignment.shape.position
+    block_size = _block_rows(n_positions)
+    offsets = len(ALPHABET) * np.arange(n_positions, dtype=np.int64)
+    counts = np.zeros(len(ALPHABET) * n_positions, dtype=np.int64)
+    sequences = list(alignment)
+    for start in range(0, len(sequences), block_size):
+        codes = _encode(np.vstack([
+            seq.values.view(np.uint8)
+            for seq in sequences[start:start + block_size]]))
+        counts += np.bincount((codes + offsets).ravel(),
+                              minlength=len(counts))
+    return counts.reshape(n_positions, len(ALPHABET))
+
 
+def _compute_coverage_window(counts, min_terminal_coverage):
+    # The positions from the first to the last position where the relative
+    # frequency of non-gap characters is at least min_terminal_coverage.
+    num_sequences = counts.sum(axis=1)
+    covered = ((num_sequences - counts[:, _GAP]) / num_sequences >=
+               min_terminal_coverage)
+    window = np.zeros(len(counts), dtype=bool)
+    if covered.any():
+        positions = np.flatnonzero(covered)
+        window[positions[0]:positions[-1] + 1] = True
+    return window
 
-def mask(alignment: skbio.TabularMSA, max_gap_frequency: float = 1.0,
-         min_conservation: float = 0.40) -> skbio.TabularMSA:
+
+def _residue_bounds(alignment, block_size=10000):
+    # The first position and one past the last position holding a non-gap
+    # character in each row, skipping rows which are entirely gaps.
+    if isinstance(alignment, SparseAlignment):
+        has_runs = np.diff(alignment.run_offsets) > 0
+        firsts = alignment.starts[alignment.run_offsets[:-1][has_runs]]
+        lasts = alignment.ends[alignment.run_offsets[1:][has_runs] - 1]
+        return firsts, lasts
+    if isinstance(alignment, MappedAlignment):
+        blocks = (codes for _, codes in alignment.iter_codes(block_size))
+    else:
+        if not isinstance(alignment, PackedAlignment):
+            alignment = PackedAlignment.from_tabular_msa(alignment)
+        blocks = (_unpack(alignment.data[start:start + block_size],
+                          alignment.n_positions)
+                  for start in range(0, len(alignment), block_size))
+    firsts, lasts = [], []
+    for codes in blocks:
+        residues = codes != 0
+        has_residues = residues.any(axis=1)
+        residues = residues[has_residues]
+        firsts.append(residues.argmax(axis=1))
+        lasts.append(alignment.n_positions -
+                     residues[:, ::-1].argmax(axis=1))
+    return np.concatenate(firsts), np.concatenate(lasts)
+
+
+def _compute_terminal_gap_window(alignment):
+    # The positions covered by every sequence, i.e., excluding each
+    # sequence's leading and trailing gaps.
+    firsts, lasts = _residue_bounds(alignment)
+    window = np.zeros(alignment.shape.position, dtype=bool)
+    if len(firsts):
+        window[firsts.max():lasts.min()] = True
+    return window
+
+
+def mask(alignment: PackedAlignment, max_gap_frequency: float = 1.0,
+         min_conservation: float = 0.40,
+         column_profile: pd.DataFrame = None,
+         min_terminal_coverage: float = 0.0,
+         trim_terminal_gaps: bool = False,
+         window_size: int = 1,
+         window_step: int = 1,
+         min_minor_allele_count: int = 0,
+         parsimony_informative: bool = False) -> PackedAlignment:
+    with _profiled('mask'), _metered('mask'):
+        _count('sequences_in', alignment.shape.sequence)
+        _count('positions_in', alignment.shape.position)
+        counts = None
+        if column_profile is not None:
+            counts = _counts_from_profile(column_profile, alignment)
+        result = _mask(alignment, max_gap_frequency, min_conservation,
+                       counts, min_terminal_coverage, trim_terminal_gaps,
+                       window_size, window_step, min_minor_allele_count,
+                       parsimony_informative)
+        _count('sequences_out', result.shape.sequence)
+        _count('positions_out', result.shape.position)
+        return result
+
+
+def compute_mask(alignment: PackedAlignment, max_gap_frequency: float = 1.0,
+                 min_conservation: float = 0.40,
+                 column_profile: pd.DataFrame = None,
+                 min_terminal_coverage: float = 0.0,
+                 trim_terminal_gaps: bool = False,
+                 window_size: int = 1,
+                 window_step: int = 1,
+                 min_minor_allele_count: int = 0,
+                 parsimony_informative: bool = False) -> np.ndarray:
+    with _profiled('compute_mask'), _metered('compute_mask'):
+        _count('sequences_in', alignment.shape.sequence)
+        _count('positions_in', alignment.shape.position)
+        counts = None
+        if column_profile is not None:
+            counts = _counts_from_profile(column_profile, alignment)
+        result = _compute_mask(alignment, max_gap_frequency,
+                               min_conservation, counts,
+                               min_terminal_coverage, trim_terminal_gaps,
+                               window_size, window_step,
+                               min_minor_allele_count, parsimony_informative)
+        _count('positions_out', int(result.sum()))
+        return result
+
+
+def apply_mask(alignment: AlignedDNAFASTAFormat,
+               mask: np.ndarray) -> AlignedDNAFASTAFormat:
+    with _profiled('apply_mask'), _metered('apply_mask'):
+        with _stage('apply_mask.read'):
+            alignment = MappedAlignment.read(str(alignment))
+        mask = np.asarray(mask, dtype=bool)
+        if len(mask) != alignment.n_positions:
+            raise ValueError('The mask describes %d positions, but the '
+                             'alignment has %d positions.'
+                             % (len(mask), alignment.n_positions))
+        _count('sequences_in', alignment.shape.sequence)
+        _count('positions_in', alignment.shape.position)
+
+        def rows(start, stop):
+            return _DECODE[_encode(alignment.chars[start:stop][:, mask])]
+
+        # Each block of rows is selected from the mapped file, validated
+        # and written in a single pass.
+        result = AlignedDNAFASTAFormat()
+        with _stage('apply_mask.write'):
+            _write_fasta(str(result), alignment.ids, rows)
+        _count('sequences_out', alignment.shape.sequence)
+        _count('positions_out', int(mask.sum()))
+        _count('bytes_written', os.path.getsize(str(result)))
+        return result
+
+
+def _check_mask_parameters(max_gap_frequency, min_conservation,
+                           min_terminal_coverage=0.0, window_size=1,
+                           window_step=1, min_minor_allele_count=0):
     # check that parameters are in range
     if max_gap_frequency < 0.0 or max_gap_frequency > 1.0:
         raise ValueError('max_gap_frequency out of range [0.0, 1.0]: %f' %
@@ -69,23 +280,107 @@ def mask(alignment: skbio.TabularMSA, max_gap_frequency: float = 1.0,
     if min_conservation < 0.0 or min_conservation > 1.0:
         raise ValueError('min_conservation out of range [0.0, 1.0]: %f' %
                          min_conservation)
+    if min_terminal_coverage < 0.0 or min_terminal_coverage > 1.0:
+        raise ValueError('min_terminal_coverage out of range [0.0, 1.0]: %f'
+                         % min_terminal_coverage)
+    if window_size < 1:
+        raise ValueError('window_size must be at least 1: %d' % window_size)
+    if window_step < 1:
+        raise ValueError('window_step must be at least 1: %d' % window_step)
+    if window_step > window_size:
+        # the columns between windows would never be retained
+        raise ValueError('window_step must not be greater than window_size: '
+                         '%d > %d' % (window_step, window_size))
+    if min_minor_allele_count < 0:
+        raise ValueError('min_minor_allele_count must be at least 0: %d'
+                         % min_minor_allele_count)
+
+
+def _mask(alignment, max_gap_frequency, min_conservation, counts=None,
+          min_terminal_coverage=0.0, trim_terminal_gaps=False, window_size=1,
+          window_step=1, min_minor_allele_count=0,
+          parsimony_informative=False):
+    combined_mask = _compute_mask(
+        alignment, max_gap_frequency, min_conservation, counts,
+        min_terminal_coverage, trim_terminal_gaps, window_size, window_step,
+        min_minor_allele_count, parsimony_informative)
+    # apply the mask and return the resulting alignment
+    with _stage('mask.apply_mask'):
+        return _apply_mask(alignment, combined_mask)
+
+
+def _compute_mask(alignment, max_gap_frequency, min_conservation,
+                  counts=None, min_terminal_coverage=0.0,
+                  trim_terminal_gaps=False, window_size=1, window_step=1,
+                  min_minor_allele_count=0, parsimony_informative=False):
+    _check_mask_parameters(max_gap_frequency, min_conservation,
+                           min_terminal_coverage, window_size, window_step,
+                           min_minor_allele_count)
     # check that input alignment is not empty
     if alignment.shape.position == 0:
         raise ValueError('Input alignment is empty (i.e., there are zero '
                          'sequences or positions in the input alignment).')
-    # compute frequencies of all alphabet characters
-    frequencies = _compute_frequencies(alignment)
+    # count the alphabet characters at each position
+    with _stage('mask.frequencies'):
+        if counts is None:
+            if _column_cache_enabled():
+                counts = _cached_column_counts(alignment, _column_counts)
+            else:
+                counts = _column_counts(alignment)
     # compute gap and conservation masks, and then combine them
-    sequence_dtype = alignment.dtype
-    gap_mask = _compute_gap_mask(frequencies, sequence_dtype,
-                                 max_gap_frequency)
-    conservation_mask = _compute_conservation_mask(frequencies, sequence_dtype,
-                                                   min_conservation)
-    combined_mask = gap_mask & conservation_mask
-    # apply the mask and return the resulting alignment
-    result = _apply_mask(alignment, combined_mask)
+    windowed = window_size > 1
+    with _stage('mask.gap_mask'):
+        if windowed:
+            gap_frequencies = _gap_frequencies(counts)
+        else:
+            gap_mask = _compute_gap_mask(counts, max_gap_frequency)
+    # compute the window left after trimming the alignment's ragged ends, so
+    # that trimming happens in the same slicing pass as masking
+    trim_mask = None
+    if min_terminal_coverage > 0.0 or trim_terminal_gaps:
+        with _stage('mask.trim_mask'):
+            trim_mask = _compute_coverage_window(counts,
+                                                 min_terminal_coverage)
+            if trim_terminal_gaps:
+                trim_mask &= _compute_terminal_gap_window(alignment)
+    # compute the variable/informative site mask from the same counts
+    site_mask = None
+    if min_minor_allele_count > 0 or parsimony_informative:
+        with _stage('mask.site_mask'):
+            site_mask = _compute_site_mask(
+                counts, min_minor_allele_count, parsimony_informative)
+    with _stage('mask.conservation_mask'):
+        if windowed:
+            conservation = _most_conserved(counts)
+        else:
+            conservation_mask = _compute_conservation_mask(
+                counts, min_conservation)
+    if windowed:
+        # keep the positions in windows whose mean gap frequency and mean
+        # conservation pass the thresholds
+        with _stage('mask.window_mask'):
+            num_positions = alignment.shape.position
+            starts, stops = _windows(num_positions, window_size,
+                                     window_step)
+            passed_gap = _window_means(
+                gap_frequencies, starts, stops) <= max_gap_frequency
+            passed_conservation = _window_means(
+                conservation, starts, stops) >= min_conservation
+            gap_mask = _windows_to_mask(starts, stops, passed_gap,
+                                        num_positions)
+            conservation_mask = _windows_to_mask(
+                starts, stops, passed_conservation, num_positions)
+            combined_mask = _windows_to_mask(
+                starts, stops, passed_gap & passed_conservation,
+                num_positions)
+    else:
+        combined_mask = gap_mask & conservation_mask
+    if trim_mask is not None:
+        combined_mask &= trim_mask
+    if site_mask is not None:
+        combined_mask &= site_mask
 
-    if result.shape.position == 0:
+    if not combined_mask.any():
         num_input_positions = alignment.shape.position
         frac_passed_gap = (gap_mask.sum() / num_input_positions)
         str_passed_gap = '{percent:.2%}'.format(percent=frac_passed_gap)
@@ -93,10 +388,19 @@ def mask(alignment: skbio.TabularMSA, max_gap_frequency: float = 1.0,
             (conservation_mask.sum() / num_input_positions)
         str_passed_conservation = \
             '{percent:.2%}'.format(percent=frac_passed_conservation)
-        raise ValueError("No alignment positions remain after filtering. The "
-                         "filter thresholds will need to be relaxed. %s "
-                         "of positions were retained by the gap filter, and "
-                         "%s of positions were retained by the "
-                         "conservation filter." %
-                         (str_passed_gap, str_passed_conservation))
-    return result
+        message = ("No alignment positions remain after filtering. The "
+                   "filter thresholds will need to be relaxed. %s "
+                   "of positions were retained by the gap filter, and "
+                   "%s of positions were retained by the "
+                   "conservation filter." %
+                   (str_passed_gap, str_passed_conservation))
+        if trim_mask is not None:
+            message += (' {percent:.2%} of positions were retained by '
+                        'terminal trimming.'.format(
+                            percent=trim_mask.sum() / num_input_positions))
+        if site_mask is not None:
+            message += (' {percent:.2%} of positions were retained by the '
+                        'site filter.'.format(
+                            percent=site_mask.sum() / num_input_positions))
+        raise ValueError(message)
+    return combined_mask
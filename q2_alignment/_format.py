@@ -0,0 +1,149 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import struct
+
+import qiime2.plugin.model as model
+from qiime2.plugin import ValidationError
+
+from ._packed import ALPHABET
+
+
+class ColumnProfileFormat(model.TextFileFormat):
+    """Per-position character counts of a DNA alignment.
+
+    A tab-separated file with a header line, then one line per alignment
+    position: the (0-based) position, followed by the number of sequences
+    with each character of ``ALPHABET`` at that position.
+    """
+
+    HEADER = ['position'] + list(ALPHABET.decode())
+
+    def _validate_(self, level):
+        n_lines = {'min': 5, 'max': None}[level]
+        with self.open() as fh:
+            header = fh.readline().rstrip('\n').split('\t')
+            if header != self.HEADER:
+                raise ValidationError(
+                    'The header must be %r, but found %r.'
+                    % ('\t'.join(self.HEADER), '\t'.join(header)))
+            n_sequences = None
+            for i, line in enumerate(fh):
+                if n_lines is not None and i >= n_lines:
+                    break
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != len(self.HEADER):
+                    raise ValidationError(
+                        'Line %d has %d fields, but %d are expected.'
+                        % (i + 2, len(fields), len(self.HEADER)))
+                try:
+                    values = [int(f) for f in fields]
+                except ValueError:
+                    raise ValidationError(
+                        'Line %d contains a value which is not an integer.'
+                        % (i + 2))
+                if values[0] != i:
+                    raise ValidationError(
+                        'Line %d should describe position %d, but describes '
+                        'position %d.' % (i + 2, i, values[0]))
+                if any(v < 0 for v in values[1:]):
+                    raise ValidationError(
+                        'Line %d contains a negative count.' % (i + 2))
+                if n_sequences is None:
+                    n_sequences = sum(values[1:])
+                elif sum(values[1:]) != n_sequences:
+                    raise ValidationError(
+                        'The counts on line %d sum to %d, but the counts on '
+                        'line 2 sum to %d. Every position must have the same '
+                        'number of sequences.'
+                        % (i + 2, sum(values[1:]), n_sequences))
+
+
+ColumnProfileDirectoryFormat = model.SingleFileDirectoryFormat(
+    'ColumnProfileDirectoryFormat', 'column-profile.tsv', ColumnProfileFormat)
+
+
+class PositionalMaskFormat(model.BinaryFileFormat):
+    """A bit-packed positional mask of a DNA alignment.
+
+    The 8-byte ``MAGIC`` string, then the number of positions as a
+    little-endian unsigned 64-bit integer, then one bit per position
+    (packed with ``numpy.packbits`` in little-endian bit order), which is set
+    if the position is retained.
+    """
+
+    MAGIC = b'Q2AMASK\x01'
+    HEADER = struct.Struct('<8sQ')
+
+    def _validate_(self, level):
+        with self.open() as fh:
+            header = fh.read(self.HEADER.size)
+            if len(header) != self.HEADER.size or \
+                    not header.startswith(self.MAGIC):
+                raise ValidationError('The file does not start with the '
+                                      'positional mask header.')
+            _, n_positions = self.HEADER.unpack(header)
+            bits = fh.read()
+        if len(bits) != (n_positions + 7) // 8:
+            raise ValidationError(
+                'The mask describes %d positions, so it should have %d bytes '
+                'of bits, but it has %d.'
+                % (n_positions, (n_positions + 7) // 8, len(bits)))
+        if n_positions % 8 and bits[-1] >> (n_positions % 8):
+            raise ValidationError('Bits are set beyond the last position.')
+
+
+PositionalMaskDirectoryFormat = model.SingleFileDirectoryFormat(
+    'PositionalMaskDirectoryFormat', 'positional-mask.bin',
+    PositionalMaskFormat)
+
+
+class SequenceOrientationFormat(model.TextFileFormat):
+    """The orientation of each sequence, as corrected before alignment.
+
+    A tab-separated file with a header line, then one line per sequence: its
+    ID, whether it was reverse complemented (``True`` or ``False``), and the
+    cosine similarities of its k-mer profile, forward and reverse
+    complemented, to the profile it was oriented against.
+    """
+
+    HEADER = ['id', 'reverse_complemented', 'forward_similarity',
+              'reverse_similarity']
+
+    def _validate_(self, level):
+        n_lines = {'min': 5, 'max': None}[level]
+        with self.open() as fh:
+            header = fh.readline().rstrip('\n').split('\t')
+            if header != self.HEADER:
+                raise ValidationError(
+                    'The header must be %r, but found %r.'
+                    % ('\t'.join(self.HEADER), '\t'.join(header)))
+            for i, line in enumerate(fh):
+                if n_lines is not None and i >= n_lines:
+                    break
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != len(self.HEADER):
+                    raise ValidationError(
+                        'Line %d has %d fields, but %d are expected.'
+                        % (i + 2, len(fields), len(self.HEADER)))
+                if fields[1] not in ('True', 'False'):
+                    raise ValidationError(
+                        'Line %d should say whether the sequence was reverse '
+                        'complemented (True or False), but says %r.'
+                        % (i + 2, fields[1]))
+                try:
+                    [float(f) for f in fields[2:]]
+                except ValueError:
+                    raise ValidationError(
+                        'Line %d contains a similarity which is not a '
+                        'number.' % (i + 2))
+
+
+SequenceOrientationDirectoryFormat = model.SingleFileDirectoryFormat(
+    'SequenceOrientationDirectoryFormat', 'sequence-orientation.tsv',
+    SequenceOrientationFormat)
@@ -0,0 +1,162 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+
+
+# Only the four unambiguous nucleotides contribute k-mers. Any k-mer which
+# overlaps a degenerate character or a gap is skipped.
+_NUCLEOTIDE_CODES = np.full(256, 4, dtype=np.uint8)
+for _code, _nt in enumerate(b'ACGT'):
+    _NUCLEOTIDE_CODES[_nt] = _code
+    _NUCLEOTIDE_CODES[ord(chr(_nt).lower())] = _code
+del _code, _nt
+
+
+def _kmer_profiles(sequences, k=4, batch_size=10000):
+    """Compute L2-normalized k-mer count profiles.
+
+    ``sequences`` is a list of ``bytes``. Profiles are computed in batches of
+    ``batch_size`` sequences so that the intermediate k-mer index arrays stay
+    small, and the result is a ``(len(sequences), 4 ** k)`` float32 array.
+    """
+    n_kmers = 4 ** k
+    profiles = np.zeros((len(sequences), n_kmers), dtype=np.float32)
+    for start in range(0, len(sequences), batch_size):
+        batch = sequences[start:start + batch_size]
+        lengths = np.array([len(s) for s in batch])
+        codes = _NUCLEOTIDE_CODES[np.frombuffer(b''.join(batch),
+                                                dtype=np.uint8)]
+        owners = np.repeat(np.arange(len(batch)), lengths)
+        if len(codes) < k:
+            continue
+        # The k-mer starting at each position, built up one offset at a
+        # time. A window is a valid k-mer if it contains no invalid
+        # characters and does not span the boundary between two sequences.
+        n_windows = len(codes) - k + 1
+        kmers = np.zeros(n_windows, dtype=np.int64)
+        valid = owners[:n_windows] == owners[k - 1:]
+        for offset in range(k):
+            window_codes = codes[offset:offset + n_windows]
+            valid &= window_codes < 4
+            kmers = kmers * 4 + window_codes
+        counts = np.bincount(owners[:n_windows][valid] * n_kmers +
+                             kmers[valid],
+                             minlength=len(batch) * n_kmers)
+        profiles[start:start + len(batch)] = counts.reshape(len(batch),
+                                                            n_kmers)
+    norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+    np.divide(profiles, norms, out=profiles, where=norms > 0)
+    return profiles
+
+
+def _kmeans(profiles, n_clusters, n_iterations=5, seed=0):
+    """Assign each profile to one of ``n_clusters`` clusters.
+
+    This is a plain spherical k-means: centroids are seeded with a random
+    (but reproducible) sample of the profiles and profiles are assigned to the
+    centroid with the highest cosine similarity.
+    """
+    rng = np.random.RandomState(seed)
+    seeds = rng.choice(len(profiles), size=n_clusters, replace=False)
+    centroids = profiles[seeds]
+    assignments = None
+    for _ in range(n_iterations):
+        new_assignments = np.argmax(profiles @ centroids.T, axis=1)
+        if assignments is not None and \
+                np.array_equal(assignments, new_assignments):
+            break
+        assignments = new_assignments
+        for i in range(n_clusters):
+            members = profiles[assignments == i]
+            if len(members) > 0:
+                centroid = members.sum(axis=0)
+                norm = np.linalg.norm(centroid)
+                if norm > 0:
+                    centroid /= norm
+                centroids[i] = centroid
+    return assignments
+
+
+def _partition(profiles, max_cluster_size, indices=None):
+    """Recursively partition profiles into clusters of bounded size.
+
+    Returns a list of arrays of indices into ``profiles``. Each array contains
+    at most ``max_cluster_size`` indices, and every index appears in exactly
+    one array.
+    """
+    if indices is None:
+        indices = np.arange(len(profiles))
+    if len(indices) <= max_cluster_size:
+        return [indices]
+
+    n_clusters = max(2, int(np.ceil(len(indices) / max_cluster_size)))
+    assignments = _kmeans(profiles[indices], n_clusters)
+    clusters = [indices[assignments == i] for i in range(n_clusters)]
+    clusters = [c for c in clusters if len(c) > 0]
+    if len(clusters) == 1:
+        # k-mer profiles can't separate these sequences (e.g., they're all
+        # identical), so fall back to splitting them into equal-sized chunks.
+        return np.array_split(indices, n_clusters)
+
+    result = []
+    for cluster in clusters:
+        result.extend(_partition(profiles, max_cluster_size, cluster))
+    return result
+
+
+_COMPLEMENT = bytes.maketrans(b'ACGTRYSWKMBDHVNacgtryswkmbdhvn',
+                              b'TGCAYRSWMKVHDBNtgcayrswmkvhdbn')
+
+
+def _reverse_complement(sequence):
+    return sequence.translate(_COMPLEMENT)[::-1]
+
+
+def _reverse_complement_kmers(k):
+    """The index of each k-mer's reverse complement.
+
+    A profile of a sequence's reverse complement is its forward profile with
+    its columns permuted by this index, so the sequence needn't be read
+    again.
+    """
+    kmers = np.arange(4 ** k)
+    digits = (kmers[:, np.newaxis] // 4 ** np.arange(k)) % 4
+    # The last digit of a k-mer is the first of its reverse complement.
+    return (3 - digits) @ 4 ** np.arange(k - 1, -1, -1)
+
+
+def _orientations(profiles, reference=None, k=4, n_iterations=5):
+    """Find which profiles match ``reference`` better when reversed.
+
+    ``profiles`` are the ``_kmer_profiles`` of the sequences to orient. The
+    target is the normalized sum of the ``reference`` profiles or, without a
+    reference, of the sequences themselves (i.e., their majority
+    orientation), which is refined as sequences are reoriented. Returns
+    ``(reverse, forward_similarity, reverse_similarity)``, where ``reverse``
+    is a boolean array of the sequences to reverse complement.
+    """
+    rc = _reverse_complement_kmers(k)
+    reverse = np.zeros(len(profiles), dtype=bool)
+    for _ in range(n_iterations if reference is None else 1):
+        if reference is None:
+            target = profiles[~reverse].sum(axis=0) + \
+                profiles[reverse][:, rc].sum(axis=0)
+        else:
+            target = reference.sum(axis=0)
+        norm = np.linalg.norm(target)
+        if norm > 0:
+            target = target / norm
+        forward_similarity = profiles @ target
+        # The similarity of each reversed profile, from the permuted target.
+        reverse_similarity = profiles @ target[rc]
+        new_reverse = reverse_similarity > forward_similarity
+        if np.array_equal(reverse, new_reverse):
+            break
+        reverse = new_reverse
+    return reverse, forward_similarity, reverse_similarity
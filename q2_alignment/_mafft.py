@@ -6,14 +6,32 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import shutil
 import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+import pandas as pd
 import skbio
 import skbio.io
 from q2_types.feature_data import DNAFASTAFormat, AlignedDNAFASTAFormat
 
+from ._filter import _check_mask_parameters, _mask, _profile_from_counts
+from ._kmer import (_kmer_profiles, _orientations, _partition,
+                    _reverse_complement)
+from ._packed import PackedAlignment
+from ._profile import _stage, _profiled
+from ._metrics import _count, _metered, _record_child_peak_rss
 
-def run_command(cmd, output_fp, verbose=True):
+
+def run_command(cmd, output_fp, verbose=True, env=None):
     if verbose:
         print("Running external command line application. This may print "
               "messages to stdout and/or stderr.")
@@ -22,11 +40,534 @@ def run_command(cmd, output_fp, verbose=True):
               "no longer exist.")
         print("\nCommand:", end=' ')
         print(" ".join(cmd), end='\n\n')
-    with open(output_fp, 'w') as output_f:
-        subprocess.run(cmd, stdout=output_f, check=True)
+    with _stage('mafft.run'), open(output_fp, 'w') as output_f:
+        subprocess.run(cmd, stdout=output_f, check=True, env=env)
+    _record_child_peak_rss()
+
+
+def _scratch_env(tmp_dir):
+    # mafft writes its intermediate files to TMPDIR.
+    if tmp_dir is None:
+        return None
+    env = dict(os.environ)
+    env['TMPDIR'] = tmp_dir
+    return env
+
+
+def _check_scratch_space(scratch_dir, input_fps):
+    # Staged inputs, mafft's intermediate files and the output alignment
+    # together take roughly three times the size of the (uncompressed)
+    # inputs. Compressed inputs are assumed to expand about four-fold.
+    required = 0
+    for fp in input_fps:
+        size = os.path.getsize(fp)
+        required += 3 * (4 * size if _is_gzipped(fp) else size)
+    available = shutil.disk_usage(scratch_dir).free
+    if available < required:
+        raise ValueError(
+            "There is not enough free space in the scratch directory %r: "
+            "%d bytes are available but approximately %d bytes are "
+            "required." % (scratch_dir, available, required))
+
+
+def _move_into_place(src_fp, dst_fp):
+    # os.replace is atomic within a filesystem. Across filesystems, copy next
+    # to the destination first so that the final rename is still atomic.
+    try:
+        os.replace(src_fp, dst_fp)
+    except OSError:
+        tmp_fp = dst_fp + '.tmp'
+        shutil.copyfile(src_fp, tmp_fp)
+        os.replace(tmp_fp, dst_fp)
+        os.remove(src_fp)
+
+
+def _is_gzipped(fp):
+    # bgzip output is a series of gzip members, so it has the same magic
+    # number and can be read with the gzip module.
+    with open(fp, 'rb') as fh:
+        return fh.read(2) == b'\x1f\x8b'
+
+
+@contextlib.contextmanager
+def _uncompressed(fp, tmp_dir=None):
+    # mafft can't read compressed input, so gzipped files are decompressed
+    # into a named pipe which mafft reads from. Note that mafft still copies
+    # its input into its own temporary directory (see `_scratch_env`), so
+    # this only avoids writing a second, intermediate decompressed copy.
+    # Uncompressed files are passed through unchanged.
+    #
+    # This is only reachable from the Python API (e.g., with a
+    # DNAFASTAFormat pointing at a gzipped file): QIIME 2 validates
+    # FeatureData[Sequence] artifacts as plain FASTA, so no compressed
+    # format is registered with the plugin.
+    if not _is_gzipped(fp):
+        yield fp
+        return
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as working_dir:
+        fifo_fp = os.path.join(working_dir, os.path.basename(fp) + '.fifo')
+        os.mkfifo(fifo_fp)
+
+        cancelled = threading.Event()
+
+        def decompress():
+            try:
+                with open(fifo_fp, 'wb') as out_f:
+                    if cancelled.is_set():
+                        return
+                    with gzip.open(fp, 'rb') as in_f:
+                        shutil.copyfileobj(in_f, out_f, 1024 * 1024)
+            except BrokenPipeError:
+                # mafft exited without reading all of its input, which is
+                # reported by mafft's exit status instead.
+                pass
+
+        writer = threading.Thread(target=decompress, daemon=True)
+        writer.start()
+        try:
+            yield fifo_fp
+        finally:
+            if writer.is_alive():
+                # If mafft never opened the pipe, the writer is blocked
+                # opening it. Opening (and draining) the read end releases it.
+                cancelled.set()
+                fd = os.open(fifo_fp, os.O_RDONLY | os.O_NONBLOCK)
+                try:
+                    while writer.is_alive():
+                        try:
+                            os.read(fd, 1024 * 1024)
+                        except BlockingIOError:
+                            pass
+                        writer.join(0.01)
+                finally:
+                    os.close(fd)
+            writer.join()
+
+
+def _n_workers(n_threads):
+    if n_threads == 'auto' or n_threads < 1:
+        return os.cpu_count() or 1
+    return n_threads
+
+
+def _merge_subalignments(subalignment_fps, result_fp, n_threads,
+                         verbose=True, tmp_dir=None):
+    # mafft's --merge mode takes a single FASTA file containing all of the
+    # subalignments, and a table where each line lists the (1-based) indices
+    # of the sequences in one subalignment. Sequences which aren't listed in
+    # the table (i.e., subalignments of a single sequence) are treated as
+    # unaligned sequences.
+    if n_threads == 'auto':
+        n_threads = -1
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as working_dir:
+        input_fp = os.path.join(working_dir, 'subalignments.fasta')
+        table_fp = os.path.join(working_dir, 'subalignments.table')
+        index = 0
+        with open(input_fp, 'w') as input_f, open(table_fp, 'w') as table_f:
+            for subalignment_fp in subalignment_fps:
+                members = []
+                for seq in skbio.io.read(subalignment_fp, format='fasta',
+                                         constructor=skbio.DNA):
+                    index += 1
+                    members.append(str(index))
+                    seq.write(input_f, format='fasta')
+                if len(members) > 1:
+                    table_f.write(' '.join(members) + '\n')
+
+        cmd = ["mafft", "--preservecase", "--inputorder",
+               "--thread", str(n_threads), "--merge", table_fp, input_fp]
+        run_command(cmd, result_fp, verbose=verbose,
+                    env=_scratch_env(tmp_dir))
+
+
+def _align_clusters(sequences_fp, result_fp, n_threads, parttree,
+                    max_cluster_size, tmp_dir=None):
+    # Sequences are written to each cluster's FASTA file with their index in
+    # the input file as their ID, which both keeps mafft from truncating long
+    # IDs and lets the caller restore the input order after merging.
+    sequences = [str(seq).encode('ascii')
+                 for seq in skbio.io.read(sequences_fp, format='fasta',
+                                          constructor=skbio.DNA)]
+    with _stage('mafft.cluster'):
+        profiles = _kmer_profiles(sequences)
+        clusters = _partition(profiles, max_cluster_size)
+        del profiles
+
+    print("Aligning %d sequences in %d clusters of at most %d sequences, "
+          "then merging the resulting subalignments." %
+          (len(sequences), len(clusters), max_cluster_size))
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as working_dir:
+        jobs = []
+        subalignment_fps = []
+        for i, cluster in enumerate(clusters):
+            cluster_fp = os.path.join(working_dir, 'cluster-%d.fasta' % i)
+            with open(cluster_fp, 'wb') as cluster_f:
+                for index in cluster:
+                    cluster_f.write(b'>%d\n%s\n' % (index, sequences[index]))
+            if len(cluster) > 1:
+                aligned_fp = os.path.join(working_dir, 'cluster-%d.aln' % i)
+                cmd = ["mafft", "--preservecase", "--inputorder",
+                       "--thread", "1"]
+                if parttree:
+                    cmd += ['--parttree']
+                jobs.append((cmd + [cluster_fp], aligned_fp))
+                subalignment_fps.append(aligned_fp)
+            else:
+                subalignment_fps.append(cluster_fp)
+        del sequences
+
+        # Each worker is a separate mafft process, so threads are sufficient
+        # here: they only wait on their subprocess.
+        with ThreadPoolExecutor(
+                max_workers=_n_workers(n_threads)) as executor:
+            futures = [executor.submit(run_command, cmd, aligned_fp,
+                                       verbose=False,
+                                       env=_scratch_env(tmp_dir))
+                       for cmd, aligned_fp in jobs]
+            for future in futures:
+                future.result()
+
+        _merge_subalignments(subalignment_fps, result_fp, n_threads,
+                             tmp_dir=tmp_dir)
+
+
+def _sha256(fp):
+    digest = hashlib.sha256()
+    with open(fp, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _iter_chunks(sequences_fp, chunk_size):
+    chunk = []
+    for seq in skbio.io.read(sequences_fp, format='fasta',
+                             constructor=skbio.DNA):
+        chunk.append(seq)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _write_manifest(manifest, manifest_fp):
+    # Write to a temporary file and rename it so that a job killed while
+    # writing the manifest never leaves a truncated manifest behind.
+    tmp_fp = manifest_fp + '.tmp'
+    with open(tmp_fp, 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(tmp_fp, manifest_fp)
+
+
+def _write_chunk(chunk, chunk_fp):
+    with open(chunk_fp, 'w') as chunk_f:
+        for seq in chunk:
+            seq.write(chunk_f, format='fasta')
+    return _sha256(chunk_fp)
+
+
+def _verified_chunks(manifest, sequences_fp, chunk_size, checkpoint_dir):
+    # The completed chunks in `manifest` which can be resumed from: every
+    # chunk's input must be unchanged, and the checkpoint of the last chunk
+    # (the only one which is kept) must be intact.
+    completed = manifest['chunks']
+    if not completed:
+        return []
+    checkpoint_fp = os.path.join(checkpoint_dir,
+                                 'alignment-%06d.fasta' % (len(completed) - 1))
+    if not os.path.exists(checkpoint_fp) or \
+            _sha256(checkpoint_fp) != completed[-1]['output_sha256']:
+        return []
+    chunk_fp = os.path.join(checkpoint_dir, 'chunk-verify.fasta')
+    n_verified = 0
+    for chunk, entry in zip(_iter_chunks(sequences_fp, chunk_size),
+                            completed):
+        if _write_chunk(chunk, chunk_fp) != entry['input_sha256']:
+            break
+        n_verified += 1
+    if os.path.exists(chunk_fp):
+        os.remove(chunk_fp)
+    return completed if n_verified == len(completed) else []
+
+
+def _checkpointed_command(cmd):
+    # The mafft command as recorded in a checkpoint manifest. The thread
+    # count doesn't affect the alignment, so a job restarted with a different
+    # number of cores can still resume.
+    checkpointed = []
+    args = iter(cmd)
+    for arg in args:
+        if arg == '--thread':
+            next(args, None)
+        else:
+            checkpointed.append(arg)
+    return checkpointed
+
+
+def _add_in_chunks(cmd, sequences_fp, alignment_fp, result_fp, chunk_size,
+                   checkpoint_dir, tmp_dir=None):
+    # Sequences are added to the alignment `chunk_size` at a time, and the
+    # growing alignment is checkpointed to `checkpoint_dir` after each chunk.
+    # The manifest records the mafft command, and the SHA-256 of each chunk's
+    # input sequences and of the resulting alignment, so that a restarted job
+    # can verify completed chunks and resume after the last one. Only the
+    # latest checkpoint is kept, so scratch usage doesn't grow with the
+    # number of chunks.
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    manifest_fp = os.path.join(checkpoint_dir, 'manifest.json')
+    alignment_sha256 = _sha256(alignment_fp)
+    checkpointed_cmd = _checkpointed_command(cmd)
+    completed = []
+    if os.path.exists(manifest_fp):
+        with open(manifest_fp) as fh:
+            manifest = json.load(fh)
+        previous_cmd = _checkpointed_command(
+            manifest.get('command', checkpointed_cmd))
+        if previous_cmd != checkpointed_cmd:
+            raise ValueError(
+                "The checkpoints in %r were made with a different mafft "
+                "command (%r, rather than %r). Use a new checkpoint "
+                "directory, or rerun with the original parameters."
+                % (checkpoint_dir, ' '.join(previous_cmd),
+                   ' '.join(checkpointed_cmd)))
+        if manifest.get('alignment_sha256') == alignment_sha256 and \
+                manifest.get('chunk_size') == chunk_size:
+            completed = _verified_chunks(manifest, sequences_fp, chunk_size,
+                                         checkpoint_dir)
+    if not completed:
+        # Don't leave stale checkpoints from an unusable run behind.
+        for fn in os.listdir(checkpoint_dir):
+            if fn.startswith('alignment-') and fn.endswith('.fasta'):
+                os.remove(os.path.join(checkpoint_dir, fn))
+    manifest = {'alignment_sha256': alignment_sha256,
+                'chunk_size': chunk_size,
+                'command': checkpointed_cmd,
+                'chunks': list(completed)}
+    _write_manifest(manifest, manifest_fp)
+
+    current_fp = alignment_fp
+    if completed:
+        current_fp = os.path.join(
+            checkpoint_dir, 'alignment-%06d.fasta' % (len(completed) - 1))
+        print("Resuming from verified checkpoint for chunk %d."
+              % (len(completed) - 1))
+    for i, chunk in enumerate(_iter_chunks(sequences_fp, chunk_size)):
+        if i < len(completed):
+            continue
+        chunk_fp = os.path.join(checkpoint_dir, 'chunk-%06d.fasta' % i)
+        checkpoint_fp = os.path.join(checkpoint_dir,
+                                     'alignment-%06d.fasta' % i)
+        chunk_sha256 = _write_chunk(chunk, chunk_fp)
+        tmp_fp = checkpoint_fp + '.tmp'
+        with _uncompressed(current_fp, tmp_dir) as current_fifo_fp:
+            run_command(cmd + ['--add', chunk_fp, current_fifo_fp],
+                        tmp_fp, env=_scratch_env(tmp_dir))
+        os.replace(tmp_fp, checkpoint_fp)
+
+        manifest['chunks'].append(
+            {'input_sha256': chunk_sha256,
+             'output_sha256': _sha256(checkpoint_fp)})
+        _write_manifest(manifest, manifest_fp)
+        os.remove(chunk_fp)
+        # The previous checkpoint is superseded once this one is recorded.
+        if current_fp != alignment_fp:
+            os.remove(current_fp)
+        current_fp = checkpoint_fp
+
+    shutil.copyfile(current_fp, result_fp)
+
+
+def _read_ids(fp, kind, ids, other_ids=None, other_kind=None):
+    # Add the sequence IDs in `fp` to `ids` (a dict, used as an ordered set),
+    # raising an error if an ID is duplicated within `ids` or is already
+    # present in `other_ids`.
+    _count('bytes_read', os.path.getsize(fp))
+    n_ids = len(ids)
+    with _stage('mafft.read_ids'):
+        for seq in skbio.io.read(fp, format='fasta', constructor=skbio.DNA):
+            id_ = seq.metadata['id']
+            if id_ in ids:
+                raise ValueError(
+                    "A sequence ID is duplicated in the %s sequences: "
+                    "%r" % (kind, id_))
+            elif other_ids is not None and id_ in other_ids:
+                raise ValueError(
+                    "A sequence ID is present in both the %s and %s "
+                    "sequences: %r" % (other_kind, kind, id_))
+            else:
+                ids[id_] = True
+    _count('sequences_in', len(ids) - n_ids)
+    return ids
+
+
+def _n_jobs(n_threads):
+    # The number of workers with which to read and write alignments, which
+    # is the number of threads given to mafft.
+    if n_threads == 'auto':
+        return os.cpu_count() or 1
+    return n_threads
+
+
+def _read_packed(fp, ids, clustered, n_threads=1):
+    # Read mafft's output straight into a PackedAlignment with the original
+    # IDs, without building a TabularMSA.
+    with _stage('mafft.read_alignment'):
+        alignment = PackedAlignment.read(fp, n_jobs=_n_jobs(n_threads))
+    with _stage('mafft.restore_ids'):
+        # Using `assert` because mafft would have had to add or drop
+        # sequences while aligning, which would be a bug on mafft's end. This
+        # is just a sanity check and is not expected to trigger in practice.
+        assert len(ids) == len(alignment)
+        data = alignment.data
+        if clustered:
+            data = data[np.argsort([int(id_) for id_ in alignment.ids])]
+        return PackedAlignment(ids, data, alignment.n_positions)
+
+
+def _restore_ids(fp, ids, result_fp, clustered=False, n_threads=1,
+                 column_profile=False):
+    # Rewrite mafft's output at `fp` to `result_fp` with the original IDs. If
+    # `column_profile` is True, returns the per-position character counts.
+    alignment = _read_packed(fp, list(ids), clustered, n_threads)
+    with _stage('mafft.write_alignment'):
+        alignment.write(result_fp, n_jobs=_n_jobs(n_threads))
+    _count('sequences_out', alignment.shape.sequence)
+    _count('positions_out', alignment.shape.position)
+    _count('bytes_written', os.path.getsize(result_fp))
+    if column_profile:
+        with _stage('mafft.column_counts'):
+            return alignment.column_counts()
+
+
+def _orient(sequences_fp, reference_fp, oriented_fp):
+    # Write the sequences to `oriented_fp`, reverse complementing those whose
+    # k-mer profiles match the (degapped) reference alignment, or else the
+    # sequences' majority orientation, better that way round. Returns a
+    # DataFrame describing each sequence's orientation.
+    with _stage('mafft.orient'):
+        ids = []
+        sequences = []
+        for seq in skbio.io.read(sequences_fp, format='fasta',
+                                 constructor=skbio.DNA):
+            ids.append(seq.metadata['id'])
+            sequences.append(str(seq).encode('ascii'))
+        reference = None
+        if reference_fp is not None:
+            reference = _kmer_profiles(
+                [str(seq.degap()).encode('ascii')
+                 for seq in skbio.io.read(reference_fp, format='fasta',
+                                          constructor=skbio.DNA)])
+        reverse, forward_similarity, reverse_similarity = _orientations(
+            _kmer_profiles(sequences), reference)
+        with open(oriented_fp, 'wb') as fh:
+            for id_, sequence, reversed_ in zip(ids, sequences, reverse):
+                if reversed_:
+                    sequence = _reverse_complement(sequence)
+                fh.write(b'>%s\n%s\n' % (id_.encode(), sequence))
+    _count('sequences_reoriented', int(reverse.sum()))
+    print("Reverse complemented %d of %d sequences before aligning." %
+          (reverse.sum(), len(ids)))
+    orientations = pd.DataFrame(
+        {'reverse_complemented': reverse,
+         'forward_similarity': forward_similarity,
+         'reverse_similarity': reverse_similarity},
+        index=pd.Index(ids, name='id'))
+    return orientations
+
+
+def _mafft_oriented(sequences_fp, alignment_fp, reference_fp, n_threads,
+                    parttree, scratch_dir=None, **kwargs):
+    # Orient the sequences, then align them as in `_mafft`. Returns the
+    # alignment and the sequences' orientations.
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as working_dir:
+        oriented_fp = os.path.join(working_dir, 'oriented.fasta')
+        orientations = _orient(sequences_fp, reference_fp, oriented_fp)
+        result = _mafft(oriented_fp, alignment_fp, n_threads, parttree,
+                        scratch_dir=scratch_dir, **kwargs)
+    return result, orientations
 
 
-def _mafft(sequences_fp, alignment_fp, n_threads, parttree):
+def _mafft(sequences_fp, alignment_fp, n_threads, parttree,
+           max_cluster_size=None, chunk_size=None, checkpoint_dir=None,
+           scratch_dir=None, column_profile=False):
+    # If `column_profile` is True, returns the alignment and its per-position
+    # character counts.
+    if scratch_dir is None:
+        return _run_mafft(sequences_fp, alignment_fp, n_threads, parttree,
+                          max_cluster_size, chunk_size, checkpoint_dir,
+                          column_profile=column_profile)
+
+    # Stage the inputs, mafft's intermediate files and the output alignment
+    # in the scratch directory, then move the output into place.
+    input_fps = [fp for fp in (sequences_fp, alignment_fp) if fp is not None]
+    _check_scratch_space(scratch_dir, input_fps)
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as working_dir:
+        staged_fps = []
+        with _stage('mafft.stage_inputs'):
+            for fp in input_fps:
+                staged_fp = os.path.join(
+                    working_dir,
+                    'input-%d-%s' % (len(staged_fps), os.path.basename(fp)))
+                shutil.copyfile(fp, staged_fp)
+                staged_fps.append(staged_fp)
+        if alignment_fp is None:
+            staged_fps.append(None)
+        sequences_fp, alignment_fp = staged_fps
+
+        result = AlignedDNAFASTAFormat()
+        output_fp = os.path.join(working_dir, 'alignment.fasta')
+        counts = _run_mafft(sequences_fp, alignment_fp, n_threads,
+                            parttree, max_cluster_size, chunk_size,
+                            checkpoint_dir, output_fp=output_fp,
+                            tmp_dir=working_dir,
+                            column_profile=column_profile)
+        with _stage('mafft.move_output'):
+            _move_into_place(output_fp, str(result))
+    if column_profile:
+        return result, counts
+    return result
+
+
+def _run_mafft(sequences_fp, alignment_fp, n_threads, parttree,
+               max_cluster_size, chunk_size, checkpoint_dir, output_fp=None,
+               tmp_dir=None, column_profile=False):
+    # Run mafft, writing its output to `output_fp`, or to a new
+    # AlignedDNAFASTAFormat if `output_fp` isn't provided. Temporary files
+    # are written to `tmp_dir` if it's provided. If `column_profile` is
+    # True, the output's per-position character counts are returned too (or
+    # alone, if `output_fp` is provided).
+    if output_fp is None:
+        result = AlignedDNAFASTAFormat()
+        result_fp = str(result)
+    else:
+        result = None
+        result_fp = output_fp
+
+    ids, clustered = _align(sequences_fp, alignment_fp, n_threads, parttree,
+                            max_cluster_size, chunk_size, checkpoint_dir,
+                            result_fp, tmp_dir)
+
+    # Read output alignment into memory, reassign original sequence IDs,
+    # and write alignment back to disk.
+    counts = _restore_ids(result_fp, ids, result_fp, clustered, n_threads,
+                          column_profile)
+    if output_fp is not None:
+        return counts
+    if column_profile:
+        return result, counts
+    return result
+
+
+def _align(sequences_fp, alignment_fp, n_threads, parttree,
+           max_cluster_size, chunk_size, checkpoint_dir, result_fp,
+           tmp_dir=None):
+    # Run mafft, writing its raw output to `result_fp`. Returns the original
+    # sequence IDs (in input order), and whether the sequences were aligned
+    # in clusters, in which case the output is in merge order and the IDs in
+    # `result_fp` are the sequences' indices in the input.
+    #
     # Save original sequence IDs since long ids (~250 chars) can be truncated
     # by mafft. We'll replace the IDs in the aligned sequences file output by
     # mafft with the originals.
@@ -36,32 +577,11 @@ def _mafft(sequences_fp, alignment_fp, n_threads, parttree):
     unaligned_seq_ids = {}
 
     if alignment_fp is not None:
-        for seq in skbio.io.read(alignment_fp, format='fasta',
-                                 constructor=skbio.DNA):
-            id_ = seq.metadata['id']
-            if id_ in aligned_seq_ids:
-                raise ValueError(
-                    "A sequence ID is duplicated in the aligned sequences: "
-                    "%r" % id_)
-            else:
-                aligned_seq_ids[id_] = True
+        _read_ids(alignment_fp, 'aligned', aligned_seq_ids)
 
-    for seq in skbio.io.read(sequences_fp, format='fasta',
-                             constructor=skbio.DNA):
-        id_ = seq.metadata['id']
-        if id_ in unaligned_seq_ids:
-            raise ValueError(
-                "A sequence ID is duplicated in the unaligned sequences: "
-                "%r" % id_)
-        elif id_ in aligned_seq_ids:
-            raise ValueError(
-                "A sequence ID is present in both the aligned and unaligned "
-                "sequences: %r" % id_)
-        else:
-            unaligned_seq_ids[id_] = True
+    _read_ids(sequences_fp, 'unaligned', unaligned_seq_ids,
+              aligned_seq_ids, 'aligned')
 
-    result = AlignedDNAFASTAFormat()
-    result_fp = str(result)
     ids = {**aligned_seq_ids, **unaligned_seq_ids}
 
     # mafft will fail if the number of sequences is larger than 1 million.
@@ -71,7 +591,23 @@ def _mafft(sequences_fp, alignment_fp, n_threads, parttree):
     # eliminating the need for the mafft error to be shown to the user which
     # can be confusing and intimidating.
 
-    if not parttree and len(ids) > 1000000:
+    if max_cluster_size is not None:
+        if alignment_fp is not None:
+            raise ValueError(
+                "Clustered alignment is only supported for de novo "
+                "alignment.")
+        n_aligned = min(len(ids), max_cluster_size)
+    elif chunk_size is not None:
+        if alignment_fp is None:
+            raise ValueError(
+                "Adding sequences in chunks is only supported when adding "
+                "sequences to an existing alignment.")
+        n_aligned = len(aligned_seq_ids) + min(len(unaligned_seq_ids),
+                                               chunk_size)
+    else:
+        n_aligned = len(ids)
+
+    if not parttree and n_aligned > 1000000:
         raise ValueError(
             "The number of sequences in your feature table is larger than "
             "1 million, please use the parttree parameter")
@@ -82,55 +618,251 @@ def _mafft(sequences_fp, alignment_fp, n_threads, parttree):
     if n_threads == 'auto':
         n_threads = -1
 
-    # `--inputorder` must be turned on because we need the input and output in
-    # the same sequence order to replace the IDs below. This is mafft's default
-    # behavior but we pass the flag in case that changes in the future.
-    cmd = ["mafft", "--preservecase", "--inputorder",
-           "--thread", str(n_threads)]
+    if max_cluster_size is not None and len(ids) > max_cluster_size:
+        _align_clusters(sequences_fp, result_fp, n_threads, parttree,
+                        max_cluster_size, tmp_dir)
+        return ids, True
+    else:
+        # `--inputorder` must be turned on because we need the input and
+        # output in the same sequence order to replace the IDs below. This is
+        # mafft's default behavior but we pass the flag in case that changes
+        # in the future.
+        cmd = ["mafft", "--preservecase", "--inputorder",
+               "--thread", str(n_threads)]
 
-    if parttree:
-        cmd += ['--parttree']
+        if parttree:
+            cmd += ['--parttree']
 
-    if alignment_fp is not None:
-        cmd += ['--add', sequences_fp, alignment_fp]
-    else:
-        cmd += [sequences_fp]
-
-    run_command(cmd, result_fp)
-
-    # Read output alignment into memory, reassign original sequence IDs, and
-    # write alignment back to disk.
-    msa = skbio.TabularMSA.read(result_fp, format='fasta',
-                                constructor=skbio.DNA)
-    # Using `assert` because mafft would have had to add or drop sequences
-    # while aligning, which would be a bug on mafft's end. This is just a
-    # sanity check and is not expected to trigger in practice.
-    assert len(ids) == len(msa)
-    for id, seq in zip(ids, msa):
-        seq.metadata['id'] = id
-
-    # Turning off roundtripping options to speed up writing. We can safely turn
-    # these options off because we know the sequence IDs are rountrip-safe
-    # since we read them from a FASTA file above.
-    #
-    # http://scikit-bio.org/docs/latest/generated/
-    #     skbio.io.format.fasta.html#writer-specific-parameters
-    msa.write(result_fp, id_whitespace_replacement=None,
-              description_newline_replacement=None)
-    return result
+        if chunk_size is not None:
+            if checkpoint_dir is None:
+                with tempfile.TemporaryDirectory(dir=tmp_dir) as working_dir:
+                    _add_in_chunks(cmd, sequences_fp, alignment_fp,
+                                   result_fp, chunk_size, working_dir,
+                                   tmp_dir)
+            else:
+                _add_in_chunks(cmd, sequences_fp, alignment_fp, result_fp,
+                               chunk_size, checkpoint_dir, tmp_dir)
+        elif alignment_fp is not None:
+            with _uncompressed(sequences_fp, tmp_dir) as sequences_fifo_fp, \
+                    _uncompressed(alignment_fp, tmp_dir) as alignment_fifo_fp:
+                cmd += ['--add', sequences_fifo_fp, alignment_fifo_fp]
+                run_command(cmd, result_fp, env=_scratch_env(tmp_dir))
+        else:
+            with _uncompressed(sequences_fp, tmp_dir) as sequences_fifo_fp:
+                cmd += [sequences_fifo_fp]
+                run_command(cmd, result_fp, env=_scratch_env(tmp_dir))
+    return ids, False
 
 
 def mafft(sequences: DNAFASTAFormat,
           n_threads: int = 1,
-          parttree: bool = False) -> AlignedDNAFASTAFormat:
+          parttree: bool = False,
+          max_cluster_size: int = None,
+          scratch_dir: str = None) -> AlignedDNAFASTAFormat:
     sequences_fp = str(sequences)
-    return _mafft(sequences_fp, None, n_threads, parttree)
+    with _profiled('mafft'), _metered('mafft'):
+        return _mafft(sequences_fp, None, n_threads, parttree,
+                      max_cluster_size, scratch_dir=scratch_dir)
 
 
 def mafft_add(alignment: AlignedDNAFASTAFormat,
               sequences: DNAFASTAFormat,
               n_threads: int = 1,
-              parttree: bool = False) -> AlignedDNAFASTAFormat:
+              parttree: bool = False,
+              chunk_size: int = None,
+              checkpoint_dir: str = None,
+              scratch_dir: str = None) -> AlignedDNAFASTAFormat:
     alignment_fp = str(alignment)
     sequences_fp = str(sequences)
-    return _mafft(sequences_fp, alignment_fp, n_threads, parttree)
+    _check_checkpoint_dir(chunk_size, checkpoint_dir)
+    with _profiled('mafft_add'), _metered('mafft_add'):
+        return _mafft(sequences_fp, alignment_fp, n_threads, parttree,
+                      chunk_size=chunk_size, checkpoint_dir=checkpoint_dir,
+                      scratch_dir=scratch_dir)
+
+
+def _check_checkpoint_dir(chunk_size, checkpoint_dir):
+    if checkpoint_dir is not None and chunk_size is None:
+        raise ValueError("A checkpoint directory can only be used when "
+                         "adding sequences in chunks (i.e., when chunk_size "
+                         "is provided).")
+
+
+def mafft_with_profile(sequences: DNAFASTAFormat,
+                       n_threads: int = 1,
+                       parttree: bool = False,
+                       max_cluster_size: int = None,
+                       scratch_dir: str = None) -> (AlignedDNAFASTAFormat,
+                                                    pd.DataFrame):
+    sequences_fp = str(sequences)
+    with _profiled('mafft_with_profile'), _metered('mafft_with_profile'):
+        result, counts = _mafft(sequences_fp, None, n_threads, parttree,
+                                max_cluster_size, scratch_dir=scratch_dir,
+                                column_profile=True)
+    return result, _profile_from_counts(counts)
+
+
+def mafft_add_with_profile(alignment: AlignedDNAFASTAFormat,
+                           sequences: DNAFASTAFormat,
+                           n_threads: int = 1,
+                           parttree: bool = False,
+                           chunk_size: int = None,
+                           checkpoint_dir: str = None,
+                           scratch_dir: str = None) -> (AlignedDNAFASTAFormat,
+                                                        pd.DataFrame):
+    alignment_fp = str(alignment)
+    sequences_fp = str(sequences)
+    _check_checkpoint_dir(chunk_size, checkpoint_dir)
+    with _profiled('mafft_add_with_profile'), \
+            _metered('mafft_add_with_profile'):
+        result, counts = _mafft(sequences_fp, alignment_fp, n_threads,
+                                parttree, chunk_size=chunk_size,
+                                checkpoint_dir=checkpoint_dir,
+                                scratch_dir=scratch_dir, column_profile=True)
+    return result, _profile_from_counts(counts)
+
+
+def mafft_with_orientation(sequences: DNAFASTAFormat,
+                           reference: AlignedDNAFASTAFormat = None,
+                           n_threads: int = 1,
+                           parttree: bool = False,
+                           max_cluster_size: int = None,
+                           scratch_dir: str = None) -> (AlignedDNAFASTAFormat,
+                                                        pd.DataFrame):
+    sequences_fp = str(sequences)
+    reference_fp = str(reference) if reference is not None else None
+    with _profiled('mafft_with_orientation'), \
+            _metered('mafft_with_orientation'):
+        return _mafft_oriented(sequences_fp, None, reference_fp, n_threads,
+                               parttree, scratch_dir=scratch_dir,
+                               max_cluster_size=max_cluster_size)
+
+
+def mafft_add_with_orientation(alignment: AlignedDNAFASTAFormat,
+                               sequences: DNAFASTAFormat,
+                               n_threads: int = 1,
+                               parttree: bool = False,
+                               chunk_size: int = None,
+                               checkpoint_dir: str = None,
+                               scratch_dir: str = None
+                               ) -> (AlignedDNAFASTAFormat, pd.DataFrame):
+    alignment_fp = str(alignment)
+    sequences_fp = str(sequences)
+    _check_checkpoint_dir(chunk_size, checkpoint_dir)
+    with _profiled('mafft_add_with_orientation'), \
+            _metered('mafft_add_with_orientation'):
+        # The sequences are oriented against the alignment they're added to.
+        return _mafft_oriented(sequences_fp, alignment_fp, alignment_fp,
+                               n_threads, parttree, scratch_dir=scratch_dir,
+                               chunk_size=chunk_size,
+                               checkpoint_dir=checkpoint_dir)
+
+
+def mafft_merge(alignments: AlignedDNAFASTAFormat,
+                n_threads: int = 1) -> AlignedDNAFASTAFormat:
+    with _profiled('mafft_merge'), _metered('mafft_merge'):
+        return _mafft_merge(alignments, n_threads)
+
+
+def _mafft_merge(alignments, n_threads):
+    alignment_fps = [str(alignment) for alignment in alignments]
+    ids = {}
+    for alignment_fp in alignment_fps:
+        _read_ids(alignment_fp, 'aligned', ids)
+
+    result = AlignedDNAFASTAFormat()
+    result_fp = str(result)
+    _merge_subalignments(alignment_fps, result_fp, n_threads)
+
+    # mafft --merge preserves the order of the concatenated input
+    # subalignments, so the original IDs can be restored in order.
+    _restore_ids(result_fp, ids, result_fp, n_threads=n_threads)
+    return result
+
+
+def align_and_mask(sequences: DNAFASTAFormat,
+                   n_threads: int = 1,
+                   parttree: bool = False,
+                   max_cluster_size: int = None,
+                   max_gap_frequency: float = 1.0,
+                   min_conservation: float = 0.40,
+                   min_terminal_coverage: float = 0.0,
+                   trim_terminal_gaps: bool = False,
+                   window_size: int = 1,
+                   window_step: int = 1,
+                   min_minor_allele_count: int = 0,
+                   parsimony_informative: bool = False
+                   ) -> AlignedDNAFASTAFormat:
+    sequences_fp = str(sequences)
+    mask_parameters = (max_gap_frequency, min_conservation, None,
+                       min_terminal_coverage, trim_terminal_gaps, window_size,
+                       window_step, min_minor_allele_count,
+                       parsimony_informative)
+    # Check the mask parameters up front rather than after aligning.
+    _check_mask_parameters(max_gap_frequency, min_conservation,
+                           min_terminal_coverage, window_size, window_step,
+                           min_minor_allele_count)
+    with _profiled('align_and_mask'), _metered('align_and_mask'):
+        masked, _ = _align_and_mask(sequences_fp, n_threads, parttree,
+                                    max_cluster_size, mask_parameters,
+                                    'align_and_mask')
+        return masked
+
+
+def align_and_mask_with_alignment(sequences: DNAFASTAFormat,
+                                  n_threads: int = 1,
+                                  parttree: bool = False,
+                                  max_cluster_size: int = None,
+                                  max_gap_frequency: float = 1.0,
+                                  min_conservation: float = 0.40,
+                                  min_terminal_coverage: float = 0.0,
+                                  trim_terminal_gaps: bool = False,
+                                  window_size: int = 1,
+                                  window_step: int = 1,
+                                  min_minor_allele_count: int = 0,
+                                  parsimony_informative: bool = False
+                                  ) -> (AlignedDNAFASTAFormat,
+                                        AlignedDNAFASTAFormat):
+    sequences_fp = str(sequences)
+    mask_parameters = (max_gap_frequency, min_conservation, None,
+                       min_terminal_coverage, trim_terminal_gaps, window_size,
+                       window_step, min_minor_allele_count,
+                       parsimony_informative)
+    _check_mask_parameters(max_gap_frequency, min_conservation,
+                           min_terminal_coverage, window_size, window_step,
+                           min_minor_allele_count)
+    with _profiled('align_and_mask_with_alignment'), \
+            _metered('align_and_mask_with_alignment'):
+        return _align_and_mask(sequences_fp, n_threads, parttree,
+                               max_cluster_size, mask_parameters,
+                               'align_and_mask_with_alignment',
+                               keep_alignment=True)
+
+
+def _align_and_mask(sequences_fp, n_threads, parttree, max_cluster_size,
+                    mask_parameters, action, keep_alignment=False):
+    # Align the sequences and mask the alignment in memory. Only the masked
+    # alignment is written, unless `keep_alignment`, in which case the
+    # unmasked alignment is also written and returned.
+    with tempfile.TemporaryDirectory() as working_dir:
+        aligned_fp = os.path.join(working_dir, 'alignment.fasta')
+        ids, clustered = _align(sequences_fp, None, n_threads, parttree,
+                                max_cluster_size, None, None, aligned_fp,
+                                working_dir)
+        alignment = _read_packed(aligned_fp, list(ids), clustered, n_threads)
+
+    masked = _mask(alignment, *mask_parameters)
+    result = AlignedDNAFASTAFormat()
+    unmasked_result = AlignedDNAFASTAFormat() if keep_alignment else None
+    with _stage('%s.write' % action):
+        masked.write(str(result), n_jobs=_n_jobs(n_threads))
+        if keep_alignment:
+            alignment.write(str(unmasked_result), n_jobs=_n_jobs(n_threads))
+    bytes_written = os.path.getsize(str(result))
+    if keep_alignment:
+        bytes_written += os.path.getsize(str(unmasked_result))
+    _count('sequences_out', masked.shape.sequence)
+    _count('positions_in', alignment.shape.position)
+    _count('positions_out', masked.shape.position)
+    _count('bytes_written', bytes_written)
+    return result, unmasked_result
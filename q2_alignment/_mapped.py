@@ -0,0 +1,243 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import array
+import mmap
+
+import numpy as np
+import skbio
+
+from ._packed import (ALPHABET, PackedAlignment, Shape, _BLOCK_ELEMENTS,
+                      _DECODE, _block_rows, _encode, _pack)
+
+
+_NEWLINE = ord('\n')
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[list(b' \t\r\n\v\f')] = True
+# The file is scanned this many bytes at a time, so that the temporary arrays
+# used to find and copy out the sequences stay small.
+_BLOCK_BYTES = 2 ** 20
+
+
+def _map_file(fp):
+    with open(fp, 'rb') as fh:
+        if fh.seek(0, 2) == 0:
+            return b''
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _records(data):
+    # The IDs, and the start and end (excluding the newline) of the header
+    # line of each record, found one record at a time so that memory use is
+    # proportional to the number of records rather than the size of the file.
+    ids = []
+    header_starts = array.array('q')
+    header_ends = array.array('q')
+    if data[:1] == b'>':
+        start = 0
+    else:
+        start = data.find(b'\n>')
+        if start != -1:
+            start += 1
+    while start != -1:
+        end = data.find(b'\n', start)
+        if end == -1:
+            end = len(data)
+        # As in skbio, the ID is the header up to the first whitespace.
+        ids.append((data[start + 1:end].split(None, 1) or [b''])[0].decode())
+        header_starts.append(start)
+        header_ends.append(end)
+        start = data.find(b'\n>', end)
+        if start != -1:
+            start += 1
+    return (ids, np.frombuffer(header_starts, dtype=np.int64),
+            np.frombuffer(header_ends, dtype=np.int64))
+
+
+def _blocks(start, stop):
+    for block_start in range(start, stop, _BLOCK_BYTES):
+        yield block_start, min(block_start + _BLOCK_BYTES, stop)
+
+
+def _all_whitespace(buf, start, stop):
+    return all(_WHITESPACE[buf[block_start:block_stop]].all()
+               for block_start, block_stop in _blocks(start, stop))
+
+
+def _count_newlines(buf):
+    return sum(np.count_nonzero(buf[block_start:block_stop] == _NEWLINE)
+               for block_start, block_stop in _blocks(0, len(buf)))
+
+
+def _strided_view(buf, header_starts, header_ends):
+    # A zero-copy (n_sequences x n_positions) view of the sequences, if every
+    # record is a fixed-width header line followed by a single sequence line
+    # of the same length. Returns None for any other layout.
+    n = len(header_starts)
+    ends_with_newline = buf[-1] == _NEWLINE
+    if _count_newlines(buf) != 2 * n - (not ends_with_newline):
+        return None
+    seq_starts = header_ends + 1
+    seq_ends = np.append(header_starts[1:] - 1,
+                         len(buf) - ends_with_newline)
+    header_widths = header_ends - header_starts
+    widths = seq_ends - seq_starts
+    stride = header_widths[0] + widths[0] + 2
+    if widths[0] < 0 or (header_widths != header_widths[0]).any() or \
+            (widths != widths[0]).any() or \
+            (np.diff(header_starts) != stride).any() or \
+            _WHITESPACE[buf[seq_starts[0]:seq_ends[0]]].any():
+        return None
+    return np.lib.stride_tricks.as_strided(
+        buf[seq_starts[0]:], shape=(n, int(widths[0])),
+        strides=(int(stride), 1), writeable=False)
+
+
+def _gathered(fp, buf, header_starts, header_ends, ids):
+    # Copy the sequences out of any other layout (e.g., wrapped lines),
+    # dropping header lines and whitespace. Records are copied in blocks of
+    # about _BLOCK_BYTES, so beyond the output, memory use is proportional to
+    # the number of records.
+    if not _all_whitespace(buf, 0, header_starts[0]):
+        raise ValueError('%r is not a FASTA file: it does not start with a '
+                         'header line (beginning with ">").' % fp)
+    # The bytes of each record after its header line.
+    seq_starts = np.minimum(header_ends + 1, len(buf))
+    seq_ends = np.append(header_starts[1:], len(buf))
+    n_positions = int(np.count_nonzero(
+        ~_WHITESPACE[buf[seq_starts[0]:seq_ends[0]]]))
+    chars = np.empty((len(ids), n_positions), dtype=np.uint8)
+    first = 0
+    while first < len(ids):
+        last = int(np.searchsorted(seq_ends, seq_starts[first] + _BLOCK_BYTES,
+                                   side='right'))
+        last = min(max(last, first + 1), len(ids))
+        offset = seq_starts[first]
+        block = buf[offset:seq_ends[last - 1]]
+        # Mark the header lines of the records after the first in the block.
+        in_header = np.zeros(len(block) + 1, dtype=np.int8)
+        in_header[header_starts[first + 1:last] - offset] = 1
+        in_header[header_ends[first + 1:last] - offset] = -1
+        np.cumsum(in_header, out=in_header)
+        keep = in_header[:-1] == 0
+        keep &= ~_WHITESPACE[block]
+        kept_before = np.zeros(len(block) + 1, dtype=np.int32)
+        np.cumsum(keep, out=kept_before[1:])
+        lengths = (kept_before[seq_ends[first:last] - offset] -
+                   kept_before[seq_starts[first:last] - offset])
+        if (lengths != n_positions).any():
+            bad = first + np.flatnonzero(lengths != n_positions)[0]
+            raise ValueError('The sequences in %r are not aligned: %r has '
+                             'length %d, but the first sequence has length '
+                             '%d.' % (fp, ids[bad], lengths[bad - first],
+                                      n_positions))
+        chars[first:last] = block[keep].reshape(last - first, n_positions)
+        first = last
+    return chars
+
+
+class MappedAlignment:
+    """A DNA alignment read from a memory-mapped aligned FASTA file.
+
+    If each record in the file is a fixed-width header line followed by one
+    unwrapped sequence line (as written by ``PackedAlignment.write`` with IDs
+    of equal length), ``chars`` is a strided view of the mapped file, so
+    nothing is copied or parsed until it is used. Otherwise, the sequences
+    are copied out of the mapped file in a single pass. Characters are
+    validated as they are counted or masked.
+    """
+
+    dtype = skbio.DNA
+
+    def __init__(self, ids, chars):
+        if chars.ndim != 2 or chars.shape[0] != len(ids):
+            raise ValueError('There must be one row of characters per ID.')
+        self.ids = list(ids)
+        self.chars = chars
+        self.n_positions = chars.shape[1]
+
+    @classmethod
+    def read(cls, fp):
+        data = _map_file(fp)
+        buf = np.frombuffer(data, dtype=np.uint8)
+        ids, header_starts, header_ends = _records(data)
+        if not ids:
+            if _all_whitespace(buf, 0, len(buf)):
+                return cls([], np.empty((0, 0), dtype=np.uint8))
+            raise ValueError('%r is not a FASTA file: it does not start with '
+                             'a header line (beginning with ">").' % fp)
+        chars = _strided_view(buf, header_starts, header_ends)
+        if chars is None:
+            chars = _gathered(fp, buf, header_starts, header_ends, ids)
+        return cls(ids, chars)
+
+    @property
+    def shape(self):
+        return Shape(len(self.ids), self.n_positions)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __eq__(self, other):
+        return (isinstance(other, MappedAlignment) and
+                self.ids == other.ids and
+                np.array_equal(self.chars, other.chars))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def iter_codes(self, block_size=10000):
+        """Yield ``(start, codes)`` for blocks of rows as ALPHABET codes."""
+        for start in range(0, len(self.ids), block_size):
+            yield start, _encode(self.chars[start:start + block_size])
+
+    def column_counts(self, block_elements=_BLOCK_ELEMENTS):
+        """Count the characters in each position.
+
+        Returns an array of shape ``(n_positions, len(ALPHABET))``, counted
+        one block of rows (i.e., mapped pages) of at most ``block_elements``
+        characters at a time.
+        """
+        offsets = len(ALPHABET) * np.arange(self.n_positions, dtype=np.int64)
+        counts = np.zeros(len(ALPHABET) * self.n_positions, dtype=np.int64)
+        block_size = _block_rows(self.n_positions, block_elements)
+        for _, codes in self.iter_codes(block_size):
+            counts += np.bincount((codes + offsets).ravel(),
+                                  minlength=len(counts))
+        return counts.reshape(self.n_positions, len(ALPHABET))
+
+    def masked(self, mask, block_elements=_BLOCK_ELEMENTS):
+        """Return a ``PackedAlignment`` of the positions where ``mask``."""
+        mask = np.asarray(mask, dtype=bool)
+        n_positions = int(mask.sum())
+        data = np.empty((len(self.ids), (n_positions + 1) // 2),
+                        dtype=np.uint8)
+        block_size = _block_rows(self.n_positions, block_elements)
+        for start, codes in self.iter_codes(block_size):
+            data[start:start + len(codes)] = _pack(codes[:, mask])
+        return PackedAlignment(self.ids, data, n_positions)
+
+    def to_packed(self, block_elements=_BLOCK_ELEMENTS):
+        return self.masked(np.ones(self.n_positions, dtype=bool),
+                           block_elements)
+
+    def write(self, fp, block_size=10000, n_jobs=1):
+        """Write the alignment as (unwrapped) FASTA.
+
+        Blocks of rows are formatted by up to ``n_jobs`` threads.
+        """
+        # Imported here so that loading the plugin doesn't import _fasta.
+        from ._fasta import _write_fasta
+
+        def rows(start, stop):
+            return _DECODE[_encode(self.chars[start:stop])]
+
+        _write_fasta(fp, self.ids, rows, n_jobs, block_size)
+
+    def to_tabular_msa(self):
+        return self.to_packed().to_tabular_msa()
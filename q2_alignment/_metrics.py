@@ -0,0 +1,202 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import collections
+import contextlib
+import fcntl
+import json
+import os
+import resource
+import sys
+import time
+
+from ._profile import add_stage_hook, remove_stage_hook
+
+
+# Set Q2_ALIGNMENT_METRICS to a file path to record metrics for each run of
+# mask, mafft, mafft_add and mafft_merge. Files ending in `.prom` are written
+# in the Prometheus text exposition format (for node_exporter's textfile
+# collector), with counters and histograms accumulated across runs. Any other
+# path gets one JSON object appended per run.
+METRICS_ENV_VAR = 'Q2_ALIGNMENT_METRICS'
+
+# Counters are summed over runs in the Prometheus output. Gauges (currently
+# only peak RSS) report the most recent run.
+_COUNTERS = collections.OrderedDict([
+    ('runs', 'Number of completed runs.'),
+    ('failures', 'Number of runs which raised an error.'),
+    ('sequences_in', 'Number of input sequences.'),
+    ('sequences_out', 'Number of output sequences.'),
+    ('sequences_reoriented',
+     'Number of input sequences reverse complemented before alignment.'),
+    ('positions_in', 'Number of input alignment positions.'),
+    ('positions_out', 'Number of output alignment positions.'),
+    ('bytes_read', 'Number of bytes of input read from disk.'),
+    ('bytes_written', 'Number of bytes of output written to disk.'),
+])
+_GAUGES = collections.OrderedDict([
+    ('mafft_peak_rss_bytes', 'Peak resident set size of mafft processes.'),
+])
+_DURATION_BUCKETS = (0.01, 0.1, 1.0, 10.0, 60.0, 300.0, 1800.0, 7200.0)
+
+_current = None
+
+
+class _RunMetrics:
+    def __init__(self, action):
+        self.action = action
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.stages = collections.defaultdict(list)
+
+    def record_stage(self, stage, seconds):
+        self.stages[stage].append(seconds)
+
+
+def _count(name, value):
+    """Add ``value`` to the counter ``name`` for the current run, if any."""
+    if _current is not None:
+        _current.counters[name] += value
+
+
+def _gauge_max(name, value):
+    """Record the maximum ``value`` seen for gauge ``name`` in this run."""
+    if _current is not None:
+        _current.gauges[name] = max(_current.gauges.get(name, 0), value)
+
+
+def _record_child_peak_rss():
+    """Record the peak RSS of the largest child process waited for so far.
+
+    This is the high-water mark over the lifetime of this process, so when
+    several actions are run in one process it is an upper bound for the
+    later runs.
+    """
+    if _current is not None:
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+        if sys.platform != 'darwin':
+            peak *= 1024
+        _gauge_max('mafft_peak_rss_bytes', peak)
+
+
+@contextlib.contextmanager
+def _metered(action):
+    global _current
+    fp = os.environ.get(METRICS_ENV_VAR)
+    if not fp or _current is not None:
+        # Metrics are disabled, or this action is running inside another
+        # metered action, which will record everything.
+        yield
+        return
+
+    _current = metrics = _RunMetrics(action)
+    add_stage_hook(metrics.record_stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.counters['failures'] += 1
+        raise
+    else:
+        metrics.counters['runs'] += 1
+    finally:
+        remove_stage_hook(metrics.record_stage)
+        _current = None
+        metrics.stages['total'].append(time.perf_counter() - start)
+        if fp.endswith('.prom'):
+            _write_prometheus(metrics, fp)
+        else:
+            _write_json_lines(metrics, fp)
+
+
+def _write_json_lines(metrics, fp):
+    record = {'action': metrics.action,
+              'timestamp': time.time(),
+              'counters': dict(metrics.counters),
+              'gauges': metrics.gauges,
+              'stage_seconds': {stage: sum(durations)
+                                for stage, durations
+                                in metrics.stages.items()}}
+    with open(fp, 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        fh.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def _sample_key(name, **labels):
+    return '%s{%s}' % (name, ','.join('%s="%s"' % (k, v)
+                                      for k, v in sorted(labels.items())))
+
+
+def _samples(metrics):
+    # Yield (key, value, accumulate) for each sample in this run.
+    action = metrics.action
+    for name in _COUNTERS:
+        yield (_sample_key('q2_alignment_%s_total' % name, action=action),
+               metrics.counters.get(name, 0), True)
+    for name, value in metrics.gauges.items():
+        yield _sample_key('q2_alignment_%s' % name, action=action), value, \
+            False
+    for stage, durations in metrics.stages.items():
+        name = 'q2_alignment_stage_duration_seconds'
+        for bound in _DURATION_BUCKETS + (float('inf'),):
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield (_sample_key(name + '_bucket', action=action, stage=stage,
+                               le=le),
+                   sum(d <= bound for d in durations), True)
+        yield (_sample_key(name + '_sum', action=action, stage=stage),
+               sum(durations), True)
+        yield (_sample_key(name + '_count', action=action, stage=stage),
+               len(durations), True)
+
+
+def _family(key):
+    name = key.split('{', 1)[0]
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.startswith('q2_alignment_stage_duration_seconds') and \
+                name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def _write_prometheus(metrics, fp):
+    # The textfile collector reads the whole file, so it's rewritten
+    # atomically after merging this run into the totals already there. A lock
+    # file serializes concurrent runs writing to the same path.
+    with open(fp + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        values = collections.OrderedDict()
+        if os.path.exists(fp):
+            with open(fp) as fh:
+                for line in fh:
+                    if line.strip() and not line.startswith('#'):
+                        key, value = line.rsplit(' ', 1)
+                        values[key] = float(value)
+        for key, value, accumulate in _samples(metrics):
+            values[key] = (values.get(key, 0) + value) if accumulate \
+                else value
+
+        families = collections.OrderedDict()
+        for key in sorted(values):
+            families.setdefault(_family(key), []).append(key)
+        help_text = {'q2_alignment_%s_total' % k: (v, 'counter')
+                     for k, v in _COUNTERS.items()}
+        help_text.update({'q2_alignment_%s' % k: (v, 'gauge')
+                          for k, v in _GAUGES.items()})
+        help_text['q2_alignment_stage_duration_seconds'] = (
+            'Duration of each stage of an action.', 'histogram')
+
+        tmp_fp = fp + '.tmp'
+        with open(tmp_fp, 'w') as fh:
+            for family, keys in families.items():
+                text, type_ = help_text.get(family, ('', 'untyped'))
+                fh.write('# HELP %s %s\n# TYPE %s %s\n' %
+                         (family, text, family, type_))
+                for key in keys:
+                    fh.write('%s %s\n' % (key, repr(values[key])))
+        os.replace(tmp_fp, fp)
@@ -0,0 +1,221 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import collections
+
+import numpy as np
+import skbio
+
+
+# The 15 IUPAC nucleotide characters plus the gap character fit exactly in
+# four bits. The gap is code 0 so that padding an odd-length row with zeros
+# is equivalent to padding it with a gap.
+ALPHABET = b'-ACGTRYSWKMBDHVN'
+
+_INVALID = 255
+_ENCODE = np.full(256, _INVALID, dtype=np.uint8)
+for _code, _char in enumerate(ALPHABET):
+    _ENCODE[_char] = _code
+    _ENCODE[ord(chr(_char).lower())] = _code
+# skbio.DNA has two gap characters, which are not distinguished when packed.
+_ENCODE[ord('.')] = 0
+_DECODE = np.frombuffer(ALPHABET, dtype=np.uint8)
+# The two characters packed in each possible byte, as one 16-bit value (so
+# that decoding is a single lookup per byte).
+_DECODE_PAIRS = _DECODE[np.stack([np.arange(256) >> 4, np.arange(256) & 15],
+                                 axis=1)].view(np.uint16).ravel()
+del _code, _char
+
+# The bases represented by each ALPHABET code, as a bitmask with A, C, G and T
+# as bits 0 to 3 (so IUPAC_BY_BASES[mask] is the code's character, and gaps
+# have no bases).
+IUPAC_BY_BASES = b'NACMGRSVTWYHKDBN'
+_BASE_BITS = np.array([IUPAC_BY_BASES.rindex(c) if c != ord('-') else 0
+                       for c in ALPHABET], dtype=np.uint8)
+
+Shape = collections.namedtuple('Shape', ['sequence', 'position'])
+
+# Alignments are processed in blocks of rows holding about this many
+# characters (or packed bytes), whatever the alignment's width.
+_BLOCK_ELEMENTS = 2 ** 22
+
+
+def _block_rows(row_elements, block_elements=_BLOCK_ELEMENTS):
+    """The number of rows per block, given the elements in each row."""
+    return max(1, block_elements // max(row_elements, 1))
+
+
+def _encode(chars):
+    """Convert an array of ASCII characters into alphabet codes."""
+    codes = _ENCODE[chars]
+    if (codes == _INVALID).any():
+        invalid = sorted(set(chars[codes == _INVALID].tobytes().decode()))
+        raise ValueError('Invalid character(s) in alignment: %r. Only IUPAC '
+                         'nucleotide characters and gaps can be packed.'
+                         % ''.join(invalid))
+    return codes
+
+
+def _pack(codes):
+    """Pack a 2D array of 4-bit codes into bytes, two codes per byte."""
+    if codes.shape[1] % 2:
+        codes = np.hstack(
+            [codes, np.zeros((codes.shape[0], 1), dtype=np.uint8)])
+    return (codes[:, 0::2] << 4) | codes[:, 1::2]
+
+
+def _unpack(data, n_positions):
+    """Unpack a 2D array of bytes into 4-bit codes."""
+    codes = np.empty((data.shape[0], 2 * data.shape[1]), dtype=np.uint8)
+    codes[:, 0::2] = data >> 4
+    codes[:, 1::2] = data & 0x0F
+    return codes[:, :n_positions]
+
+
+def _decode_packed(data, n_positions):
+    """Unpack a 2D array of bytes straight into ASCII characters."""
+    return _DECODE_PAIRS[data].view(np.uint8)[:, :n_positions]
+
+
+class PackedAlignment:
+    """A DNA alignment stored with four bits per character.
+
+    Each row of ``data`` holds one sequence, with the character at position
+    ``2i`` in the high nibble of byte ``i`` and the character at position
+    ``2i + 1`` in the low nibble. This takes half the memory of an ASCII
+    alignment (and much less than a ``skbio.TabularMSA``), and column counting
+    and masking operate on the packed bytes in blocks of rows.
+    """
+
+    dtype = skbio.DNA
+
+    def __init__(self, ids, data, n_positions):
+        ids = list(ids)
+        data = np.asarray(data, dtype=np.uint8)
+        if data.ndim != 2 or data.shape[0] != len(ids):
+            raise ValueError('There must be one row of packed data per ID.')
+        if data.shape[1] != (n_positions + 1) // 2:
+            raise ValueError('Packed rows must be %d bytes long to hold %d '
+                             'positions.' % ((n_positions + 1) // 2,
+                                             n_positions))
+        self.ids = ids
+        self.data = data
+        self.n_positions = n_positions
+
+    @classmethod
+    def from_tabular_msa(cls, msa):
+        ids = [seq.metadata['id'] for seq in msa]
+        rows = [_pack(_encode(seq.values.view(np.uint8))[np.newaxis, :])
+                for seq in msa]
+        data = np.vstack(rows) if rows else np.empty((0, 0), dtype=np.uint8)
+        return cls(ids, data, msa.shape.position)
+
+    @classmethod
+    def read(cls, fp, n_jobs=1):
+        """Read and pack an aligned FASTA file.
+
+        The file is parsed in chunks by up to ``n_jobs`` worker processes,
+        which pack their sequences directly into a shared matrix.
+        """
+        # Imported here because _fasta uses this module's encoding.
+        from ._fasta import _read_fasta
+        ids, data, n_positions = _read_fasta(fp, n_jobs, packed=True)
+        return cls(ids, data, n_positions)
+
+    @classmethod
+    def load(cls, fp):
+        """Load an alignment saved with ``PackedAlignment.save``."""
+        with np.load(fp, allow_pickle=False) as contents:
+            return cls(contents['ids'].tolist(), contents['data'],
+                       int(contents['n_positions']))
+
+    def save(self, fp):
+        """Save the packed alignment in NumPy's ``.npz`` format."""
+        with open(fp, 'wb') as fh:
+            np.savez(fh, ids=np.array(self.ids, dtype=str), data=self.data,
+                     n_positions=self.n_positions)
+
+    def iter_rows(self, block_size=10000):
+        """Yield ``(ids, ascii)`` for blocks of unpacked rows."""
+        for start in range(0, len(self.ids), block_size):
+            block = self.data[start:start + block_size]
+            yield (self.ids[start:start + block_size],
+                   _decode_packed(block, self.n_positions))
+
+    def write(self, fp, block_size=10000, n_jobs=1):
+        """Write the alignment as (unwrapped) FASTA.
+
+        Blocks of rows are unpacked and formatted by up to ``n_jobs``
+        threads.
+        """
+        from ._fasta import _write_fasta
+
+        def rows(start, stop):
+            return _decode_packed(self.data[start:stop], self.n_positions)
+
+        _write_fasta(fp, self.ids, rows, n_jobs, block_size)
+
+    def to_tabular_msa(self):
+        seqs = []
+        for ids, chars in self.iter_rows():
+            seqs.extend(skbio.DNA(row.tobytes().decode(),
+                                  metadata={'id': id_, 'description': ''})
+                        for id_, row in zip(ids, chars))
+        return skbio.TabularMSA(seqs)
+
+    @property
+    def shape(self):
+        return Shape(len(self.ids), self.n_positions)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __eq__(self, other):
+        return (isinstance(other, PackedAlignment) and
+                self.ids == other.ids and
+                self.n_positions == other.n_positions and
+                np.array_equal(self.data, other.data))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def column_counts(self, block_elements=_BLOCK_ELEMENTS):
+        """Count the characters in each position.
+
+        Returns an array of shape ``(n_positions, len(ALPHABET))``. Bytes are
+        counted directly (one bincount per block of at most
+        ``block_elements`` bytes, over 256 possible values per packed
+        column), and the counts of the two positions stored in each byte are
+        then recovered by summing over the other nibble.
+        """
+        n_bytes = self.data.shape[1]
+        block_size = _block_rows(n_bytes, block_elements)
+        offsets = 256 * np.arange(n_bytes, dtype=np.int64)
+        byte_counts = np.zeros(256 * n_bytes, dtype=np.int64)
+        for start in range(0, len(self.ids), block_size):
+            block = self.data[start:start + block_size]
+            byte_counts += np.bincount((block + offsets).ravel(),
+                                       minlength=256 * n_bytes)
+        byte_counts = byte_counts.reshape(n_bytes, 16, 16)
+        counts = np.empty((2 * n_bytes, 16), dtype=np.int64)
+        counts[0::2] = byte_counts.sum(axis=2)
+        counts[1::2] = byte_counts.sum(axis=1)
+        return counts[:self.n_positions]
+
+    def masked(self, mask, block_elements=_BLOCK_ELEMENTS):
+        """Return a new alignment containing the positions where ``mask``."""
+        mask = np.asarray(mask, dtype=bool)
+        n_positions = int(mask.sum())
+        data = np.empty((len(self.ids), (n_positions + 1) // 2),
+                        dtype=np.uint8)
+        block_size = _block_rows(self.n_positions, block_elements)
+        for start in range(0, len(self.ids), block_size):
+            block = self.data[start:start + block_size]
+            codes = _unpack(block, self.n_positions)[:, mask]
+            data[start:start + block_size] = _pack(codes)
+        return PackedAlignment(self.ids, data, n_positions)
@@ -0,0 +1,97 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import contextlib
+import logging
+import os
+import time
+
+
+logger = logging.getLogger('q2_alignment')
+
+_stage_hooks = []
+
+# Set Q2_ALIGNMENT_PROFILE to `cprofile` or `tracemalloc` to run each action
+# under that profiler. Profiles are written to Q2_ALIGNMENT_PROFILE_DIR, or
+# to the current working directory if it isn't set.
+PROFILE_ENV_VAR = 'Q2_ALIGNMENT_PROFILE'
+PROFILE_DIR_ENV_VAR = 'Q2_ALIGNMENT_PROFILE_DIR'
+
+
+def add_stage_hook(hook):
+    """Register a callback to be run after each timed stage of an action.
+
+    ``hook`` is called as ``hook(stage, seconds)``, where ``stage`` is a
+    dotted name such as ``'mask.frequencies'`` or ``'mafft.run'``, and
+    ``seconds`` is the stage's wall-clock duration. Stage durations are also
+    logged to the ``q2_alignment`` logger at DEBUG level. When no hooks are
+    registered and DEBUG logging is disabled, stages are not timed at all.
+    """
+    _stage_hooks.append(hook)
+
+
+def remove_stage_hook(hook):
+    """Unregister a callback registered with ``add_stage_hook``."""
+    _stage_hooks.remove(hook)
+
+
+@contextlib.contextmanager
+def _stage(name):
+    if not _stage_hooks and not logger.isEnabledFor(logging.DEBUG):
+        yield
+        return
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    logger.debug('Stage %s took %.6f seconds.', name, seconds)
+    for hook in list(_stage_hooks):
+        hook(name, seconds)
+
+
+def _profile_fp(action, extension):
+    profile_dir = os.environ.get(PROFILE_DIR_ENV_VAR, os.getcwd())
+    return os.path.join(profile_dir, '%s-%d-%d.%s' % (
+        action, os.getpid(), int(time.time() * 1e6), extension))
+
+
+@contextlib.contextmanager
+def _profiled(action):
+    profiler = os.environ.get(PROFILE_ENV_VAR)
+    if not profiler:
+        yield
+        return
+
+    if profiler == 'cprofile':
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            fp = _profile_fp(action, 'prof')
+            profile.dump_stats(fp)
+            logger.info('Wrote cProfile output for %s to %s.', action, fp)
+    elif profiler == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            fp = _profile_fp(action, 'tracemalloc.txt')
+            with open(fp, 'w') as fh:
+                fh.write('Peak traced memory: %d bytes\n\n' % peak)
+                for stat in snapshot.statistics('lineno')[:50]:
+                    fh.write('%s\n' % stat)
+            logger.info('Wrote tracemalloc output for %s to %s.', action, fp)
+    else:
+        raise ValueError('Unknown %s: %r. Supported profilers are cprofile '
+                         'and tracemalloc.' % (PROFILE_ENV_VAR, profiler))
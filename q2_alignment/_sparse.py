@@ -0,0 +1,262 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import skbio
+
+from ._packed import ALPHABET, Shape, _DECODE, _encode
+
+
+# Runs are expanded into per-residue positions in blocks of about this many
+# residues.
+_BLOCK_RESIDUES = 2 ** 20
+
+
+def _runs(positions, row_offsets):
+    """Find runs of consecutive positions within each row.
+
+    ``positions`` holds the (sorted) positions of every residue, row after
+    row, with row ``i`` occupying ``positions[row_offsets[i]:
+    row_offsets[i + 1]]``. Returns ``(starts, ends, run_offsets)``, where
+    ``ends`` are exclusive and ``run_offsets`` indexes runs by row.
+    """
+    if len(positions) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.zeros(len(row_offsets), dtype=np.int64)
+    is_start = np.ones(len(positions), dtype=bool)
+    is_start[1:] = positions[1:] != positions[:-1] + 1
+    is_start[row_offsets[:-1][row_offsets[:-1] < len(positions)]] = True
+    start_indices = np.flatnonzero(is_start)
+    end_indices = np.append(start_indices[1:], len(positions))
+    starts = positions[start_indices]
+    ends = positions[end_indices - 1] + 1
+    run_offsets = np.searchsorted(start_indices, row_offsets)
+    return starts, ends, run_offsets
+
+
+class SparseAlignment:
+    """A DNA alignment which stores only the non-gap runs of each row.
+
+    Each row is stored as a list of ``[start, end)`` runs of non-gap
+    positions, plus the residues in those runs (as ``ALPHABET`` codes).
+    Memory use and the cost of counting and masking scale with the number of
+    residues rather than with rows x positions, which is much smaller for
+    gap-dominated alignments.
+    """
+
+    dtype = skbio.DNA
+
+    def __init__(self, ids, n_positions, starts, ends, run_offsets,
+                 residues):
+        self.ids = list(ids)
+        self.n_positions = n_positions
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.run_offsets = np.asarray(run_offsets, dtype=np.int64)
+        self.residues = np.asarray(residues, dtype=np.uint8)
+        if len(self.run_offsets) != len(self.ids) + 1:
+            raise ValueError('There must be one run offset per ID, plus one.')
+        if (self.ends - self.starts).sum() != len(self.residues):
+            raise ValueError('The runs must contain exactly one position per '
+                             'residue.')
+
+    @classmethod
+    def _from_rows(cls, ids, rows, n_positions=None):
+        positions = []
+        residues = []
+        row_offsets = [0]
+        for row in rows:
+            if n_positions is None:
+                n_positions = len(row)
+            elif len(row) != n_positions:
+                raise ValueError('The sequences are not aligned: %r has '
+                                 'length %d, but the first sequence has '
+                                 'length %d.' % (ids[len(row_offsets) - 1],
+                                                 len(row), n_positions))
+            codes = _encode(row)
+            non_gap = np.flatnonzero(codes)
+            positions.append(non_gap)
+            residues.append(codes[non_gap])
+            row_offsets.append(row_offsets[-1] + len(non_gap))
+        positions = np.concatenate(positions) if positions else \
+            np.empty(0, dtype=np.int64)
+        residues = np.concatenate(residues) if residues else \
+            np.empty(0, dtype=np.uint8)
+        starts, ends, run_offsets = _runs(positions, np.array(row_offsets))
+        return cls(ids, n_positions or 0, starts, ends, run_offsets,
+                   residues)
+
+    @classmethod
+    def from_tabular_msa(cls, msa):
+        return cls._from_rows([seq.metadata['id'] for seq in msa],
+                              (seq.values.view(np.uint8) for seq in msa),
+                              msa.shape.position)
+
+    @classmethod
+    def read(cls, fp):
+        """Read an aligned FASTA file, one sequence at a time."""
+        ids = []
+
+        def rows():
+            for seq in skbio.io.read(fp, format='fasta',
+                                     constructor=skbio.DNA):
+                ids.append(seq.metadata['id'])
+                yield seq.values.view(np.uint8)
+
+        return cls._from_rows(ids, rows())
+
+    @property
+    def shape(self):
+        return Shape(len(self.ids), self.n_positions)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __eq__(self, other):
+        return (isinstance(other, SparseAlignment) and
+                self.ids == other.ids and
+                self.n_positions == other.n_positions and
+                np.array_equal(self.starts, other.starts) and
+                np.array_equal(self.ends, other.ends) and
+                np.array_equal(self.run_offsets, other.run_offsets) and
+                np.array_equal(self.residues, other.residues))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def _run_bounds(self):
+        # The index of the first residue of each run, plus the total.
+        bounds = np.zeros(len(self.starts) + 1, dtype=np.int64)
+        np.subtract(self.ends, self.starts, out=bounds[1:])
+        np.cumsum(bounds[1:], out=bounds[1:])
+        return bounds
+
+    def _run_blocks(self, run_bounds):
+        # Split the runs into consecutive blocks of about _BLOCK_RESIDUES
+        # residues, so that per-residue temporaries stay bounded.
+        first = 0
+        while first < len(self.starts):
+            last = int(np.searchsorted(
+                run_bounds, run_bounds[first] + _BLOCK_RESIDUES))
+            last = min(max(last, first + 1), len(self.starts))
+            yield first, last
+            first = last
+
+    def _residue_positions(self, first, last, run_bounds):
+        # Expand runs first to last into the position of each residue, as
+        # int32 where that is large enough.
+        n_residues = int(run_bounds[last] - run_bounds[first])
+        dtype = np.int32 if max(n_residues, self.n_positions) < 2 ** 31 \
+            else np.int64
+        run_first = run_bounds[first:last] - run_bounds[first]
+        return np.repeat((self.starts[first:last] - run_first).astype(dtype),
+                         self.ends[first:last] - self.starts[first:last]) + \
+            np.arange(n_residues, dtype=dtype)
+
+    def column_counts(self):
+        """Count the characters in each position.
+
+        Returns an array of shape ``(n_positions, len(ALPHABET))``. Residues
+        are counted directly, a block of runs at a time, and the number of
+        gaps in each position is the number of rows minus that position's
+        coverage by non-gap runs.
+        """
+        n_counts = self.n_positions * len(ALPHABET)
+        counts = np.zeros(n_counts, dtype=np.int64)
+        run_bounds = self._run_bounds()
+        for first, last in self._run_blocks(run_bounds):
+            positions = self._residue_positions(first, last, run_bounds)
+            residues = self.residues[run_bounds[first]:run_bounds[last]]
+            counts += np.bincount(
+                positions.astype(np.int64) * len(ALPHABET) + residues,
+                minlength=n_counts)
+        counts = counts.reshape(self.n_positions, len(ALPHABET))
+        coverage = np.cumsum(
+            np.bincount(self.starts, minlength=self.n_positions + 1) -
+            np.bincount(self.ends, minlength=self.n_positions + 1))
+        counts[:, 0] = len(self.ids) - coverage[:self.n_positions]
+        return counts
+
+    def masked(self, mask):
+        """Return a new alignment containing the positions where ``mask``."""
+        mask = np.asarray(mask, dtype=bool)
+        new_positions = np.cumsum(mask) - 1
+        run_bounds = self._run_bounds()
+        residue_offsets = run_bounds[self.run_offsets]
+        kept_offsets = np.empty(len(residue_offsets), dtype=np.int64)
+        kept_positions = []
+        kept_residues = []
+        n_kept = 0
+        for first, last in self._run_blocks(run_bounds):
+            positions = self._residue_positions(first, last, run_bounds)
+            keep = mask[positions]
+            start, stop = run_bounds[first], run_bounds[last]
+            # The number of residues kept before each row starting in this
+            # block.
+            kept_before = np.concatenate([[0], np.cumsum(keep)])
+            rows = slice(*np.searchsorted(residue_offsets, [start, stop]))
+            kept_offsets[rows] = \
+                n_kept + kept_before[residue_offsets[rows] - start]
+            n_kept += int(kept_before[-1])
+            kept_positions.append(
+                new_positions[positions[keep]].astype(positions.dtype))
+            kept_residues.append(self.residues[start:stop][keep])
+        kept_offsets[np.searchsorted(residue_offsets, run_bounds[-1]):] = \
+            n_kept
+        if kept_positions:
+            kept_positions = np.concatenate(kept_positions)
+            kept_residues = np.concatenate(kept_residues)
+        else:
+            kept_positions = np.empty(0, dtype=np.int64)
+            kept_residues = np.empty(0, dtype=np.uint8)
+        starts, ends, run_offsets = _runs(kept_positions, kept_offsets)
+        return SparseAlignment(self.ids, int(mask.sum()), starts, ends,
+                               run_offsets, kept_residues)
+
+    def _dense_rows(self, start, stop, run_bounds):
+        # The ASCII characters of rows start to stop.
+        block = np.zeros((stop - start, self.n_positions), dtype=np.uint8)
+        first_run, last_run = self.run_offsets[start], self.run_offsets[stop]
+        residue_offsets = run_bounds[self.run_offsets[start:stop + 1]]
+        rows = np.repeat(np.arange(stop - start), np.diff(residue_offsets))
+        block[rows, self._residue_positions(first_run, last_run,
+                                            run_bounds)] = \
+            self.residues[residue_offsets[0]:residue_offsets[-1]]
+        return _DECODE[block]
+
+    def iter_rows(self, block_size=10000):
+        """Yield ``(ids, ascii)`` for blocks of densified rows."""
+        run_bounds = self._run_bounds()
+        for start in range(0, len(self.ids), block_size):
+            stop = min(start + block_size, len(self.ids))
+            yield self.ids[start:stop], self._dense_rows(start, stop,
+                                                         run_bounds)
+
+    def write(self, fp, block_size=10000, n_jobs=1):
+        """Write the alignment as (unwrapped) FASTA.
+
+        Blocks of rows are densified and formatted by up to ``n_jobs``
+        threads.
+        """
+        # Imported here so that loading the plugin doesn't import _fasta.
+        from ._fasta import _write_fasta
+
+        run_bounds = self._run_bounds()
+
+        def rows(start, stop):
+            return self._dense_rows(start, stop, run_bounds)
+
+        _write_fasta(fp, self.ids, rows, n_jobs, block_size)
+
+    def to_tabular_msa(self):
+        seqs = []
+        for ids, chars in self.iter_rows():
+            seqs.extend(skbio.DNA(row.tobytes().decode(),
+                                  metadata={'id': id_, 'description': ''})
+                        for id_, row in zip(ids, chars))
+        return skbio.TabularMSA(seqs)
@@ -0,0 +1,121 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from ._packed import ALPHABET, PackedAlignment, _unpack
+from ._profile import _stage, _profiled
+from ._metrics import _count, _metered
+
+
+def _scan(alignment, block_elements=2 ** 24):
+    # Count the characters in each position and the gaps in each sequence in
+    # a single pass over blocks of rows, unpacking at most `block_elements`
+    # characters at a time.
+    n_positions = alignment.n_positions
+    block_size = max(1, block_elements // max(n_positions, 1))
+    offsets = len(ALPHABET) * np.arange(n_positions, dtype=np.int64)
+    counts = np.zeros(len(ALPHABET) * n_positions, dtype=np.int64)
+    row_gaps = np.empty(len(alignment), dtype=np.int64)
+    for start in range(0, len(alignment), block_size):
+        codes = _unpack(alignment.data[start:start + block_size], n_positions)
+        counts += np.bincount((codes + offsets).ravel(),
+                              minlength=len(counts))
+        row_gaps[start:start + len(codes)] = (codes == 0).sum(axis=1)
+    return counts.reshape(n_positions, len(ALPHABET)), row_gaps
+
+
+def _column_summary(counts):
+    n_sequences = counts[0].sum() if len(counts) else 0
+    residues = counts[:, 1:]
+    n_residues = residues.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # As in mask, conservation is the relative frequency of the most
+        # common non-gap character, and is 0.0 at positions with only gaps.
+        conservation = np.where(n_residues > 0,
+                                residues.max(axis=1) / n_residues, 0.0)
+        frequencies = residues / n_residues[:, np.newaxis]
+        entropy = -np.where(residues > 0,
+                            frequencies * np.log2(frequencies), 0.0).sum(
+                                axis=1)
+    most_common = np.where(
+        n_residues > 0,
+        np.array(list(ALPHABET[1:].decode()))[residues.argmax(axis=1)], '-')
+    summary = pd.DataFrame({
+        'gap_frequency': counts[:, 0] / max(n_sequences, 1),
+        'conservation': conservation,
+        # Adding 0.0 turns the -0.0 of invariant positions into 0.0.
+        'entropy': entropy + 0.0,
+        'most_common': most_common})
+    summary.index.name = 'position'
+    return summary
+
+
+def _sequence_summary(ids, row_gaps, n_positions):
+    summary = pd.DataFrame({
+        'length': n_positions - row_gaps,
+        'gap_frequency': row_gaps / max(n_positions, 1)},
+        index=pd.Index(ids, name='id'))
+    return summary
+
+
+_INDEX_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Alignment summary</title></head>
+<body>
+<h1>Alignment summary</h1>
+%(overview)s
+<p>Download the
+<a href="column-summary.tsv">per-position summary</a> and the
+<a href="sequence-summary.tsv">per-sequence summary</a> as TSV files.</p>
+<h2>Positions</h2>
+%(columns)s
+<h2>Sequences</h2>
+%(sequences)s
+</body>
+</html>
+"""
+
+
+def summarize(output_dir: str, alignment: PackedAlignment) -> None:
+    with _profiled('summarize'), _metered('summarize'):
+        if alignment.shape.sequence == 0 or alignment.shape.position == 0:
+            raise ValueError('Input alignment is empty (i.e., there are zero '
+                             'sequences or positions in the input '
+                             'alignment).')
+        _count('sequences_in', alignment.shape.sequence)
+        _count('positions_in', alignment.shape.position)
+
+        with _stage('summarize.scan'):
+            counts, row_gaps = _scan(alignment)
+        with _stage('summarize.statistics'):
+            columns = _column_summary(counts)
+            sequences = _sequence_summary(alignment.ids, row_gaps,
+                                          alignment.n_positions)
+
+        with _stage('summarize.write'):
+            columns.to_csv(os.path.join(output_dir, 'column-summary.tsv'),
+                           sep='\t')
+            sequences.to_csv(os.path.join(output_dir,
+                                          'sequence-summary.tsv'), sep='\t')
+            overview = pd.Series(
+                ['%d' % alignment.shape.sequence,
+                 '%d' % alignment.shape.position,
+                 '%.3f' % columns['gap_frequency'].mean(),
+                 '%.3f' % columns['conservation'].mean(),
+                 '%g' % sequences['length'].median()],
+                index=['Sequences', 'Positions', 'Mean gap frequency',
+                       'Mean conservation', 'Median sequence length'])
+            with open(os.path.join(output_dir, 'index.html'), 'w') as fh:
+                fh.write(_INDEX_TEMPLATE % {
+                    'overview': overview.to_frame().to_html(header=False),
+                    'columns': columns.describe().to_html(),
+                    'sequences': sequences.describe().to_html()})
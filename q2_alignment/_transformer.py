@@ -0,0 +1,123 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+import pandas as pd
+from q2_types.feature_data import AlignedDNAFASTAFormat
+
+from .plugin_setup import plugin
+from ._packed import PackedAlignment
+from ._sparse import SparseAlignment
+from ._mapped import MappedAlignment
+from ._format import (ColumnProfileFormat, PositionalMaskFormat,
+                      SequenceOrientationFormat)
+
+
+# Transformers take no parameters, so the number of workers with which they
+# read and write alignments is taken from Q2_ALIGNMENT_N_JOBS. By default,
+# it is the number of CPUs that this process is allowed to run on.
+N_JOBS_ENV_VAR = 'Q2_ALIGNMENT_N_JOBS'
+
+
+def _n_jobs():
+    value = os.environ.get(N_JOBS_ENV_VAR)
+    if value is None:
+        if hasattr(os, 'sched_getaffinity'):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+    if not value.strip().isdigit() or int(value) < 1:
+        raise ValueError('%s must be a positive integer: %r'
+                         % (N_JOBS_ENV_VAR, value))
+    return int(value)
+
+
+@plugin.register_transformer
+def _1(ff: AlignedDNAFASTAFormat) -> PackedAlignment:
+    return PackedAlignment.read(str(ff), n_jobs=_n_jobs())
+
+
+@plugin.register_transformer
+def _2(data: PackedAlignment) -> AlignedDNAFASTAFormat:
+    ff = AlignedDNAFASTAFormat()
+    data.write(str(ff), n_jobs=_n_jobs())
+    return ff
+
+
+@plugin.register_transformer
+def _3(ff: AlignedDNAFASTAFormat) -> SparseAlignment:
+    return SparseAlignment.read(str(ff))
+
+
+@plugin.register_transformer
+def _4(data: SparseAlignment) -> AlignedDNAFASTAFormat:
+    ff = AlignedDNAFASTAFormat()
+    data.write(str(ff), n_jobs=_n_jobs())
+    return ff
+
+
+@plugin.register_transformer
+def _5(data: pd.DataFrame) -> ColumnProfileFormat:
+    ff = ColumnProfileFormat()
+    data.to_csv(str(ff), sep='\t')
+    return ff
+
+
+@plugin.register_transformer
+def _6(ff: ColumnProfileFormat) -> pd.DataFrame:
+    return pd.read_csv(str(ff), sep='\t', index_col='position',
+                       dtype='int64')
+
+
+@plugin.register_transformer
+def _7(ff: AlignedDNAFASTAFormat) -> MappedAlignment:
+    return MappedAlignment.read(str(ff))
+
+
+@plugin.register_transformer
+def _8(data: MappedAlignment) -> AlignedDNAFASTAFormat:
+    ff = AlignedDNAFASTAFormat()
+    data.write(str(ff), n_jobs=_n_jobs())
+    return ff
+
+
+@plugin.register_transformer
+def _9(data: np.ndarray) -> PositionalMaskFormat:
+    mask = np.asarray(data, dtype=bool)
+    ff = PositionalMaskFormat()
+    with ff.open() as fh:
+        fh.write(PositionalMaskFormat.HEADER.pack(
+            PositionalMaskFormat.MAGIC, len(mask)))
+        fh.write(np.packbits(mask, bitorder='little').tobytes())
+    return ff
+
+
+@plugin.register_transformer
+def _10(ff: PositionalMaskFormat) -> np.ndarray:
+    with ff.open() as fh:
+        _, n_positions = PositionalMaskFormat.HEADER.unpack(
+            fh.read(PositionalMaskFormat.HEADER.size))
+        bits = np.frombuffer(fh.read(), dtype=np.uint8)
+    return np.unpackbits(bits, count=n_positions,
+                         bitorder='little').astype(bool)
+
+
+@plugin.register_transformer
+def _11(data: pd.DataFrame) -> SequenceOrientationFormat:
+    ff = SequenceOrientationFormat()
+    data.to_csv(str(ff), sep='\t')
+    return ff
+
+
+@plugin.register_transformer
+def _12(ff: SequenceOrientationFormat) -> pd.DataFrame:
+    return pd.read_csv(str(ff), sep='\t', index_col='id',
+                       dtype={'id': str, 'reverse_complemented': bool,
+                              'forward_similarity': float,
+                              'reverse_similarity': float})
@@ -0,0 +1,14 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from qiime2.plugin import SemanticType
+
+
+ColumnProfile = SemanticType('ColumnProfile')
+PositionalMask = SemanticType('PositionalMask')
+SequenceOrientation = SemanticType('SequenceOrientation')
@@ -6,11 +6,21 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import importlib
+
 from qiime2.plugin import (
-    Plugin, Float, Int, Bool, Range, Citations, Str, Choices)
+    Plugin, Float, Int, Bool, Range, Citations, Str, Choices, List)
 from q2_types.feature_data import FeatureData, Sequence, AlignedSequence
+from q2_types.distance_matrix import DistanceMatrix
 
 import q2_alignment
+from q2_alignment import _actions
+from q2_alignment._format import (
+    ColumnProfileFormat, ColumnProfileDirectoryFormat, PositionalMaskFormat,
+    PositionalMaskDirectoryFormat, SequenceOrientationFormat,
+    SequenceOrientationDirectoryFormat)
+from q2_alignment._type import (
+    ColumnProfile, PositionalMask, SequenceOrientation)
 
 citations = Citations.load('citations.bib', package='q2_alignment')
 plugin = Plugin(
@@ -23,18 +33,105 @@ plugin = Plugin(
     short_description='Plugin for generating and manipulating alignments.'
 )
 
+mask_parameter_descriptions = {
+    'max_gap_frequency': ('The maximum relative frequency of gap '
+                          'characters in a column for the column to be '
+                          'retained. This relative frequency must be a '
+                          'number between 0.0 and 1.0 (inclusive), where '
+                          '0.0 retains only those columns without gap '
+                          'characters, and 1.0 retains all columns '
+                          'regardless of gap character frequency.'),
+    'min_conservation': ('The minimum relative frequency '
+                         'of at least one non-gap character in a '
+                         'column for that column to be retained. This '
+                         'relative frequency must be a number between 0.0 '
+                         'and 1.0 (inclusive). For example, if a value of '
+                         '0.4 is provided, a column will only be retained '
+                         'if it contains at least one character that is '
+                         'present in at least 40% of the sequences.')
+}
+
+n_threads_parameter = Int % Range(1, None) | Str % Choices(['auto'])
+n_threads_description = ('The number of threads. (Use `auto` to '
+                         'automatically use all available cores)')
+parttree_description = ('This flag is required if the number of sequences '
+                        'being aligned are larger than 1000000. Disabled by '
+                        'default')
+scratch_dir_description = ('A directory (e.g., on fast local storage or '
+                           '/dev/shm) in which inputs, mafft\'s temporary '
+                           'files and the output alignment are staged. Free '
+                           'space is checked before staging, and the final '
+                           'alignment is moved into place when mafft '
+                           'completes.')
+
+mafft_parameters = {'n_threads': n_threads_parameter,
+                    'parttree': Bool,
+                    'max_cluster_size': Int % Range(2, None),
+                    'scratch_dir': Str}
+mafft_parameter_descriptions = {
+    'n_threads': n_threads_description,
+    'parttree': parttree_description,
+    'max_cluster_size': 'If provided, sequences are grouped into clusters '
+                        'of at most this many sequences based on their '
+                        'k-mer profiles. Clusters are aligned in parallel '
+                        '(using up to `n_threads` mafft processes) and the '
+                        'resulting subalignments are combined with mafft\'s '
+                        '--merge mode. This bounds the memory used by each '
+                        'mafft process, and is useful for very large '
+                        'numbers of sequences.',
+    'scratch_dir': scratch_dir_description}
+
+mafft_add_parameters = {'n_threads': n_threads_parameter,
+                        'parttree': Bool,
+                        'chunk_size': Int % Range(1, None),
+                        'checkpoint_dir': Str,
+                        'scratch_dir': Str}
+mafft_add_parameter_descriptions = {
+    'n_threads': n_threads_description,
+    'parttree': parttree_description,
+    'chunk_size': 'If provided, sequences are added to the alignment in '
+                  'chunks of this many sequences, one mafft run per chunk.',
+    'checkpoint_dir': 'A directory in which the growing alignment is '
+                      'checkpointed after each chunk is added. If a job is '
+                      'restarted with the same inputs, chunk_size and '
+                      'checkpoint_dir, checkpoints are verified and the job '
+                      'resumes after the last good chunk. Requires '
+                      'chunk_size.',
+    'scratch_dir': scratch_dir_description}
+
+orientation_description = (
+    'Whether each sequence was reverse complemented before alignment, and '
+    'the cosine similarities of its k-mer profile, forward and reverse '
+    'complemented, to the profile it was oriented against.')
+
+column_profile_description = (
+    'The number of sequences with each character (including gaps) at each '
+    'position of the alignment, counted while the alignment is written. '
+    'This can be provided to `mask` to skip counting the alignment again.')
+
+plugin.register_semantic_types(ColumnProfile)
+plugin.register_formats(ColumnProfileFormat, ColumnProfileDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    ColumnProfile, artifact_format=ColumnProfileDirectoryFormat)
+
+plugin.register_semantic_types(PositionalMask)
+plugin.register_formats(PositionalMaskFormat, PositionalMaskDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    PositionalMask, artifact_format=PositionalMaskDirectoryFormat)
+
+plugin.register_semantic_types(SequenceOrientation)
+plugin.register_formats(SequenceOrientationFormat,
+                        SequenceOrientationDirectoryFormat)
+plugin.register_semantic_type_to_format(
+    SequenceOrientation, artifact_format=SequenceOrientationDirectoryFormat)
+
 plugin.methods.register_function(
-    function=q2_alignment.mafft,
+    function=_actions.mafft,
     inputs={'sequences': FeatureData[Sequence]},
-    parameters={'n_threads': Int % Range(1, None) | Str % Choices(['auto']),
-                'parttree': Bool},
+    parameters=mafft_parameters,
     outputs=[('alignment', FeatureData[AlignedSequence])],
     input_descriptions={'sequences': 'The sequences to be aligned.'},
-    parameter_descriptions={
-        'n_threads': 'The number of threads. (Use `auto` to automatically use '
-                     'all available cores)',
-        'parttree': 'This flag is required if the number of sequences being '
-                    'aligned are larger than 1000000. Disabled by default'},
+    parameter_descriptions=mafft_parameter_descriptions,
     output_descriptions={'alignment': 'The aligned sequences.'},
     name='De novo multiple sequence alignment with MAFFT',
     description=("Perform de novo multiple sequence alignment using MAFFT."),
@@ -42,20 +139,15 @@ plugin.methods.register_function(
 )
 
 plugin.methods.register_function(
-    function=q2_alignment.mafft_add,
+    function=_actions.mafft_add,
     inputs={'alignment': FeatureData[AlignedSequence],
             'sequences': FeatureData[Sequence]},
-    parameters={'n_threads': Int % Range(1, None) | Str % Choices(['auto']),
-                'parttree': Bool},
+    parameters=mafft_add_parameters,
     outputs=[('expanded_alignment', FeatureData[AlignedSequence])],
     input_descriptions={'alignment': 'The alignment to which '
                                      'sequences should be added.',
                         'sequences': 'The sequences to be added.'},
-    parameter_descriptions={
-        'n_threads': 'The number of threads. (Use `auto` to automatically use '
-                     'all available cores)',
-        'parttree': 'This flag is required if the number of sequences being '
-                    'aligned are larger than 1000000. Disabled by default'},
+    parameter_descriptions=mafft_add_parameter_descriptions,
     output_descriptions={
         'expanded_alignment': 'Alignment containing the provided aligned and '
                               'unaligned sequences.'},
@@ -65,33 +157,354 @@ plugin.methods.register_function(
 )
 
 plugin.methods.register_function(
-    function=q2_alignment.mask,
-    inputs={'alignment': FeatureData[AlignedSequence]},
-    parameters={'max_gap_frequency': Float % Range(0, 1, inclusive_end=True),
-                'min_conservation': Float % Range(0, 1, inclusive_end=True)},
+    function=_actions.mafft_with_profile,
+    inputs={'sequences': FeatureData[Sequence]},
+    parameters=mafft_parameters,
+    outputs=[('alignment', FeatureData[AlignedSequence]),
+             ('column_profile', ColumnProfile)],
+    input_descriptions={'sequences': 'The sequences to be aligned.'},
+    parameter_descriptions=mafft_parameter_descriptions,
+    output_descriptions={'alignment': 'The aligned sequences.',
+                         'column_profile': column_profile_description},
+    name='De novo multiple sequence alignment with MAFFT, with a column '
+         'profile.',
+    description=("Perform de novo multiple sequence alignment using MAFFT, "
+                 "as in `mafft`, and also output the alignment's column "
+                 "profile."),
+    citations=[citations['katoh2013mafft']]
+)
+
+plugin.methods.register_function(
+    function=_actions.mafft_add_with_profile,
+    inputs={'alignment': FeatureData[AlignedSequence],
+            'sequences': FeatureData[Sequence]},
+    parameters=mafft_add_parameters,
+    outputs=[('expanded_alignment', FeatureData[AlignedSequence]),
+             ('column_profile', ColumnProfile)],
+    input_descriptions={'alignment': 'The alignment to which '
+                                     'sequences should be added.',
+                        'sequences': 'The sequences to be added.'},
+    parameter_descriptions=mafft_add_parameter_descriptions,
+    output_descriptions={
+        'expanded_alignment': 'Alignment containing the provided aligned and '
+                              'unaligned sequences.',
+        'column_profile': column_profile_description},
+    name='Add sequences to multiple sequence alignment with MAFFT, with a '
+         'column profile.',
+    description=("Add new sequences to an existing alignment with MAFFT, as "
+                 "in `mafft-add`, and also output the expanded alignment's "
+                 "column profile."),
+    citations=[citations['katoh2013mafft']]
+)
+
+plugin.methods.register_function(
+    function=_actions.mafft_with_orientation,
+    inputs={'sequences': FeatureData[Sequence],
+            'reference': FeatureData[AlignedSequence]},
+    parameters=mafft_parameters,
+    outputs=[('alignment', FeatureData[AlignedSequence]),
+             ('orientation', SequenceOrientation)],
+    input_descriptions={
+        'sequences': 'The sequences to be oriented and aligned.',
+        'reference': 'An alignment of sequences in the desired '
+                     'orientation. If not provided, sequences are oriented '
+                     'to match the majority of the input sequences.'},
+    parameter_descriptions=mafft_parameter_descriptions,
+    output_descriptions={'alignment': 'The aligned sequences.',
+                         'orientation': orientation_description},
+    name='De novo multiple sequence alignment with MAFFT, after correcting '
+         'sequence orientation.',
+    description=("Reverse complement sequences whose k-mer profiles match "
+                 "the reference (or the other input sequences) better that "
+                 "way round, then perform de novo multiple sequence "
+                 "alignment using MAFFT, as in `mafft`. This is much faster "
+                 "than mafft's --adjustdirection for large numbers of "
+                 "sequences."),
+    citations=[citations['katoh2013mafft']]
+)
+
+plugin.methods.register_function(
+    function=_actions.mafft_add_with_orientation,
+    inputs={'alignment': FeatureData[AlignedSequence],
+            'sequences': FeatureData[Sequence]},
+    parameters=mafft_add_parameters,
+    outputs=[('expanded_alignment', FeatureData[AlignedSequence]),
+             ('orientation', SequenceOrientation)],
+    input_descriptions={'alignment': 'The alignment to which '
+                                     'sequences should be added.',
+                        'sequences': 'The sequences to be oriented and '
+                                     'added.'},
+    parameter_descriptions=mafft_add_parameter_descriptions,
+    output_descriptions={
+        'expanded_alignment': 'Alignment containing the provided aligned and '
+                              'unaligned sequences.',
+        'orientation': orientation_description},
+    name='Add sequences to multiple sequence alignment with MAFFT, after '
+         'correcting sequence orientation.',
+    description=("Reverse complement sequences whose k-mer profiles match "
+                 "the existing alignment better that way round, then add "
+                 "them to the alignment with MAFFT, as in `mafft-add`."),
+    citations=[citations['katoh2013mafft']]
+)
+
+plugin.methods.register_function(
+    function=_actions.mafft_merge,
+    inputs={'alignments': List[FeatureData[AlignedSequence]]},
+    parameters={'n_threads': n_threads_parameter},
+    outputs=[('merged_alignment', FeatureData[AlignedSequence])],
+    input_descriptions={'alignments': 'The alignments to be merged. Each '
+                                      'alignment is kept intact (i.e., its '
+                                      'sequences are not realigned to one '
+                                      'another) and sequence IDs must be '
+                                      'unique across all alignments.'},
+    parameter_descriptions={'n_threads': n_threads_description},
+    output_descriptions={
+        'merged_alignment': 'Alignment containing the sequences from all of '
+                            'the provided alignments.'},
+    name='Merge multiple sequence alignments with MAFFT.',
+    description='Combine existing alignments into a single alignment with '
+                'MAFFT\'s --merge mode, without realigning the sequences '
+                'within each alignment.',
+    citations=[citations['katoh2013mafft']]
+)
+
+# The parameters of `mask` and `compute-mask`.
+mask_method_parameters = {
+    'max_gap_frequency': Float % Range(0, 1, inclusive_end=True),
+    'min_conservation': Float % Range(0, 1, inclusive_end=True),
+    'min_terminal_coverage': Float % Range(0, 1, inclusive_end=True),
+    'trim_terminal_gaps': Bool,
+    'window_size': Int % Range(1, None),
+    'window_step': Int % Range(1, None),
+    'min_minor_allele_count': Int % Range(0, None),
+    'parsimony_informative': Bool}
+mask_method_parameter_descriptions = {
+    **mask_parameter_descriptions,
+    'min_terminal_coverage': (
+        'The minimum relative frequency of non-gap characters in a '
+        'column for that column to be retained at either end of the '
+        'alignment. Leading and trailing columns are trimmed up to the '
+        'first and last columns meeting this threshold, and columns '
+        'between them are unaffected. The default of 0.0 trims '
+        'nothing.'),
+    'trim_terminal_gaps': (
+        'Trim the alignment to the window of columns covered by every '
+        'sequence, i.e., remove the columns in which any sequence has '
+        'not yet started or has already ended. Sequences made up '
+        'entirely of gaps are ignored.'),
+    'window_size': (
+        'The number of consecutive columns over which gap frequency '
+        'and conservation are averaged. If greater than 1, '
+        '`max_gap_frequency` and `min_conservation` are applied to the '
+        'mean gap frequency and mean conservation of each window, and '
+        'the columns in at least one passing window are retained. The '
+        'default of 1 filters each column independently.'),
+    'window_step': (
+        'The number of columns between the starts of consecutive '
+        'windows. The last window always ends at the last column. Must '
+        'not be greater than `window_size`, so that every column is in at '
+        'least one window.'),
+    'min_minor_allele_count': (
+        'The minimum number of sequences in a column whose base is not '
+        'the column\'s most common base. Only A, C, G and T are '
+        'counted; gaps and degenerate characters are ignored. A value '
+        'of 1 retains only variable columns, and the default of 0 '
+        'filters nothing.'),
+    'parsimony_informative': (
+        'Retain only parsimony-informative columns, i.e., columns with '
+        'at least two of A, C, G and T, each present in at least two '
+        'sequences. Gaps and degenerate characters are ignored.')}
+mask_column_profile_description = (
+    'The column profile of the alignment, as output by '
+    '`mafft-with-profile` or `mafft-add-with-profile`. If provided, the '
+    'alignment\'s characters are not counted again.')
+
+plugin.methods.register_function(
+    function=_actions.mask,
+    inputs={'alignment': FeatureData[AlignedSequence],
+            'column_profile': ColumnProfile},
+    parameters=mask_method_parameters,
     outputs=[('masked_alignment', FeatureData[AlignedSequence])],
-    input_descriptions={'alignment': 'The alignment to be masked.'},
-    parameter_descriptions={
-        'max_gap_frequency': ('The maximum relative frequency of gap '
-                              'characters in a column for the column to be '
-                              'retained. This relative frequency must be a '
-                              'number between 0.0 and 1.0 (inclusive), where '
-                              '0.0 retains only those columns without gap '
-                              'characters, and 1.0 retains all columns '
-                              'regardless of gap character frequency.'),
-        'min_conservation': ('The minimum relative frequency '
-                             'of at least one non-gap character in a '
-                             'column for that column to be retained. This '
-                             'relative frequency must be a number between 0.0 '
-                             'and 1.0 (inclusive). For example, if a value of '
-                             '0.4 is provided, a column will only be retained '
-                             'if it contains at least one character that is '
-                             'present in at least 40% of the sequences.')
-    },
+    input_descriptions={
+        'alignment': 'The alignment to be masked.',
+        'column_profile': mask_column_profile_description},
+    parameter_descriptions=mask_method_parameter_descriptions,
     output_descriptions={'masked_alignment': 'The masked alignment.'},
     name='Positional conservation and gap filtering.',
     description=("Mask (i.e., filter) unconserved and highly gapped "
                  "columns from an alignment. Default min_conservation was "
-                 "chosen to reproduce the mask presented in Lane (1991)."),
+                 "chosen to reproduce the mask presented in Lane (1991). "
+                 "The masked alignment is written with '-' for every gap "
+                 "(including '.' gaps, e.g. SILVA's terminal gaps) and with "
+                 "uppercase characters."),
+    citations=[citations['lane1991']]
+)
+
+plugin.methods.register_function(
+    function=_actions.compute_mask,
+    inputs={'alignment': FeatureData[AlignedSequence],
+            'column_profile': ColumnProfile},
+    parameters=mask_method_parameters,
+    outputs=[('mask', PositionalMask)],
+    input_descriptions={
+        'alignment': 'The alignment from which to compute the mask.',
+        'column_profile': mask_column_profile_description},
+    parameter_descriptions=mask_method_parameter_descriptions,
+    output_descriptions={'mask': 'The positions of the alignment which '
+                                 '`mask` would retain.'},
+    name='Compute a positional conservation and gap mask.',
+    description=("Compute the positions that `mask` would retain, without "
+                 "masking the alignment. The mask can then be applied to "
+                 "this or other alignments with the same positions (e.g., "
+                 "alignments to the same reference) with `apply-mask`."),
     citations=[citations['lane1991']]
 )
+
+plugin.methods.register_function(
+    function=_actions.apply_mask,
+    inputs={'alignment': FeatureData[AlignedSequence],
+            'mask': PositionalMask},
+    parameters={},
+    outputs=[('masked_alignment', FeatureData[AlignedSequence])],
+    input_descriptions={
+        'alignment': 'The alignment to be masked.',
+        'mask': 'The positions to retain, as output by `compute-mask`. It '
+                'must have as many positions as the alignment.'},
+    parameter_descriptions={},
+    output_descriptions={'masked_alignment': 'The masked alignment.'},
+    name='Apply a precomputed positional mask.',
+    description=("Retain the positions of an alignment which are set in a "
+                 "precomputed mask. The alignment is masked in a single "
+                 "pass over the file, without computing any statistics. As "
+                 "with `mask`, '.' gaps are written as '-' and lowercase "
+                 "characters as uppercase.")
+)
+
+align_and_mask_parameters = {'n_threads': n_threads_parameter,
+                             'parttree': Bool,
+                             'max_cluster_size': Int % Range(2, None),
+                             **mask_method_parameters}
+align_and_mask_parameter_descriptions = {
+    'n_threads': n_threads_description,
+    'parttree': parttree_description,
+    'max_cluster_size': 'If provided, sequences are aligned in clusters of '
+                        'at most this many sequences, as in `mafft`.',
+    **mask_method_parameter_descriptions}
+
+plugin.methods.register_function(
+    function=_actions.align_and_mask,
+    inputs={'sequences': FeatureData[Sequence]},
+    parameters=align_and_mask_parameters,
+    outputs=[('masked_alignment', FeatureData[AlignedSequence])],
+    input_descriptions={'sequences': 'The sequences to be aligned.'},
+    parameter_descriptions=align_and_mask_parameter_descriptions,
+    output_descriptions={'masked_alignment': 'The masked alignment.'},
+    name='De novo multiple sequence alignment with MAFFT, then masking.',
+    description=("Align sequences with MAFFT and mask the resulting "
+                 "alignment, equivalent to running `mafft` followed by "
+                 "`mask`. The unmasked alignment is kept in memory in a "
+                 "compact form and is never written to an artifact, which "
+                 "makes this faster than running the two actions "
+                 "separately. Use `align-and-mask-with-alignment` if the "
+                 "unmasked alignment is also needed."),
+    citations=[citations['katoh2013mafft'], citations['lane1991']]
+)
+
+plugin.methods.register_function(
+    function=_actions.align_and_mask_with_alignment,
+    inputs={'sequences': FeatureData[Sequence]},
+    parameters=align_and_mask_parameters,
+    outputs=[('masked_alignment', FeatureData[AlignedSequence]),
+             ('alignment', FeatureData[AlignedSequence])],
+    input_descriptions={'sequences': 'The sequences to be aligned.'},
+    parameter_descriptions=align_and_mask_parameter_descriptions,
+    output_descriptions={'masked_alignment': 'The masked alignment.',
+                         'alignment': 'The aligned sequences, before '
+                                      'masking.'},
+    name='De novo multiple sequence alignment with MAFFT, then masking, '
+         'with the unmasked alignment.',
+    description=("Align and mask sequences as in `align-and-mask`, and also "
+                 "output the unmasked alignment. Both alignments are "
+                 "written, but the unmasked alignment is not read back "
+                 "before masking."),
+    citations=[citations['katoh2013mafft'], citations['lane1991']]
+)
+
+plugin.methods.register_function(
+    function=_actions.consensus,
+    inputs={'alignment': FeatureData[AlignedSequence]},
+    parameters={'method': Str % Choices(['majority', 'threshold',
+                                         'degenerate']),
+                'threshold': Float % Range(0, 1, inclusive_start=False,
+                                           inclusive_end=True),
+                'max_gap_frequency': Float % Range(0, 1, inclusive_end=True),
+                'consensus_id': Str},
+    outputs=[('consensus', FeatureData[Sequence])],
+    input_descriptions={'alignment': 'The alignment from which to derive a '
+                                     'consensus sequence.'},
+    parameter_descriptions={
+        'method': 'How the consensus character at each position is chosen. '
+                  '`majority` uses the most frequent base (or the IUPAC '
+                  'ambiguity code for the bases tied for most frequent). '
+                  '`threshold` uses the base with a relative frequency of at '
+                  'least `threshold`, or N if there is no such base. '
+                  '`degenerate` uses the IUPAC ambiguity code for the '
+                  'smallest set of most frequent bases with a combined '
+                  'relative frequency of at least `threshold`. Ambiguous '
+                  'characters in the alignment are split evenly between the '
+                  'bases they represent, and base frequencies are relative '
+                  'to the number of non-gap characters at each position.',
+        'threshold': 'The relative base frequency used by the `threshold` '
+                     'and `degenerate` methods.',
+        'max_gap_frequency': 'The maximum relative frequency of gap '
+                             'characters at a position for that position to '
+                             'be included in the consensus sequence.',
+        'consensus_id': 'The ID of the consensus sequence.'},
+    output_descriptions={'consensus': 'The (unaligned) consensus sequence.'},
+    name='Consensus sequence of an alignment.',
+    description='Derive a majority-rule, threshold or IUPAC-degenerate '
+                'consensus sequence from an alignment.'
+)
+
+plugin.methods.register_function(
+    function=_actions.distance_matrix,
+    inputs={'alignment': FeatureData[AlignedSequence]},
+    parameters={'metric': Str % Choices(['p-distance', 'jc69']),
+                'n_jobs': Int % Range(1, None)},
+    outputs=[('distance_matrix', DistanceMatrix)],
+    input_descriptions={'alignment': 'The alignment from which to compute '
+                                     'pairwise distances.'},
+    parameter_descriptions={
+        'metric': 'The distance metric. `p-distance` is the proportion of '
+                  'compared positions at which two sequences differ, and '
+                  '`jc69` is the Jukes-Cantor (1969) correction of the '
+                  'p-distance. Only positions at which neither sequence has '
+                  'a gap are compared, and ambiguous characters are treated '
+                  'as matching any base that they could represent.',
+        'n_jobs': 'The number of processes to use.'},
+    output_descriptions={'distance_matrix': 'The pairwise distances between '
+                                            'the aligned sequences.'},
+    name='Pairwise distances between aligned sequences.',
+    description='Compute the p-distances or Jukes-Cantor distances between '
+                'all pairs of sequences in an alignment. Sequences are '
+                'encoded as bit vectors and compared in blocks of rows, so '
+                'memory use beyond the output matrix is bounded.'
+)
+
+plugin.visualizers.register_function(
+    function=_actions.summarize,
+    inputs={'alignment': FeatureData[AlignedSequence]},
+    parameters={},
+    input_descriptions={'alignment': 'The alignment to summarize.'},
+    parameter_descriptions={},
+    name='Summarize an alignment.',
+    description='Compute the gap frequency, conservation (as defined in '
+                '`mask`), Shannon entropy (in bits, over non-gap '
+                'characters) and most common character of each position, '
+                'and the ungapped length and gap frequency of each sequence, '
+                'in a single pass over the alignment. The per-position and '
+                'per-sequence statistics are included as TSV files, which '
+                'can help with choosing `mask` thresholds.'
+)
+
+importlib.import_module('q2_alignment._transformer')
@@ -0,0 +1,45 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import inspect
+import unittest
+
+import skbio
+
+import q2_alignment
+from q2_alignment import _actions
+
+
+ACTIONS = ['mafft', 'mafft_add', 'mafft_with_profile',
+           'mafft_add_with_profile', 'mafft_with_orientation',
+           'mafft_add_with_orientation', 'mafft_merge', 'mask',
+           'compute_mask', 'apply_mask', 'align_and_mask',
+           'align_and_mask_with_alignment', 'consensus', 'distance_matrix',
+           'summarize']
+
+
+class ActionsTests(unittest.TestCase):
+
+    def test_signatures_match_implementations(self):
+        for name in ACTIONS:
+            with self.subTest(action=name):
+                self.assertEqual(
+                    inspect.signature(getattr(_actions, name)),
+                    inspect.signature(getattr(q2_alignment, name)))
+
+    def test_calls_are_forwarded(self):
+        alignment = skbio.TabularMSA(
+            [skbio.DNA('AGA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('-GA', metadata={'id': 'seq2', 'description': ''})])
+        self.assertEqual(
+            _actions.mask(alignment, max_gap_frequency=0.0),
+            q2_alignment.mask(alignment, max_gap_frequency=0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import numpy.testing as npt
+import skbio
+
+from q2_alignment import (mask, enable_column_cache, disable_column_cache,
+                          PackedAlignment, SparseAlignment)
+from q2_alignment import _cache, _filter
+from q2_alignment._cache import _ColumnCountCache, _content_key
+
+
+class ColumnCountCacheTests(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        counts = np.zeros((2, 16), dtype=np.int64)
+        cache = _ColumnCountCache(max_bytes=2 * counts.nbytes)
+        cache.put('a', counts)
+        cache.put('b', counts.copy())
+        self.assertIs(cache.get('a'), counts)
+        cache.put('c', counts.copy())
+        self.assertIs(cache.get('a'), counts)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertEqual(cache.n_bytes, 2 * counts.nbytes)
+
+    def test_too_large(self):
+        counts = np.zeros((2, 16), dtype=np.int64)
+        cache = _ColumnCountCache(max_bytes=counts.nbytes - 1)
+        cache.put('a', counts)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.n_bytes, 0)
+
+
+class ContentKeyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.msa = skbio.TabularMSA(
+            [skbio.DNA('AC-T', metadata={'id': 'seq1'}),
+             skbio.DNA('ACGT', metadata={'id': 'seq2'})])
+
+    def test_depends_on_content(self):
+        for cls in (PackedAlignment, SparseAlignment):
+            alignment = cls.from_tabular_msa(self.msa)
+            self.assertEqual(_content_key(alignment),
+                             _content_key(cls.from_tabular_msa(self.msa)))
+            other = cls.from_tabular_msa(self.msa[:, [1, 0, 2, 3]])
+            self.assertNotEqual(_content_key(alignment), _content_key(other))
+
+        self.assertEqual(_content_key(self.msa), _content_key(self.msa[:]))
+        self.assertNotEqual(_content_key(self.msa),
+                            _content_key(self.msa[:, :3]))
+
+    def test_ignores_ids(self):
+        renamed = skbio.TabularMSA(
+            [skbio.DNA('AC-T', metadata={'id': 'a'}),
+             skbio.DNA('ACGT', metadata={'id': 'b'})])
+        self.assertEqual(_content_key(self.msa), _content_key(renamed))
+
+
+class MaskCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA('ACGT-A', metadata={'id': 'seq1'}),
+             skbio.DNA('AC-TTA', metadata={'id': 'seq2'}),
+             skbio.DNA('AGGT-C', metadata={'id': 'seq3'})]))
+
+    def tearDown(self):
+        disable_column_cache()
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(_cache._cache)
+
+    def test_counts_reused(self):
+        expected = mask(self.alignment, max_gap_frequency=0.5,
+                        min_conservation=0.6)
+        enable_column_cache()
+        with mock.patch.object(_filter, '_column_counts',
+                               wraps=_filter._column_counts) as counter:
+            for _ in range(3):
+                actual = mask(self.alignment, max_gap_frequency=0.5,
+                              min_conservation=0.6)
+                self.assertEqual(actual, expected)
+            # The alignment is counted once, on the first call.
+            self.assertEqual(counter.call_count, 1)
+
+    def test_cached_counts_match(self):
+        enable_column_cache()
+        msa = self.alignment.to_tabular_msa()
+        for alignment in (self.alignment, msa,
+                          SparseAlignment.from_tabular_msa(msa)):
+            expected = mask(alignment, min_conservation=0.5)
+            self.assertEqual(mask(alignment, min_conservation=0.5), expected)
+        counts = _cache._cache.get(_content_key(self.alignment))
+        npt.assert_array_equal(counts, self.alignment.column_counts())
+        self.assertFalse(counts.flags.writeable)
+
+    def test_modified_alignment_recounted(self):
+        enable_column_cache()
+        mask(self.alignment, min_conservation=0.0)
+        data = self.alignment.data.copy()
+        data[0, 0] = 0x00
+        modified = PackedAlignment(self.alignment.ids, data,
+                                   self.alignment.n_positions)
+        actual = mask(modified, max_gap_frequency=0.0, min_conservation=0.0)
+        self.assertEqual(actual.n_positions, 2)
+
+    def test_invalid_max_bytes(self):
+        with self.assertRaisesRegex(ValueError, 'max_bytes'):
+            enable_column_cache(max_bytes=-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import unittest
+
+import skbio
+
+from q2_alignment import consensus, PackedAlignment
+
+
+class ConsensusTests(unittest.TestCase):
+
+    def setUp(self):
+        self.alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA('ACGTA-', metadata={'id': 'seq1'}),
+             skbio.DNA('ACGAA-', metadata={'id': 'seq2'}),
+             skbio.DNA('ATGCR-', metadata={'id': 'seq3'}),
+             skbio.DNA('ACTC--', metadata={'id': 'seq4'})]))
+
+    def _consensus(self, *args, **kwargs):
+        seqs = list(consensus(self.alignment, *args, **kwargs))
+        self.assertEqual(len(seqs), 1)
+        return seqs[0]
+
+    def test_majority(self):
+        obs = self._consensus()
+        self.assertEqual(str(obs), 'ACGCA')
+        self.assertEqual(obs.metadata['id'], 'consensus')
+
+    def test_majority_tie(self):
+        alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA('AC', metadata={'id': 'seq1'}),
+             skbio.DNA('GC', metadata={'id': 'seq2'})]))
+        obs = list(consensus(alignment))[0]
+        self.assertEqual(str(obs), 'RC')
+
+    def test_threshold(self):
+        self.assertEqual(str(self._consensus('threshold', 0.6)), 'ACGNA')
+        self.assertEqual(str(self._consensus('threshold', 0.5)), 'ACGCA')
+        self.assertEqual(str(self._consensus('threshold', 1.0)), 'ANNNN')
+
+    def test_degenerate(self):
+        self.assertEqual(str(self._consensus('degenerate', 0.5)), 'ACGCA')
+        self.assertEqual(str(self._consensus('degenerate', 0.9)), 'AYKHR')
+
+    def test_max_gap_frequency(self):
+        obs = self._consensus(max_gap_frequency=1.0)
+        self.assertEqual(str(obs), 'ACGCAN')
+        obs = self._consensus(max_gap_frequency=0.0)
+        self.assertEqual(str(obs), 'ACGC')
+
+    def test_all_positions_filtered(self):
+        alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA('A-', metadata={'id': 'seq1'}),
+             skbio.DNA('-C', metadata={'id': 'seq2'})]))
+        with self.assertRaisesRegex(ValueError, 'No alignment positions '
+                                                'remain.*max_gap_frequency'):
+            list(consensus(alignment, max_gap_frequency=0.0))
+
+    def test_consensus_id(self):
+        obs = self._consensus(consensus_id='my-consensus')
+        self.assertEqual(obs.metadata['id'], 'my-consensus')
+
+    def test_invalid_parameters(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown consensus method'):
+            self._consensus('plurality')
+        with self.assertRaisesRegex(ValueError, 'threshold out of range'):
+            self._consensus('threshold', 0.0)
+        with self.assertRaisesRegex(ValueError, 'max_gap_frequency'):
+            self._consensus(max_gap_frequency=1.5)
+
+    def test_empty_input(self):
+        alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA([]))
+        with self.assertRaisesRegex(ValueError, 'empty'):
+            list(consensus(alignment))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import tracemalloc
+import unittest
+from unittest import mock
+
+import numpy as np
+import numpy.testing as npt
+import skbio
+
+from q2_alignment import distance_matrix, PackedAlignment
+
+
+class DistanceMatrixTests(unittest.TestCase):
+
+    def setUp(self):
+        self.alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA('ACGTACGT', metadata={'id': 'seq1'}),
+             skbio.DNA('ACGAACGT', metadata={'id': 'seq2'}),
+             skbio.DNA('AC-TACNT', metadata={'id': 'seq3'}),
+             skbio.DNA('TTTTACGR', metadata={'id': 'seq4'})]))
+
+    def test_p_distance(self):
+        obs = distance_matrix(self.alignment)
+        self.assertEqual(obs.ids, ('seq1', 'seq2', 'seq3', 'seq4'))
+        # seq3's gap is excluded from its comparisons, and its N (and seq4's
+        # R) matches any base that it could represent.
+        exp = np.array([[0, 1/8, 0, 4/8],
+                        [1/8, 0, 1/7, 5/8],
+                        [0, 1/7, 0, 3/7],
+                        [4/8, 5/8, 3/7, 0]])
+        npt.assert_allclose(obs.data, exp)
+
+    def test_jc69(self):
+        obs = distance_matrix(self.alignment, metric='jc69')
+        p = distance_matrix(self.alignment).data
+        npt.assert_allclose(obs.data, -0.75 * np.log(1 - 4 / 3 * p))
+
+    def test_blocked_and_parallel(self):
+        rng = np.random.default_rng(0)
+        rows = np.frombuffer(b'ACGT-', dtype=np.uint8)[
+            rng.integers(0, 5, (50, 150))]
+        alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA(row.tobytes().decode(), metadata={'id': str(i)})
+             for i, row in enumerate(rows)]))
+
+        non_gap = rows != ord('-')
+        exp = np.zeros((50, 50))
+        for i in range(50):
+            for j in range(50):
+                compared = non_gap[i] & non_gap[j]
+                exp[i, j] = (rows[i][compared] != rows[j][compared]).mean()
+
+        npt.assert_allclose(distance_matrix(alignment).data, exp)
+        with mock.patch('q2_alignment._distance._MAX_BLOCK_BYTES', 1000):
+            npt.assert_allclose(distance_matrix(alignment).data, exp)
+            npt.assert_allclose(distance_matrix(alignment, n_jobs=2).data,
+                                exp)
+
+    def test_memory_is_bounded(self):
+        # Distances are stored into the output a block at a time, so beyond
+        # the output, memory use doesn't grow with the number of sequences.
+        rng = np.random.default_rng(0)
+        rows = np.frombuffer(b'ACGT', dtype=np.uint8)[
+            rng.integers(0, 4, (600, 100))]
+        alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA(row.tobytes().decode(), metadata={'id': str(i)})
+             for i, row in enumerate(rows)]))
+        output_bytes = 600 * 600 * 8
+
+        with mock.patch('q2_alignment._distance._MAX_BLOCK_BYTES', 2 ** 16):
+            tracemalloc.start()
+            try:
+                distance_matrix(alignment)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        self.assertLess(peak, 1.5 * output_bytes)
+
+    def test_no_overlap(self):
+        alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA('AC--', metadata={'id': 'seq1'}),
+             skbio.DNA('--GT', metadata={'id': 'seq2'})]))
+        with self.assertRaisesRegex(ValueError, "'seq1' and 'seq2'"):
+            distance_matrix(alignment)
+
+    def test_jc69_saturated(self):
+        alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA('ACGT', metadata={'id': 'seq1'}),
+             skbio.DNA('CATG', metadata={'id': 'seq2'})]))
+        npt.assert_allclose(distance_matrix(alignment).data,
+                            [[0, 1], [1, 0]])
+        with self.assertRaisesRegex(ValueError, 'Jukes-Cantor'):
+            distance_matrix(alignment, metric='jc69')
+
+    def test_invalid_parameters(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown metric'):
+            distance_matrix(self.alignment, metric='hamming')
+        with self.assertRaisesRegex(ValueError, 'n_jobs'):
+            distance_matrix(self.alignment, n_jobs=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
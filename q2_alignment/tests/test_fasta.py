@@ -0,0 +1,175 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import numpy.testing as npt
+import skbio
+
+from q2_alignment import _fasta
+from q2_alignment._fasta import _read_fasta, _write_fasta
+from q2_alignment._packed import PackedAlignment, _encode, _pack
+from q2_alignment._sparse import SparseAlignment
+
+
+class ReadFastaTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.fp = os.path.join(self.temp_dir.name, 'alignment.fasta')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, contents):
+        with open(self.fp, 'w') as fh:
+            fh.write(contents)
+
+    def test_wrapped_records(self):
+        self._write('>seq1 a description\nAC-\nGT\n\n>seq2\nACGTN\n'
+                    '>seq3\nA\nC\nG\nT\n.\n')
+        ids, codes, n_positions = _read_fasta(self.fp)
+        self.assertEqual(ids, ['seq1', 'seq2', 'seq3'])
+        self.assertEqual(n_positions, 5)
+        npt.assert_array_equal(
+            codes, [[1, 2, 0, 3, 4], [1, 2, 3, 4, 15], [1, 2, 3, 4, 0]])
+
+        ids, data, n_positions = _read_fasta(self.fp, packed=True)
+        npt.assert_array_equal(data, _pack(codes))
+
+    def test_parallel_matches_serial(self):
+        seqs = ['ACGT-ACGTN', 'A-CGTACG-T', '----ACGTAC']
+        self._write(''.join('>seq%d\n%s\n' % (i, seqs[i % 3])
+                            for i in range(100)))
+        # Force one chunk per few records, so that records are split between
+        # several workers.
+        with mock.patch.object(_fasta, '_CHUNK_BYTES', 64):
+            ids, data, n_positions = _read_fasta(self.fp, n_jobs=3,
+                                                 packed=True)
+        expected = PackedAlignment.from_tabular_msa(skbio.TabularMSA.read(
+            self.fp, constructor=skbio.DNA))
+        self.assertEqual(ids, expected.ids)
+        self.assertEqual(n_positions, 10)
+        npt.assert_array_equal(data, expected.data)
+
+    def test_chunks_are_bounded_without_workers(self):
+        self._write(''.join('>seq%d\nACGT-ACGTN\n' % i for i in range(100)))
+        read_range = _fasta._read_range
+        sizes = []
+
+        def recorded_read_range(fp, start, stop):
+            sizes.append(stop - start)
+            return read_range(fp, start, stop)
+
+        # The file is parsed a chunk at a time even in a single process, so
+        # that memory use doesn't grow with the size of the file.
+        with mock.patch.object(_fasta, '_CHUNK_BYTES', 64), \
+                mock.patch.object(_fasta, '_read_range',
+                                  side_effect=recorded_read_range):
+            ids, codes, n_positions = _read_fasta(self.fp)
+        self.assertEqual(ids, ['seq%d' % i for i in range(100)])
+        self.assertEqual(codes.shape, (100, 10))
+        self.assertGreater(len(sizes), 10)
+        self.assertLessEqual(max(sizes), 64 + len('>seq99\nACGT-ACGTN\n'))
+
+    def test_chunk_bounds_on_records(self):
+        self._write(''.join('>seq%d\nACGT\n' % i for i in range(20)))
+        with open(self.fp, 'rb') as fh:
+            contents = fh.read()
+        bounds = _fasta._chunk_bounds(contents, 4)
+        self.assertEqual(bounds[0][0], 0)
+        self.assertEqual(bounds[-1][1], len(contents))
+        for start, stop in bounds:
+            self.assertEqual(contents[start:start + 1], b'>')
+        self.assertEqual(sum(_fasta._count_records(self.fp, *bound)
+                             for bound in bounds), 20)
+
+    def test_leading_blank_lines(self):
+        self._write('\n\n>seq1\nACGT\n>seq2\nAC-T\n')
+        ids, codes, n_positions = _read_fasta(self.fp)
+        self.assertEqual(ids, ['seq1', 'seq2'])
+        npt.assert_array_equal(codes, [[1, 2, 3, 4], [1, 2, 0, 4]])
+
+    def test_empty(self):
+        self._write('')
+        ids, codes, n_positions = _read_fasta(self.fp)
+        self.assertEqual((ids, codes.shape, n_positions), ([], (0, 0), 0))
+
+    def test_unaligned(self):
+        self._write('>seq1\nACGT\n>seq2\nACG\n')
+        with self.assertRaisesRegex(ValueError, "'seq2' has length 3"):
+            _read_fasta(self.fp)
+
+    def test_invalid_characters(self):
+        self._write('>seq1\nACGT\n>seq2\nACGX\n')
+        with self.assertRaisesRegex(ValueError, 'X'):
+            _read_fasta(self.fp)
+
+    def test_not_fasta(self):
+        self._write('ACGT\n')
+        with self.assertRaisesRegex(ValueError, 'header'):
+            _read_fasta(self.fp)
+
+    def test_encoding_matches_packed(self):
+        self._write('>seq1\n-ACGTRYSWKMBDHVN\n')
+        _, codes, _ = _read_fasta(self.fp)
+        npt.assert_array_equal(codes[0], _encode(
+            bytearray(b'-ACGTRYSWKMBDHVN')))
+
+
+class WriteFastaTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.fp = os.path.join(self.temp_dir.name, 'alignment.fasta')
+        self.ids = ['s%d' % (i * 7) for i in range(50)]
+        self.seqs = ['ACGT-ACGTN'[i % 10:] + 'ACGT-ACGTN'[:i % 10]
+                     for i in range(50)]
+        self.expected = ''.join('>%s\n%s\n' % record
+                                for record in zip(self.ids, self.seqs))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _rows(self, start, stop):
+        return np.array([list(seq.encode()) for seq in self.seqs[start:stop]],
+                        dtype=np.uint8)
+
+    def _read(self):
+        with open(self.fp) as fh:
+            return fh.read()
+
+    def test_serial(self):
+        _write_fasta(self.fp, self.ids, self._rows, block_size=7)
+        self.assertEqual(self._read(), self.expected)
+
+    def test_parallel(self):
+        _write_fasta(self.fp, self.ids, self._rows, n_jobs=3, block_size=4)
+        self.assertEqual(self._read(), self.expected)
+
+    def test_empty(self):
+        _write_fasta(self.fp, [], self._rows, n_jobs=2)
+        self.assertEqual(self._read(), '')
+
+    def test_alignment_writers(self):
+        msa = skbio.TabularMSA(
+            [skbio.DNA(seq, metadata={'id': id_})
+             for id_, seq in zip(self.ids, self.seqs)])
+        for cls in (PackedAlignment, SparseAlignment):
+            alignment = cls.from_tabular_msa(msa)
+            for n_jobs in (1, 2):
+                alignment.write(self.fp, block_size=6, n_jobs=n_jobs)
+                self.assertEqual(self._read(), self.expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
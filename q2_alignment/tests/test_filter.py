@@ -6,50 +6,73 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import os
+import tempfile
+
 import skbio
 import numpy as np
+import numpy.testing as npt
 import unittest
+from q2_types.feature_data import AlignedDNAFASTAFormat
+
+from q2_alignment._packed import ALPHABET
+from q2_alignment._filter import (_most_conserved, _profile_from_counts,
+                                  _window_means, _windows)
+from q2_alignment import (mask, compute_mask, apply_mask, PackedAlignment,
+                          SparseAlignment)
 
-from q2_alignment._filter import _most_conserved
-from q2_alignment import mask
+
+def _counts(frequencies):
+    # A positions x ALPHABET matrix from per-position character frequencies.
+    counts = np.zeros((len(frequencies), len(ALPHABET)))
+    for position, frequency_vector in enumerate(frequencies):
+        for char, frequency in frequency_vector.items():
+            counts[position, ALPHABET.index(char.encode())] = frequency
+    return counts
 
 
 class MostConservedTests(unittest.TestCase):
 
     def test_basic(self):
-        frequencies = [{'A': 1/3, '-': 2/3}, {'G': 1.0}, {'A': 2/3, 'C': 1/3}]
-        actual = _most_conserved(frequencies, skbio.DNA)
+        counts = _counts([{'A': 1, '-': 2}, {'G': 3}, {'A': 2, 'C': 1}])
+        actual = _most_conserved(counts)
         expected = [1.0, 1.0, 2./3.]
-        self.assertEqual(actual, expected)
+        npt.assert_allclose(actual, expected)
 
-        frequencies = [{'A': 1/4, '-': 3/4}, {'G': 1.0}, {'A': 1/2, 'C': 1/2},
-                       {'A': 1/4, 'C': 1/4, 'G': 1/4, 'T': 1/4}]
-        actual = _most_conserved(frequencies, skbio.DNA)
+        counts = _counts([{'A': 1, '-': 3}, {'G': 4}, {'A': 2, 'C': 2},
+                          {'A': 1, 'C': 1, 'G': 1, 'T': 1}])
+        actual = _most_conserved(counts)
         expected = [1.0, 1.0, 0.5, 0.25]
-        self.assertEqual(actual, expected)
+        npt.assert_allclose(actual, expected)
+
+    def test_frequencies(self):
+        counts = _counts([{'A': 1/3, '-': 2/3}, {'G': 1.0},
+                          {'A': 2/3, 'C': 1/3}])
+        actual = _most_conserved(counts)
+        expected = [1.0, 1.0, 2./3.]
+        npt.assert_allclose(actual, expected)
 
     def test_N(self):
-        frequencies = [{'A': 1/3, '-': 2/3}, {'G': 1.0}, {'A': 2/3, 'N': 1/3}]
-        actual = _most_conserved(frequencies, skbio.DNA)
+        counts = _counts([{'A': 1, '-': 2}, {'G': 3}, {'A': 2, 'N': 1}])
+        actual = _most_conserved(counts)
         expected = [1.0, 1.0, 2./3.]
-        self.assertEqual(actual, expected)
+        npt.assert_allclose(actual, expected)
 
     def test_unknown_gap_mode(self):
-        frequencies = [{'A': 1/3, '-': 2/3}, {'G': 1.0}, {'A': 2/3, 'C': 1/3}]
+        counts = _counts([{'A': 1, '-': 2}, {'G': 3}, {'A': 2, 'C': 1}])
         with self.assertRaises(ValueError):
-            _most_conserved(frequencies, skbio.DNA, gap_mode='not-real')
+            _most_conserved(counts, gap_mode='not-real')
 
     def test_all_gap(self):
-        frequencies = [{'-': 1.0}]
-        actual = _most_conserved(frequencies, skbio.DNA)
+        counts = _counts([{'-': 3}])
+        actual = _most_conserved(counts)
         expected = [0.0]
-        self.assertEqual(actual, expected)
+        npt.assert_allclose(actual, expected)
 
     def test_empty(self):
-        frequencies = []
-        actual = _most_conserved(frequencies, skbio.DNA)
-        expected = []
-        self.assertEqual(actual, expected)
+        counts = _counts([])
+        actual = _most_conserved(counts)
+        self.assertEqual(actual.shape, (0,))
 
 
 class MaskTests(unittest.TestCase):
@@ -71,6 +94,79 @@ class MaskTests(unittest.TestCase):
 
         self.assertEqual(actual, expected)
 
+    def test_packed(self):
+        alignment = skbio.TabularMSA(
+            [skbio.DNA('AGA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('-GA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('-GC', metadata={'id': 'seq3', 'description': ''})]
+        )
+        packed = PackedAlignment.from_tabular_msa(alignment)
+
+        actual = mask(packed, max_gap_frequency=0.05, min_conservation=0.30)
+
+        expected = skbio.TabularMSA(
+            [skbio.DNA('GA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('GA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('GC', metadata={'id': 'seq3', 'description': ''})]
+        )
+        self.assertIsInstance(actual, PackedAlignment)
+        self.assertEqual(actual.to_tabular_msa(), expected)
+
+    def test_sparse(self):
+        alignment = skbio.TabularMSA(
+            [skbio.DNA('AGA-', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('-GA-', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('-GC-', metadata={'id': 'seq3', 'description': ''})]
+        )
+        sparse = SparseAlignment.from_tabular_msa(alignment)
+
+        actual = mask(sparse, max_gap_frequency=0.05, min_conservation=0.30)
+
+        expected = skbio.TabularMSA(
+            [skbio.DNA('GA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('GA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('GC', metadata={'id': 'seq3', 'description': ''})]
+        )
+        self.assertIsInstance(actual, SparseAlignment)
+        self.assertEqual(actual.to_tabular_msa(), expected)
+
+    def test_column_profile(self):
+        alignment = skbio.TabularMSA(
+            [skbio.DNA('AGA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('-GA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('-GC', metadata={'id': 'seq3', 'description': ''})]
+        )
+        counts = np.zeros((3, 16), dtype=np.int64)
+        counts[0, [0, 1]] = [2, 1]
+        counts[1, 3] = 3
+        counts[2, [1, 2]] = [2, 1]
+        profile = _profile_from_counts(counts)
+        self.assertEqual(list(profile.loc[1, ['-', 'G']]), [0, 3])
+
+        actual = mask(alignment, max_gap_frequency=0.05,
+                      min_conservation=0.30, column_profile=profile)
+
+        expected = skbio.TabularMSA(
+            [skbio.DNA('GA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('GA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('GC', metadata={'id': 'seq3', 'description': ''})]
+        )
+        self.assertEqual(actual, expected)
+
+    def test_column_profile_mismatch(self):
+        alignment = skbio.TabularMSA(
+            [skbio.DNA('AGA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('-GA', metadata={'id': 'seq2', 'description': ''})]
+        )
+        packed = PackedAlignment.from_tabular_msa(alignment)
+        profile = _profile_from_counts(packed.column_counts()[:2])
+        with self.assertRaisesRegex(ValueError, '2 positions.*3 positions'):
+            mask(alignment, column_profile=profile)
+
+        profile = _profile_from_counts(packed.column_counts() * 2)
+        with self.assertRaisesRegex(ValueError, 'does not match'):
+            mask(alignment, column_profile=profile)
+
     def test_gap_boundaries(self):
         alignment1 = skbio.TabularMSA(
             [skbio.DNA('-', metadata={'id': 'seq1', 'description': ''}),
@@ -164,3 +260,290 @@ class MaskTests(unittest.TestCase):
         alignment = skbio.TabularMSA([])
         with self.assertRaises(ValueError):
             mask(alignment)
+
+    def _ragged_alignment(self):
+        return skbio.TabularMSA(
+            [skbio.DNA('--ACGTA-', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('-TACGTAC', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('---CGTA-', metadata={'id': 'seq3', 'description': ''}),
+             skbio.DNA('--------', metadata={'id': 'seq4', 'description': ''})]
+        )
+
+    def test_min_terminal_coverage(self):
+        alignment = self._ragged_alignment()
+        # Coverage by position: 0, 1/4, 2/4, 3/4, 3/4, 3/4, 3/4, 1/4.
+        actual = mask(alignment, min_conservation=0.0,
+                      min_terminal_coverage=0.5)
+        self.assertEqual(actual, alignment[:, 2:7])
+
+        # Columns inside the window are kept even when poorly covered.
+        alignment = alignment[:, [3, 0, 4]]
+        actual = mask(alignment, min_conservation=0.0,
+                      min_terminal_coverage=0.5)
+        self.assertEqual(actual, alignment)
+
+    def test_trim_terminal_gaps(self):
+        alignment = self._ragged_alignment()
+        expected = alignment[:, 3:7]
+        for cls in (PackedAlignment, SparseAlignment):
+            actual = mask(cls.from_tabular_msa(alignment),
+                          min_conservation=0.0, trim_terminal_gaps=True)
+            self.assertEqual(actual, cls.from_tabular_msa(expected))
+        actual = mask(alignment, min_conservation=0.0,
+                      trim_terminal_gaps=True)
+        self.assertEqual(actual, expected)
+
+    def test_trim_terminal_gaps_and_coverage(self):
+        alignment = self._ragged_alignment()
+        actual = mask(alignment, min_conservation=0.0,
+                      min_terminal_coverage=0.75, trim_terminal_gaps=True)
+        self.assertEqual(actual, alignment[:, 3:7])
+
+    def test_trim_terminal_gaps_and_mask(self):
+        alignment = self._ragged_alignment()
+        actual = mask(alignment, max_gap_frequency=0.25,
+                      min_conservation=0.0, trim_terminal_gaps=True)
+        self.assertEqual(actual, alignment[:, 3:7])
+        actual = mask(alignment, min_conservation=0.5,
+                      trim_terminal_gaps=True)
+        self.assertEqual(actual, alignment[:, 3:7])
+
+    def test_error_on_empty_terminal_window(self):
+        alignment = skbio.TabularMSA(
+            [skbio.DNA('AC--', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('--GT', metadata={'id': 'seq2', 'description': ''})])
+        with self.assertRaisesRegex(ValueError,
+                                    '0.00% of positions were retained by '
+                                    'terminal trimming'):
+            mask(alignment, min_conservation=0.0, trim_terminal_gaps=True)
+
+    def _noisy_alignment(self):
+        # Conservation by position: 1, 1/3, 1, 1, 1/3, 1/3, 1/3, 1.
+        return skbio.TabularMSA(
+            [skbio.DNA('AAAAAACA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('ACAAGCGA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('AGAATGTA', metadata={'id': 'seq3', 'description': ''})]
+        )
+
+    def test_windowed_conservation(self):
+        alignment = self._noisy_alignment()
+        # Window means: 7/9, 7/9, 7/9, 5/9, 1/3, 5/9.
+        actual = mask(alignment, min_conservation=0.7, window_size=3)
+        self.assertEqual(actual, alignment[:, :5])
+
+        # The windows are [0, 3), [3, 6) and (aligned with the end) [5, 8),
+        # with means 7/9, 5/9 and 5/9.
+        actual = mask(alignment, min_conservation=0.5, window_size=3,
+                      window_step=3)
+        self.assertEqual(actual, alignment)
+        actual = mask(alignment, min_conservation=0.6, window_size=3,
+                      window_step=3)
+        self.assertEqual(actual, alignment[:, :3])
+
+    def test_windowed_gap_frequency(self):
+        alignment = skbio.TabularMSA(
+            [skbio.DNA('A-A--A', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('AAA--A', metadata={'id': 'seq2', 'description': ''})])
+        actual = mask(alignment, max_gap_frequency=0.25,
+                      min_conservation=0.0, window_size=2)
+        self.assertEqual(actual, alignment[:, :3])
+
+        actual = mask(alignment, max_gap_frequency=0.25,
+                      min_conservation=0.0, window_size=2, window_step=2)
+        self.assertEqual(actual, alignment[:, :2])
+
+    def test_window_size_one(self):
+        alignment = self._noisy_alignment()
+        self.assertEqual(mask(alignment, window_size=1),
+                         mask(alignment))
+
+    def test_window_larger_than_alignment(self):
+        alignment = self._noisy_alignment()
+        actual = mask(alignment, min_conservation=0.6, window_size=100)
+        self.assertEqual(actual, alignment)
+        with self.assertRaisesRegex(ValueError, 'No alignment positions'):
+            mask(alignment, min_conservation=0.7, window_size=100)
+
+    def test_windowed_packed(self):
+        alignment = self._noisy_alignment()
+        expected = mask(alignment, min_conservation=0.7, window_size=3)
+        actual = mask(PackedAlignment.from_tabular_msa(alignment),
+                      min_conservation=0.7, window_size=3)
+        self.assertEqual(actual, PackedAlignment.from_tabular_msa(expected))
+
+    def test_window_means(self):
+        starts, stops = _windows(10, 4, 3)
+        self.assertEqual(list(starts), [0, 3, 6])
+        self.assertEqual(list(stops), [4, 7, 10])
+        scores = np.arange(10, dtype=float)
+        np.testing.assert_allclose(_window_means(scores, starts, stops),
+                                   [1.5, 4.5, 7.5])
+
+    def test_invalid_window(self):
+        alignment = self._noisy_alignment()
+        with self.assertRaisesRegex(ValueError, 'window_size'):
+            mask(alignment, window_size=0)
+        with self.assertRaisesRegex(ValueError, 'window_step'):
+            mask(alignment, window_step=0)
+
+    def test_window_step_greater_than_size(self):
+        alignment = self._noisy_alignment()
+        with self.assertRaisesRegex(ValueError, 'window_step.*3 > 2'):
+            mask(alignment, window_size=2, window_step=3)
+        with self.assertRaisesRegex(ValueError, 'window_step.*2 > 1'):
+            mask(alignment, window_step=2)
+        with self.assertRaisesRegex(ValueError, 'window_step'):
+            compute_mask(alignment, window_size=2, window_step=5)
+
+    def test_window_step_equal_to_size_covers_every_column(self):
+        alignment = skbio.TabularMSA([skbio.DNA('ACGTACGTAC'),
+                                      skbio.DNA('ACGTACGTAC')])
+        self.assertEqual(mask(alignment, window_size=2, window_step=2),
+                         alignment)
+        self.assertEqual(mask(alignment, window_size=3, window_step=3),
+                         alignment)
+
+    def test_invalid_terminal_coverage(self):
+        alignment = self._ragged_alignment()
+        with self.assertRaisesRegex(ValueError, 'min_terminal_coverage'):
+            mask(alignment, min_terminal_coverage=-0.1)
+        with self.assertRaisesRegex(ValueError, 'min_terminal_coverage'):
+            mask(alignment, min_terminal_coverage=1.1)
+
+    def _variable_alignment(self):
+        # Minor allele counts by position: 0, 1, 2, 2, 0, 1. Position 4 has
+        # an N, and position 5 a gap, which aren't counted as states.
+        return skbio.TabularMSA(
+            [skbio.DNA('AAAAAA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('AAAAAA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('ACCCNC', metadata={'id': 'seq3', 'description': ''}),
+             skbio.DNA('AAGCA-', metadata={'id': 'seq4', 'description': ''})]
+        )
+
+    def test_min_minor_allele_count(self):
+        alignment = self._variable_alignment()
+        actual = mask(alignment, min_conservation=0.0,
+                      min_minor_allele_count=1)
+        self.assertEqual(actual, alignment[:, [1, 2, 3, 5]])
+        actual = mask(alignment, min_conservation=0.0,
+                      min_minor_allele_count=2)
+        self.assertEqual(actual, alignment[:, 2:4])
+
+    def test_parsimony_informative(self):
+        alignment = self._variable_alignment()
+        actual = mask(alignment, min_conservation=0.0,
+                      parsimony_informative=True)
+        self.assertEqual(actual, alignment[:, 3:4])
+
+    def test_site_filters_combined_with_gap_mask(self):
+        alignment = self._variable_alignment()
+        actual = mask(alignment, max_gap_frequency=0.0, min_conservation=0.0,
+                      min_minor_allele_count=1)
+        self.assertEqual(actual, alignment[:, 1:4])
+
+    def test_site_filters_packed(self):
+        alignment = self._variable_alignment()
+        packed = PackedAlignment.from_tabular_msa(alignment)
+        for kwargs in [{'min_minor_allele_count': 2},
+                       {'parsimony_informative': True}]:
+            expected = mask(alignment, min_conservation=0.0, **kwargs)
+            actual = mask(packed, min_conservation=0.0, **kwargs)
+            self.assertEqual(actual,
+                             PackedAlignment.from_tabular_msa(expected))
+
+    def test_error_on_no_informative_sites(self):
+        alignment = self._noisy_alignment()
+        with self.assertRaisesRegex(ValueError,
+                                    '0.00% of positions were retained by '
+                                    'the site filter'):
+            mask(alignment, min_conservation=0.0, parsimony_informative=True)
+
+    def test_invalid_min_minor_allele_count(self):
+        alignment = self._variable_alignment()
+        with self.assertRaisesRegex(ValueError, 'min_minor_allele_count'):
+            mask(alignment, min_minor_allele_count=-1)
+
+
+class ComputeMaskTests(unittest.TestCase):
+
+    def setUp(self):
+        self.alignment = skbio.TabularMSA(
+            [skbio.DNA('ACGT-A', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('AC-TTA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('AGGT-C', metadata={'id': 'seq3', 'description': ''})])
+
+    def test_matches_mask(self):
+        for kwargs in [{}, {'max_gap_frequency': 0.0},
+                       {'min_conservation': 0.8},
+                       {'min_conservation': 0.7, 'window_size': 2}]:
+            positions = compute_mask(self.alignment, **kwargs)
+            self.assertEqual(positions.dtype, bool)
+            self.assertEqual(self.alignment[:, positions],
+                             mask(self.alignment, **kwargs))
+
+    def test_column_profile(self):
+        packed = PackedAlignment.from_tabular_msa(self.alignment)
+        profile = _profile_from_counts(packed.column_counts())
+        npt.assert_array_equal(
+            compute_mask(self.alignment, max_gap_frequency=0.0,
+                         column_profile=profile),
+            compute_mask(self.alignment, max_gap_frequency=0.0))
+
+    def test_error_on_empty_mask(self):
+        alignment = skbio.TabularMSA(
+            [skbio.DNA('AC', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('CA', metadata={'id': 'seq2', 'description': ''})])
+        with self.assertRaisesRegex(ValueError, 'No alignment positions'):
+            compute_mask(alignment, min_conservation=1.0)
+
+
+class ApplyMaskTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.alignment = skbio.TabularMSA(
+            [skbio.DNA('ACGT-A', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('AC-TTA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('AGGT-C', metadata={'id': 'seq3', 'description': ''})])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, contents):
+        fp = os.path.join(self.temp_dir.name, 'alignment.fasta')
+        with open(fp, 'w') as fh:
+            fh.write(contents)
+        return AlignedDNAFASTAFormat(fp, mode='r')
+
+    def _read(self, ff):
+        with open(str(ff)) as fh:
+            return fh.read()
+
+    def test_apply_mask(self):
+        positions = np.array([True, False, True, True, False, True])
+        expected = '>seq1\nAGTA\n>seq2\nA-TA\n>seq3\nAGTC\n'
+        for contents in ['>seq1\nACGT-A\n>seq2\nAC-TTA\n>seq3\nAGGT-C\n',
+                         '>seq1\nACG\nT-A\n>seq2 d\nAC-\nTTA\n'
+                         '>seq3\nAGG\nT-C\n']:
+            actual = apply_mask(self._write(contents), positions)
+            self.assertEqual(self._read(actual), expected)
+
+    def test_gaps_and_case_are_normalized(self):
+        positions = np.array([True, False, True, True, False, True])
+        actual = apply_mask(self._write('>seq1\n..gt-A\n>seq2\nAC-T..\n'),
+                            positions)
+        self.assertEqual(self._read(actual), '>seq1\n-GTA\n>seq2\nA-T-\n')
+
+    def test_matches_mask(self):
+        ff = self._write('>seq1\nACGT-A\n>seq2\nAC-TTA\n>seq3\nAGGT-C\n')
+        positions = compute_mask(self.alignment, max_gap_frequency=0.0,
+                                 min_conservation=0.6)
+        actual = PackedAlignment.read(str(apply_mask(ff, positions)))
+        expected = mask(PackedAlignment.from_tabular_msa(self.alignment),
+                        max_gap_frequency=0.0, min_conservation=0.6)
+        self.assertEqual(actual, expected)
+
+    def test_mismatched_mask(self):
+        ff = self._write('>seq1\nACGT-A\n>seq2\nAC-TTA\n')
+        with self.assertRaisesRegex(ValueError, '5 positions.*6 positions'):
+            apply_mask(ff, np.ones(5, dtype=bool))
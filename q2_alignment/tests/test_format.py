@@ -0,0 +1,97 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import unittest
+
+from qiime2.plugin import ValidationError
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_alignment._format import (
+    ColumnProfileFormat, ColumnProfileDirectoryFormat, PositionalMaskFormat,
+    PositionalMaskDirectoryFormat, SequenceOrientationFormat,
+    SequenceOrientationDirectoryFormat)
+
+
+class ColumnProfileFormatTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_valid(self):
+        fp = self.get_data_path('column-profile-1.tsv')
+        ColumnProfileFormat(fp, mode='r').validate()
+
+    def test_directory_format(self):
+        self.assertEqual(
+            ColumnProfileDirectoryFormat.file.pathspec, 'column-profile.tsv')
+
+    def test_bad_header(self):
+        fp = self.get_data_path('column-profile-bad-header.tsv')
+        with self.assertRaisesRegex(ValidationError, 'header'):
+            ColumnProfileFormat(fp, mode='r').validate()
+
+    def test_uneven_counts(self):
+        fp = self.get_data_path('column-profile-uneven-counts.tsv')
+        with self.assertRaisesRegex(ValidationError, 'line 3 sum to 3'):
+            ColumnProfileFormat(fp, mode='r').validate()
+
+
+class PositionalMaskFormatTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_valid(self):
+        fp = self.get_data_path('positional-mask-1.bin')
+        PositionalMaskFormat(fp, mode='r').validate()
+
+    def test_directory_format(self):
+        self.assertEqual(
+            PositionalMaskDirectoryFormat.file.pathspec,
+            'positional-mask.bin')
+
+    def test_bad_header(self):
+        fp = self.get_data_path('column-profile-1.tsv')
+        with self.assertRaisesRegex(ValidationError, 'header'):
+            PositionalMaskFormat(fp, mode='r').validate()
+
+    def test_truncated(self):
+        fp = self.get_data_path('positional-mask-truncated.bin')
+        with self.assertRaisesRegex(ValidationError, 'has 1'):
+            PositionalMaskFormat(fp, mode='r').validate()
+
+    def test_extra_bits(self):
+        fp = self.get_data_path('positional-mask-extra-bits.bin')
+        with self.assertRaisesRegex(ValidationError, 'beyond'):
+            PositionalMaskFormat(fp, mode='r').validate()
+
+
+class SequenceOrientationFormatTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_valid(self):
+        fp = self.get_data_path('sequence-orientation-1.tsv')
+        SequenceOrientationFormat(fp, mode='r').validate()
+
+    def test_directory_format(self):
+        self.assertEqual(
+            SequenceOrientationDirectoryFormat.file.pathspec,
+            'sequence-orientation.tsv')
+
+    def test_bad_header(self):
+        fp = self.get_data_path('column-profile-1.tsv')
+        with self.assertRaisesRegex(ValidationError, 'header'):
+            SequenceOrientationFormat(fp, mode='r').validate()
+
+    def test_bad_flag(self):
+        fp = self.get_data_path('sequence-orientation-bad-flag.tsv')
+        with self.assertRaisesRegex(ValidationError, 'True or False'):
+            SequenceOrientationFormat(fp, mode='r').validate()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import subprocess
+import sys
+import unittest
+
+import q2_alignment
+
+
+# Importing the package (e.g., during plugin discovery) must stay cheap. The
+# budget is generous so that it only trips if a heavy dependency creeps back
+# into the import path.
+IMPORT_BUDGET_SECONDS = 0.5
+HEAVY_MODULES = ['numpy', 'skbio', 'q2_types', 'qiime2']
+# Loading the plugin necessarily imports QIIME 2, q2-types (and so skbio and
+# pandas) and the modules defining view types, but the actions'
+# implementations are only imported when an action is run.
+IMPLEMENTATION_MODULES = [
+    'q2_alignment._mafft', 'q2_alignment._filter', 'q2_alignment._kmer',
+    'q2_alignment._fasta', 'q2_alignment._cache', 'q2_alignment._consensus',
+    'q2_alignment._distance', 'q2_alignment._summary',
+    'q2_alignment._metrics', 'q2_alignment._profile']
+# `-X importtime` is only available from Python 3.7.
+requires_importtime = unittest.skipIf(
+    sys.version_info < (3, 7), '-X importtime requires Python 3.7')
+
+
+class LazyImportTests(unittest.TestCase):
+
+    def _import_in_subprocess(self):
+        code = ('import sys\n'
+                'import q2_alignment\n'
+                'print(",".join(m for m in %r if m in sys.modules))\n'
+                % HEAVY_MODULES)
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                                 code], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True)
+        return result.stdout.strip(), result.stderr
+
+    def test_heavy_modules_not_imported(self):
+        loaded, _ = self._import_in_subprocess()
+        self.assertEqual(loaded, '')
+
+    @requires_importtime
+    def test_import_time_budget(self):
+        _, importtime = self._import_in_subprocess()
+        # The last line of `-X importtime` output for the package has its
+        # cumulative import time in microseconds.
+        lines = [line for line in importtime.splitlines()
+                 if line.rstrip().endswith('| q2_alignment')]
+        cumulative_us = int(lines[-1].split('|')[1])
+        self.assertLess(cumulative_us / 1e6, IMPORT_BUDGET_SECONDS)
+
+    @requires_importtime
+    def test_plugin_setup_does_not_import_implementations(self):
+        code = ('import sys\n'
+                'import q2_alignment.plugin_setup\n'
+                'print(",".join(m for m in %r if m in sys.modules))\n'
+                % IMPLEMENTATION_MODULES)
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                                 code], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True)
+        self.assertEqual(result.stdout.strip(), '')
+        # Only the time spent in this package's own modules (e.g.,
+        # registering actions) counts towards the budget, and not that of
+        # QIIME 2 and q2-types.
+        self_us = sum(int(line.split('|')[0].split(':')[1])
+                      for line in result.stderr.splitlines()
+                      if line.split('|')[-1].strip().startswith(
+                          'q2_alignment'))
+        self.assertLess(self_us / 1e6, IMPORT_BUDGET_SECONDS)
+
+    def test_lazy_attributes(self):
+        for name in q2_alignment.__all__:
+            self.assertIn(name, dir(q2_alignment))
+        self.assertTrue(callable(q2_alignment.add_stage_hook))
+
+    def test_unknown_attribute(self):
+        with self.assertRaisesRegex(AttributeError, 'not_an_attribute'):
+            q2_alignment.not_an_attribute
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from q2_alignment._kmer import (_kmer_profiles, _orientations, _partition,
+                                _reverse_complement,
+                                _reverse_complement_kmers)
+
+
+class KmerProfilesTests(unittest.TestCase):
+
+    def test_counts(self):
+        profiles = _kmer_profiles([b'AACA', b'ACGT'], k=2)
+        # AA, AC, CA (A=0, C=1, G=2, T=3)
+        exp = np.zeros(16)
+        exp[[0, 1, 4]] = 1
+        npt.assert_allclose(profiles[0], exp / np.linalg.norm(exp), rtol=1e-6)
+        # AC, CG, GT
+        exp = np.zeros(16)
+        exp[[1, 6, 11]] = 1
+        npt.assert_allclose(profiles[1], exp / np.linalg.norm(exp), rtol=1e-6)
+
+    def test_kmers_do_not_span_sequences(self):
+        profiles = _kmer_profiles([b'A', b'C'], k=2)
+        npt.assert_array_equal(profiles, np.zeros((2, 16)))
+
+    def test_invalid_characters_are_skipped(self):
+        profiles = _kmer_profiles([b'AN-A', b'aa'], k=2)
+        npt.assert_array_equal(profiles[0], np.zeros(16))
+        self.assertEqual(profiles[1][0], 1.0)
+
+    def test_batches(self):
+        sequences = [b'ACGTAC', b'GGGGCC', b'TTAACG', b'ACGTTT', b'CAT']
+        npt.assert_allclose(_kmer_profiles(sequences, k=3, batch_size=2),
+                            _kmer_profiles(sequences, k=3))
+
+
+class PartitionTests(unittest.TestCase):
+
+    def test_partition(self):
+        sequences = [b'AAAAAAAAAA', b'CCCCCCCCCC', b'AAAAAAAAAT',
+                     b'CCCCCCCCCG', b'AAAAAAAATA', b'CCCCCCCCGC']
+        clusters = _partition(_kmer_profiles(sequences, k=2), 3)
+        clusters = sorted(sorted(c.tolist()) for c in clusters)
+        self.assertEqual(clusters, [[0, 2, 4], [1, 3, 5]])
+
+    def test_identical_profiles_are_chunked(self):
+        profiles = _kmer_profiles([b'ACGT'] * 5, k=2)
+        clusters = _partition(profiles, 2)
+        self.assertTrue(all(len(c) <= 2 for c in clusters))
+        self.assertEqual(sorted(np.concatenate(clusters).tolist()),
+                         list(range(5)))
+
+    def test_small_input(self):
+        profiles = _kmer_profiles([b'ACGT', b'TTTT'], k=2)
+        clusters = _partition(profiles, 2)
+        self.assertEqual(len(clusters), 1)
+        npt.assert_array_equal(clusters[0], [0, 1])
+
+
+class OrientationTests(unittest.TestCase):
+
+    forward = [b'ACGGTCAAGCTTAGCA', b'ACGGTCAAGCTTAGCT', b'ACGGTCTAGCTTAGCA',
+               b'TCGGTCAAGCTTAGCA']
+
+    def test_reverse_complement(self):
+        self.assertEqual(_reverse_complement(b'AACGTN-r'), b'y-NACGTT')
+
+    def test_reverse_complement_profiles(self):
+        for k in (1, 2, 3):
+            rc = _reverse_complement_kmers(k)
+            npt.assert_allclose(
+                _kmer_profiles(self.forward, k=k)[:, rc],
+                _kmer_profiles([_reverse_complement(s)
+                                for s in self.forward], k=k))
+
+    def test_majority_orientation(self):
+        sequences = list(self.forward)
+        sequences[1] = _reverse_complement(sequences[1])
+        reverse, forward_similarity, reverse_similarity = _orientations(
+            _kmer_profiles(sequences))
+        npt.assert_array_equal(reverse, [False, True, False, False])
+        self.assertTrue((reverse_similarity[reverse] >
+                         forward_similarity[reverse]).all())
+
+    def test_reference(self):
+        # Without a reference, the reversed sequences are the majority.
+        sequences = [_reverse_complement(s) for s in self.forward[:3]] + \
+            self.forward[3:]
+        reverse, _, _ = _orientations(_kmer_profiles(sequences))
+        npt.assert_array_equal(reverse, [False, False, False, True])
+        reverse, _, _ = _orientations(_kmer_profiles(sequences),
+                                      _kmer_profiles(self.forward[:1]))
+        npt.assert_array_equal(reverse, [True, True, True, False])
+
+    def test_no_kmers(self):
+        reverse, _, _ = _orientations(_kmer_profiles([b'NNNN', b'A']))
+        npt.assert_array_equal(reverse, [False, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,16 +5,26 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import gzip
+import io
+import json
 import os
+import shutil
 import unittest
 import subprocess
+from contextlib import redirect_stdout
+from unittest import mock
 
 import skbio
 from qiime2.plugin.testing import TestPluginBase
 from q2_types.feature_data import DNAFASTAFormat, AlignedDNAFASTAFormat
 from qiime2.util import redirected_stdio
 
-from q2_alignment import mafft, mafft_add
+from q2_alignment import (
+    mafft, mafft_add, mafft_merge, align_and_mask,
+    align_and_mask_with_alignment, mafft_with_profile,
+    mafft_add_with_profile, mafft_with_orientation,
+    mafft_add_with_orientation)
 from q2_alignment._mafft import run_command
 
 
@@ -50,6 +60,41 @@ class MafftTests(TestPluginBase):
                             constructor=skbio.DNA)
         self.assertEqual(obs, exp)
 
+    def test_mafft_gzipped_input(self):
+        _, exp = self._prepare_sequence_data()
+        input_fp = os.path.join(self.temp_dir.name, 'sequences.fasta.gz')
+        with open(self.get_data_path('unaligned-dna-sequences-1.fasta'),
+                  'rb') as in_f, gzip.open(input_fp, 'wb') as out_f:
+            shutil.copyfileobj(in_f, out_f)
+        input_sequences = DNAFASTAFormat(input_fp, mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result = mafft(input_sequences)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+        self.assertEqual(obs, exp)
+
+    def test_mafft_scratch_dir(self):
+        input_sequences, exp = self._prepare_sequence_data()
+        scratch_dir = os.path.join(self.temp_dir.name, 'scratch')
+        os.mkdir(scratch_dir)
+
+        with redirected_stdio(stderr=os.devnull):
+            result = mafft(input_sequences, scratch_dir=scratch_dir)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+        self.assertEqual(obs, exp)
+        self.assertEqual(os.listdir(scratch_dir), [])
+
+    def test_mafft_scratch_dir_insufficient_space(self):
+        input_sequences, _ = self._prepare_sequence_data()
+        usage = shutil.disk_usage(self.temp_dir.name)._replace(free=0)
+
+        with mock.patch('q2_alignment._mafft.shutil.disk_usage',
+                        return_value=usage):
+            with self.assertRaisesRegex(ValueError, 'not enough free space'):
+                mafft(input_sequences, scratch_dir=self.temp_dir.name)
+
     def test_long_ids_are_not_truncated(self):
         input_fp = self.get_data_path('unaligned-long-ids.fasta')
         input_sequences = DNAFASTAFormat(input_fp, mode='r')
@@ -72,6 +117,34 @@ class MafftTests(TestPluginBase):
             with redirected_stdio(stderr=os.devnull):
                 mafft(input_sequences)
 
+    def test_mafft_clustered(self):
+        input_fp = os.path.join(self.temp_dir.name, 'clustered.fasta')
+        with open(input_fp, 'w') as f:
+            f.write('>a1\nAAAAAAAAAATG\n>c1\nCCCCCCCCCGG\n'
+                    '>a2\nAAAAAAAAATG\n>c2\nCCCCCCCCCCGG\n'
+                    '>a3\nAAAAAAAAAAATG\n>c3\nCCCCCCCCGG\n')
+        input_sequences = DNAFASTAFormat(input_fp, mode='r')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            result = mafft(input_sequences, max_cluster_size=3)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+
+        self.assertEqual([s.metadata['id'] for s in obs],
+                         ['a1', 'c1', 'a2', 'c2', 'a3', 'c3'])
+        self.assertEqual([str(s.degap()) for s in obs],
+                         ['AAAAAAAAAATG', 'CCCCCCCCCGG', 'AAAAAAAAATG',
+                          'CCCCCCCCCCGG', 'AAAAAAAAAAATG', 'CCCCCCCCGG'])
+
+    def test_mafft_clustered_single_cluster(self):
+        input_sequences, exp = self._prepare_sequence_data()
+
+        with redirected_stdio(stderr=os.devnull):
+            result = mafft(input_sequences, max_cluster_size=2)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+        self.assertEqual(obs, exp)
+
     def test_mafft_parttree_exception(self):
         input_fp = os.path.join(self.temp_dir.name, 'million.fasta')
         with open(input_fp, "w") as f:
@@ -114,6 +187,147 @@ class MafftAddTests(TestPluginBase):
                             constructor=skbio.DNA)
         self.assertEqual(obs, exp)
 
+    def test_mafft_add_gzipped_input(self):
+        alignment, sequences, exp = self._prepare_sequence_data()
+        alignment_fp = os.path.join(self.temp_dir.name, 'alignment.fasta.gz')
+        with open(str(alignment), 'rb') as in_f, \
+                gzip.open(alignment_fp, 'wb') as out_f:
+            shutil.copyfileobj(in_f, out_f)
+        alignment = AlignedDNAFASTAFormat(alignment_fp, mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result = mafft_add(alignment, sequences)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+        self.assertEqual(obs, exp)
+
+    def test_mafft_add_scratch_dir(self):
+        alignment, sequences, exp = self._prepare_sequence_data()
+
+        with redirected_stdio(stderr=os.devnull):
+            result = mafft_add(alignment, sequences,
+                               scratch_dir=self.temp_dir.name)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+        self.assertEqual(obs, exp)
+
+    def test_mafft_add_in_chunks(self):
+        alignment, sequences, exp = self._prepare_sequence_data()
+        checkpoint_dir = os.path.join(self.temp_dir.name, 'checkpoints')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            result = mafft_add(alignment, sequences, chunk_size=1,
+                               checkpoint_dir=checkpoint_dir)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+        self.assertEqual([s.metadata['id'] for s in obs],
+                         ['aln-seq-1', 'aln-seq-2', 'seq1', 'seq2'])
+        self.assertEqual([str(s.degap()) for s in obs],
+                         ['AGGGGG', 'AGGGGGG', 'AGGGGGG', 'GGGGGG'])
+        self.assertTrue(os.path.exists(
+            os.path.join(checkpoint_dir, 'manifest.json')))
+
+    def test_mafft_add_keeps_only_latest_checkpoint(self):
+        alignment, sequences, _ = self._prepare_sequence_data()
+        checkpoint_dir = os.path.join(self.temp_dir.name, 'checkpoints')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            mafft_add(alignment, sequences, chunk_size=1,
+                      checkpoint_dir=checkpoint_dir)
+        self.assertEqual(sorted(os.listdir(checkpoint_dir)),
+                         ['alignment-000001.fasta', 'manifest.json'])
+        with open(os.path.join(checkpoint_dir, 'manifest.json')) as fh:
+            manifest = json.load(fh)
+        self.assertEqual(len(manifest['chunks']), 2)
+        self.assertEqual(manifest['command'][0], 'mafft')
+
+    def _first_sequence(self, sequences):
+        # A file of just the first of `sequences`, i.e., its first chunk.
+        first = DNAFASTAFormat()
+        with open(str(sequences)) as in_fh, open(str(first), 'w') as out_fh:
+            out_fh.write(''.join(in_fh.readlines()[:2]))
+        return first
+
+    def test_mafft_add_resumes_from_checkpoint(self):
+        alignment, sequences, _ = self._prepare_sequence_data()
+        checkpoint_dir = os.path.join(self.temp_dir.name, 'checkpoints')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            exp = mafft_add(alignment, sequences, chunk_size=1)
+            # An interrupted run, which only completed the first chunk.
+            mafft_add(alignment, self._first_sequence(sequences),
+                      chunk_size=1, checkpoint_dir=checkpoint_dir)
+
+        stdout = io.StringIO()
+        with redirected_stdio(stderr=os.devnull), redirect_stdout(stdout):
+            result = mafft_add(alignment, sequences, chunk_size=1,
+                               checkpoint_dir=checkpoint_dir)
+        self.assertIn('checkpoint for chunk 0', stdout.getvalue())
+        self.assertEqual(sorted(os.listdir(checkpoint_dir)),
+                         ['alignment-000001.fasta', 'manifest.json'])
+
+        with open(str(exp)) as fh:
+            exp = fh.read()
+        with open(str(result)) as fh:
+            obs = fh.read()
+        self.assertEqual(obs, exp)
+
+    def test_mafft_add_recomputes_corrupted_checkpoint(self):
+        alignment, sequences, _ = self._prepare_sequence_data()
+        checkpoint_dir = os.path.join(self.temp_dir.name, 'checkpoints')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            exp = mafft_add(alignment, sequences, chunk_size=1,
+                            checkpoint_dir=checkpoint_dir)
+        with open(os.path.join(checkpoint_dir,
+                               'alignment-000001.fasta'), 'a') as fh:
+            fh.write('>corrupted\nAAAA\n')
+
+        stdout = io.StringIO()
+        with redirected_stdio(stderr=os.devnull), redirect_stdout(stdout):
+            result = mafft_add(alignment, sequences, chunk_size=1,
+                               checkpoint_dir=checkpoint_dir)
+        self.assertNotIn('Resuming', stdout.getvalue())
+
+        with open(str(exp)) as fh:
+            exp = fh.read()
+        with open(str(result)) as fh:
+            obs = fh.read()
+        self.assertEqual(obs, exp)
+
+    def test_mafft_add_refuses_resume_with_different_command(self):
+        alignment, sequences, _ = self._prepare_sequence_data()
+        checkpoint_dir = os.path.join(self.temp_dir.name, 'checkpoints')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            mafft_add(alignment, self._first_sequence(sequences),
+                      chunk_size=1, checkpoint_dir=checkpoint_dir)
+            with self.assertRaisesRegex(ValueError, 'different mafft'):
+                mafft_add(alignment, sequences, chunk_size=1,
+                          checkpoint_dir=checkpoint_dir, parttree=True)
+
+    def test_mafft_add_resumes_with_different_n_threads(self):
+        alignment, sequences, _ = self._prepare_sequence_data()
+        checkpoint_dir = os.path.join(self.temp_dir.name, 'checkpoints')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            mafft_add(alignment, self._first_sequence(sequences),
+                      chunk_size=1, checkpoint_dir=checkpoint_dir)
+        with open(os.path.join(checkpoint_dir, 'manifest.json')) as fh:
+            self.assertNotIn('--thread', json.load(fh)['command'])
+
+        stdout = io.StringIO()
+        with redirected_stdio(stderr=os.devnull), redirect_stdout(stdout):
+            mafft_add(alignment, sequences, chunk_size=1,
+                      checkpoint_dir=checkpoint_dir, n_threads=2)
+        self.assertIn('checkpoint for chunk 0', stdout.getvalue())
+
+    def test_checkpoint_dir_requires_chunk_size(self):
+        alignment, sequences, _ = self._prepare_sequence_data()
+
+        with self.assertRaisesRegex(ValueError, 'chunk_size'):
+            mafft_add(alignment, sequences, checkpoint_dir=self.temp_dir.name)
+
     def test_duplicate_input_ids_in_unaligned(self):
         input_fp = self.get_data_path('unaligned-duplicate-ids.fasta')
         sequences = DNAFASTAFormat(input_fp, mode='r')
@@ -180,6 +394,227 @@ class MafftAddTests(TestPluginBase):
         self.assertIn('seq2', obs)
 
 
+class MafftMergeTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_mafft_merge(self):
+        alignment1 = AlignedDNAFASTAFormat(
+            self.get_data_path('aligned-dna-sequences-1.fasta'), mode='r')
+        alignment2 = AlignedDNAFASTAFormat(
+            self.get_data_path('aligned-long-ids.fasta'), mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result = mafft_merge([alignment1, alignment2])
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+
+        self.assertEqual([s.metadata['id'] for s in obs],
+                         ['aln-seq-1', 'aln-seq-2', 'a'*250, 'b'*250])
+        self.assertEqual(str(obs[0].degap()), 'AGGGGG')
+        self.assertEqual(str(obs[1].degap()), 'AGGGGGG')
+
+    def test_duplicate_ids_across_alignments(self):
+        alignment1 = AlignedDNAFASTAFormat(
+            self.get_data_path('aligned-dna-sequences-1.fasta'), mode='r')
+        alignment2 = AlignedDNAFASTAFormat(
+            self.get_data_path('aligned-duplicate-ids-2.fasta'), mode='r')
+
+        with self.assertRaisesRegex(ValueError, 'the aligned.*aln-seq-1'):
+            with redirected_stdio(stderr=os.devnull):
+                mafft_merge([alignment1, alignment2])
+
+
+class AlignAndMaskTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def _read(self, result):
+        with open(str(result)) as fh:
+            return fh.read()
+
+    def test_align_and_mask(self):
+        input_sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-dna-sequences-1.fasta'), mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result = align_and_mask(input_sequences)
+        self.assertEqual(self._read(result),
+                         '>seq1\nAGGGGGG\n>seq2\n-GGGGGG\n')
+
+    def test_align_and_mask_drops_gapped_positions(self):
+        input_sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-dna-sequences-1.fasta'), mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result = align_and_mask(input_sequences, max_gap_frequency=0.0)
+        self.assertEqual(self._read(result),
+                         '>seq1\nGGGGGG\n>seq2\nGGGGGG\n')
+
+    def test_align_and_mask_with_alignment(self):
+        input_sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-dna-sequences-1.fasta'), mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result, alignment = align_and_mask_with_alignment(
+                input_sequences, max_gap_frequency=0.0)
+        self.assertEqual(self._read(result),
+                         '>seq1\nGGGGGG\n>seq2\nGGGGGG\n')
+        self.assertEqual(self._read(alignment),
+                         '>seq1\nAGGGGGG\n>seq2\n-GGGGGG\n')
+
+    def test_align_and_mask_forwards_mask_parameters(self):
+        input_sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-dna-sequences-1.fasta'), mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result = align_and_mask(input_sequences, trim_terminal_gaps=True)
+        self.assertEqual(self._read(result),
+                         '>seq1\nGGGGGG\n>seq2\nGGGGGG\n')
+
+        with mock.patch('q2_alignment._mafft._mask',
+                        side_effect=ValueError('masked')) as mask_:
+            with redirected_stdio(stderr=os.devnull):
+                with self.assertRaisesRegex(ValueError, 'masked'):
+                    align_and_mask(input_sequences, min_terminal_coverage=0.5,
+                                   window_size=3, window_step=2,
+                                   min_minor_allele_count=1,
+                                   parsimony_informative=True)
+        self.assertEqual(mask_.call_args[0][1:],
+                         (1.0, 0.4, None, 0.5, False, 3, 2, 1, True))
+
+    def test_align_and_mask_long_ids(self):
+        input_sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-long-ids.fasta'), mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result = align_and_mask(input_sequences)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+        self.assertEqual([s.metadata['id'] for s in obs], ['a'*250, 'b'*250])
+
+    def test_align_and_mask_clustered(self):
+        input_fp = os.path.join(self.temp_dir.name, 'clustered.fasta')
+        with open(input_fp, 'w') as f:
+            f.write('>a1\nAAAAAAAAAATG\n>c1\nCCCCCCCCCGG\n'
+                    '>a2\nAAAAAAAAATG\n>c2\nCCCCCCCCCCGG\n'
+                    '>a3\nAAAAAAAAAAATG\n>c3\nCCCCCCCCGG\n')
+        input_sequences = DNAFASTAFormat(input_fp, mode='r')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            result = align_and_mask(input_sequences, max_cluster_size=3,
+                                    min_conservation=0.0)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+
+        self.assertEqual([s.metadata['id'] for s in obs],
+                         ['a1', 'c1', 'a2', 'c2', 'a3', 'c3'])
+        self.assertEqual([str(s.degap()) for s in obs],
+                         ['AAAAAAAAAATG', 'CCCCCCCCCGG', 'AAAAAAAAATG',
+                          'CCCCCCCCCCGG', 'AAAAAAAAAAATG', 'CCCCCCCCGG'])
+
+    def test_invalid_mask_parameters_checked_before_aligning(self):
+        input_sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-dna-sequences-1.fasta'), mode='r')
+
+        with mock.patch('q2_alignment._mafft.run_command') as run:
+            with self.assertRaisesRegex(ValueError, 'max_gap_frequency'):
+                align_and_mask(input_sequences, max_gap_frequency=1.5)
+            with self.assertRaisesRegex(ValueError, 'window_step'):
+                align_and_mask(input_sequences, window_size=2, window_step=3)
+        run.assert_not_called()
+
+
+class ColumnProfileTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_mafft_with_profile(self):
+        input_sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-dna-sequences-1.fasta'), mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result, profile = mafft_with_profile(input_sequences)
+        with open(str(result)) as fh:
+            self.assertEqual(fh.read(), '>seq1\nAGGGGGG\n>seq2\n-GGGGGG\n')
+        self.assertEqual(profile.shape, (7, 16))
+        self.assertEqual(list(profile['-']), [1, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(list(profile['A']), [1, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(list(profile['G']), [0, 2, 2, 2, 2, 2, 2])
+
+    def test_mafft_add_with_profile(self):
+        alignment = AlignedDNAFASTAFormat(
+            self.get_data_path('aligned-dna-sequences-1.fasta'), mode='r')
+        sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-dna-sequences-1.fasta'), mode='r')
+
+        with redirected_stdio(stderr=os.devnull):
+            result, profile = mafft_add_with_profile(alignment, sequences)
+        obs = skbio.io.read(str(result), into=skbio.TabularMSA,
+                            constructor=skbio.DNA)
+        self.assertEqual(profile.shape, (obs.shape.position, 16))
+        self.assertTrue((profile.sum(axis=1) == 4).all())
+        for i, column in enumerate(obs.iter_positions()):
+            for char, count in column.frequencies().items():
+                self.assertEqual(profile.loc[i, char], count)
+
+
+class OrientationTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def _read(self, fp):
+        return {seq.metadata['id']: str(seq.degap())
+                for seq in skbio.io.read(fp, format='fasta',
+                                         constructor=skbio.DNA)}
+
+    def test_mafft_with_orientation(self):
+        input_fp = self.get_data_path('unaligned-mixed-orientation.fasta')
+        input_sequences = DNAFASTAFormat(input_fp, mode='r')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            result, orientation = mafft_with_orientation(input_sequences)
+        self.assertEqual(list(orientation.index),
+                         ['seq1', 'seq2', 'seq3', 'seq4'])
+        self.assertEqual(list(orientation['reverse_complemented']),
+                         [False, False, True, False])
+        exp = self._read(input_fp)
+        exp['seq3'] = str(skbio.DNA(exp['seq3']).reverse_complement())
+        self.assertEqual(self._read(str(result)), exp)
+
+    def test_mafft_with_orientation_reference(self):
+        input_sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-mixed-orientation.fasta'),
+            mode='r')
+        # Orient the sequences to match seq3, rather than the majority.
+        seq3 = self._read(str(input_sequences))['seq3']
+        reference = AlignedDNAFASTAFormat()
+        with open(str(reference), 'w') as fh:
+            fh.write('>ref\n%s\n' % seq3)
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            _, orientation = mafft_with_orientation(input_sequences,
+                                                    reference)
+        self.assertEqual(list(orientation['reverse_complemented']),
+                         [True, True, False, True])
+
+    def test_mafft_add_with_orientation(self):
+        alignment = AlignedDNAFASTAFormat(
+            self.get_data_path('aligned-dna-sequences-1.fasta'), mode='r')
+        sequences = DNAFASTAFormat(
+            self.get_data_path('unaligned-dna-sequences-1.fasta'), mode='r')
+
+        with redirected_stdio(stdout=os.devnull, stderr=os.devnull):
+            result, orientation = mafft_add_with_orientation(alignment,
+                                                             sequences)
+        self.assertEqual(list(orientation.index), ['seq1', 'seq2'])
+        self.assertFalse(orientation['reverse_complemented'].any())
+        with redirected_stdio(stderr=os.devnull):
+            exp = mafft_add(alignment, sequences)
+        with open(str(result)) as obs_fh, open(str(exp)) as exp_fh:
+            self.assertEqual(obs_fh.read(), exp_fh.read())
+
+
 class RunCommandTests(TestPluginBase):
 
     package = 'q2_alignment.tests'
@@ -0,0 +1,160 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import tracemalloc
+import unittest
+import unittest.mock
+
+import numpy as np
+import numpy.testing as npt
+import skbio
+
+from q2_alignment import mask, MappedAlignment, PackedAlignment
+from q2_alignment import _mapped
+
+
+class MappedAlignmentTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.fp = os.path.join(self.temp_dir.name, 'alignment.fasta')
+        self.msa = skbio.TabularMSA(
+            [skbio.DNA('ACGT-A', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('AC-TTA', metadata={'id': 'seq2', 'description': ''}),
+             skbio.DNA('AGGTNC', metadata={'id': 'seq3', 'description': ''})])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, contents):
+        with open(self.fp, 'w') as fh:
+            fh.write(contents)
+
+    def test_fixed_width_is_a_view(self):
+        PackedAlignment.from_tabular_msa(self.msa).write(self.fp)
+        alignment = MappedAlignment.read(self.fp)
+        self.assertEqual(alignment.ids, ['seq1', 'seq2', 'seq3'])
+        self.assertEqual(alignment.shape, (3, 6))
+        # Rows are strided over the headers rather than copied.
+        self.assertEqual(alignment.chars.strides, (len('>seq1\nACGT-A\n'), 1))
+        self.assertFalse(alignment.chars.flags.writeable)
+        self.assertEqual(alignment.to_packed(),
+                         PackedAlignment.from_tabular_msa(self.msa))
+
+    def test_no_trailing_newline(self):
+        self._write('>seq1\nACGT\n>seq2\nAC-T')
+        alignment = MappedAlignment.read(self.fp)
+        self.assertEqual(alignment.chars.strides, (len('>seq1\nACGT\n'), 1))
+        npt.assert_array_equal(alignment.chars,
+                               [list(b'ACGT'), list(b'AC-T')])
+
+    def test_other_layouts_are_copied(self):
+        expected = PackedAlignment.from_tabular_msa(self.msa)
+        for contents in [
+                # wrapped
+                '>seq1\nACG\nT-A\n>seq2\nAC-\nTTA\n>seq3\nAGG\nTNC\n',
+                # IDs of different lengths, and descriptions
+                '>seq1 x\nACGT-A\n>seq2\nAC-TTA\n>seq3 yz\nAGGTNC\n',
+                # blank lines and carriage returns
+                '\n>seq1\r\nACGT-A\r\n\n>seq2\r\nAC-TTA\r\n'
+                '>seq3\r\nAGGTNC\r\n']:
+            self._write(contents)
+            alignment = MappedAlignment.read(self.fp)
+            self.assertEqual(alignment.ids, expected.ids)
+            self.assertTrue(alignment.chars.flags.c_contiguous)
+            self.assertEqual(alignment.to_packed(), expected)
+
+    def test_copy_memory_is_bounded(self):
+        # Wrapped records are copied a few at a time, so beyond the output,
+        # memory use doesn't grow with the size of the file.
+        rng = np.random.default_rng(0)
+        chars = rng.choice(list(b'ACGT-'), size=(400, 5000)).astype(np.uint8)
+        with open(self.fp, 'wb') as fh:
+            for i, row in enumerate(chars):
+                fh.write(b'>seq%d description\n' % i)
+                for start in range(0, len(row), 60):
+                    fh.write(row[start:start + 60].tobytes() + b'\n')
+        file_size = os.path.getsize(self.fp)
+
+        with unittest.mock.patch.object(_mapped, '_BLOCK_BYTES', 2 ** 14):
+            tracemalloc.start()
+            try:
+                alignment = MappedAlignment.read(self.fp)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        self.assertEqual(alignment.ids, ['seq%d' % i for i in range(400)])
+        npt.assert_array_equal(alignment.chars, chars)
+        self.assertLess(peak, chars.nbytes + file_size // 4)
+
+    def test_column_counts(self):
+        PackedAlignment.from_tabular_msa(self.msa).write(self.fp)
+        alignment = MappedAlignment.read(self.fp)
+        expected = PackedAlignment.from_tabular_msa(self.msa).column_counts()
+        npt.assert_array_equal(alignment.column_counts(), expected)
+        npt.assert_array_equal(
+            alignment.column_counts(block_elements=2 * alignment.n_positions),
+            expected)
+
+    def test_mask(self):
+        PackedAlignment.from_tabular_msa(self.msa).write(self.fp)
+        alignment = MappedAlignment.read(self.fp)
+        expected = mask(self.msa, max_gap_frequency=0.0,
+                        min_conservation=0.5)
+        actual = mask(alignment, max_gap_frequency=0.0, min_conservation=0.5)
+        self.assertEqual(actual, PackedAlignment.from_tabular_msa(expected))
+
+        expected = mask(self.msa, min_conservation=0.0,
+                        trim_terminal_gaps=True)
+        actual = mask(alignment, min_conservation=0.0,
+                      trim_terminal_gaps=True)
+        self.assertEqual(actual, PackedAlignment.from_tabular_msa(expected))
+
+    def test_write(self):
+        self._write('>seq1\nACG\nT-A\n>seq2\nAC-\nTTA\n>seq3\nAGG\nTNC\n')
+        alignment = MappedAlignment.read(self.fp)
+        out_fp = os.path.join(self.temp_dir.name, 'out.fasta')
+        alignment.write(out_fp)
+        with open(out_fp) as fh:
+            self.assertEqual(fh.read(), '>seq1\nACGT-A\n>seq2\nAC-TTA\n'
+                                        '>seq3\nAGGTNC\n')
+
+    def test_empty(self):
+        self._write('')
+        self.assertEqual(MappedAlignment.read(self.fp).shape, (0, 0))
+
+    def test_unaligned(self):
+        self._write('>seq1\nACGT\n>seq2\nACG\n')
+        with self.assertRaisesRegex(ValueError, "'seq2' has length 3"):
+            MappedAlignment.read(self.fp)
+
+    def test_not_fasta(self):
+        self._write('ACGT\n>seq1\nACGT\n')
+        with self.assertRaisesRegex(ValueError, 'header'):
+            MappedAlignment.read(self.fp)
+
+    def test_invalid_characters(self):
+        self._write('>seq1\nACGT\n>seq2\nACGX\n')
+        alignment = MappedAlignment.read(self.fp)
+        with self.assertRaisesRegex(ValueError, 'X'):
+            alignment.column_counts()
+
+    def test_eq(self):
+        self._write('>seq1\nACGT\n>seq2\nAC-T\n')
+        alignment = MappedAlignment.read(self.fp)
+        self.assertEqual(alignment, MappedAlignment(
+            ['seq1', 'seq2'], np.array([list(b'ACGT'), list(b'AC-T')],
+                                       dtype=np.uint8)))
+        self.assertNotEqual(alignment, alignment.to_packed())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import skbio
+
+from q2_alignment import mask
+from q2_alignment._metrics import METRICS_ENV_VAR, _count, _metered
+
+
+class MetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.alignment = skbio.TabularMSA(
+            [skbio.DNA('ACGT-', metadata={'id': 'a'}),
+             skbio.DNA('ACGA-', metadata={'id': 'b'}),
+             skbio.DNA('ACGTT', metadata={'id': 'c'})])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _mask(self, fp, **kwargs):
+        with mock.patch.dict(os.environ, {METRICS_ENV_VAR: fp}):
+            return mask(self.alignment, **kwargs)
+
+    def _read_prometheus(self, fp):
+        samples = {}
+        with open(fp) as fh:
+            for line in fh:
+                if not line.startswith('#'):
+                    key, value = line.rsplit(' ', 1)
+                    samples[key] = float(value)
+        return samples
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop(METRICS_ENV_VAR, None)
+            mask(self.alignment)
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_json_lines(self):
+        fp = os.path.join(self.temp_dir.name, 'metrics.jsonl')
+        self._mask(fp, max_gap_frequency=0.5)
+        self._mask(fp)
+
+        with open(fp) as fh:
+            records = [json.loads(line) for line in fh]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['action'], 'mask')
+        self.assertEqual(records[0]['counters'],
+                         {'runs': 1, 'sequences_in': 3, 'sequences_out': 3,
+                          'positions_in': 5, 'positions_out': 4})
+        self.assertEqual(records[1]['counters']['positions_out'], 5)
+        self.assertEqual(set(records[0]['stage_seconds']),
+                         {'mask.frequencies', 'mask.gap_mask',
+                          'mask.conservation_mask', 'mask.apply_mask',
+                          'total'})
+
+    def test_prometheus(self):
+        fp = os.path.join(self.temp_dir.name, 'q2_alignment.prom')
+        self._mask(fp, max_gap_frequency=0.5)
+        self._mask(fp)
+
+        samples = self._read_prometheus(fp)
+        self.assertEqual(samples['q2_alignment_runs_total{action="mask"}'], 2)
+        self.assertEqual(
+            samples['q2_alignment_positions_in_total{action="mask"}'], 10)
+        self.assertEqual(
+            samples['q2_alignment_positions_out_total{action="mask"}'], 9)
+        self.assertEqual(
+            samples['q2_alignment_stage_duration_seconds_count'
+                    '{action="mask",stage="mask.frequencies"}'], 2)
+        self.assertEqual(
+            samples['q2_alignment_stage_duration_seconds_bucket'
+                    '{action="mask",le="+Inf",stage="total"}'], 2)
+        with open(fp) as fh:
+            text = fh.read()
+        self.assertIn('# TYPE q2_alignment_runs_total counter\n', text)
+        self.assertIn(
+            '# TYPE q2_alignment_stage_duration_seconds histogram\n', text)
+        self.assertFalse(os.path.exists(fp + '.tmp'))
+
+    def test_failure(self):
+        fp = os.path.join(self.temp_dir.name, 'q2_alignment.prom')
+        with self.assertRaisesRegex(ValueError, 'max_gap_frequency'):
+            self._mask(fp, max_gap_frequency=2.0)
+
+        samples = self._read_prometheus(fp)
+        self.assertEqual(
+            samples['q2_alignment_failures_total{action="mask"}'], 1)
+        self.assertEqual(samples['q2_alignment_runs_total{action="mask"}'], 0)
+
+    def test_nested(self):
+        fp = os.path.join(self.temp_dir.name, 'metrics.jsonl')
+        with mock.patch.dict(os.environ, {METRICS_ENV_VAR: fp}):
+            with _metered('outer'):
+                _count('sequences_in', 2)
+                with _metered('inner'):
+                    _count('sequences_in', 3)
+
+        with open(fp) as fh:
+            records = [json.loads(line) for line in fh]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['action'], 'outer')
+        self.assertEqual(records[0]['counters']['sequences_in'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+import skbio
+
+from q2_alignment._packed import (ALPHABET, PackedAlignment, _DECODE,
+                                  _decode_packed, _pack, _unpack)
+
+
+def _msa(*seqs):
+    return skbio.TabularMSA(
+        [skbio.DNA(seq, metadata={'id': 'seq%d' % (i + 1), 'description': ''})
+         for i, seq in enumerate(seqs)])
+
+
+class PackTests(unittest.TestCase):
+
+    def test_roundtrip_odd_length(self):
+        codes = np.array([[1, 2, 3], [15, 0, 7]], dtype=np.uint8)
+        packed = _pack(codes)
+        npt.assert_array_equal(packed, [[0x12, 0x30], [0xF0, 0x70]])
+        npt.assert_array_equal(_unpack(packed, 3), codes)
+
+    def test_roundtrip_even_length(self):
+        codes = np.arange(16, dtype=np.uint8).reshape(2, 8)
+        npt.assert_array_equal(_unpack(_pack(codes), 8), codes)
+
+    def test_decode_packed(self):
+        codes = np.arange(256, dtype=np.uint8).reshape(16, 16) % 16
+        for n_positions in (15, 16):
+            data = _pack(codes[:, :n_positions])
+            npt.assert_array_equal(_decode_packed(data, n_positions),
+                                   _DECODE[codes[:, :n_positions]])
+
+
+class PackedAlignmentTests(unittest.TestCase):
+
+    def setUp(self):
+        self.msa = _msa('AGA-N', '-GACR', '.GC-N')
+
+    def test_tabular_msa_roundtrip(self):
+        packed = PackedAlignment.from_tabular_msa(self.msa)
+        self.assertEqual(packed.shape.sequence, 3)
+        self.assertEqual(packed.shape.position, 5)
+        self.assertEqual(packed.data.shape, (3, 3))
+        # '.' gaps are packed as '-'
+        self.assertEqual(packed.to_tabular_msa(),
+                         _msa('AGA-N', '-GACR', '-GC-N'))
+
+    def test_invalid_character(self):
+        msa = skbio.TabularMSA([skbio.Protein('AZ', metadata={'id': 'a'})])
+        with self.assertRaisesRegex(ValueError, 'Z'):
+            PackedAlignment.from_tabular_msa(msa)
+
+    def test_inconsistent_data(self):
+        with self.assertRaisesRegex(ValueError, 'one row'):
+            PackedAlignment(['a', 'b'], np.zeros((1, 1)), 2)
+        with self.assertRaisesRegex(ValueError, 'bytes long'):
+            PackedAlignment(['a'], np.zeros((1, 1)), 3)
+
+    def test_column_counts(self):
+        packed = PackedAlignment.from_tabular_msa(self.msa)
+        counts = packed.column_counts(block_elements=6)
+        self.assertEqual(counts.shape, (5, len(ALPHABET)))
+        gap, a, c, g, n, r = (ALPHABET.index(c) for c in b'-ACGNR')
+        exp = np.zeros((5, len(ALPHABET)), dtype=int)
+        exp[0, [a, gap]] = [1, 2]
+        exp[1, g] = 3
+        exp[2, [a, c]] = [2, 1]
+        exp[3, [gap, c]] = [2, 1]
+        exp[4, [n, r]] = [2, 1]
+        npt.assert_array_equal(counts, exp)
+
+    def test_masked(self):
+        packed = PackedAlignment.from_tabular_msa(self.msa)
+        obs = packed.masked([False, True, True, False, True],
+                            block_elements=10)
+        self.assertEqual(obs.to_tabular_msa(),
+                         _msa('GAN', 'GAR', 'GCN'))
+
+    def test_read_write(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fp = os.path.join(temp_dir, 'aln.fasta')
+            self.msa.write(fp)
+            packed = PackedAlignment.read(fp)
+            self.assertEqual(packed,
+                             PackedAlignment.from_tabular_msa(self.msa))
+
+            out_fp = os.path.join(temp_dir, 'out.fasta')
+            packed.write(out_fp, block_size=2)
+            with open(out_fp) as fh:
+                self.assertEqual(fh.read(),
+                                 '>seq1\nAGA-N\n>seq2\n-GACR\n>seq3\n-GC-N\n')
+
+    def test_read_unaligned(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fp = os.path.join(temp_dir, 'seqs.fasta')
+            with open(fp, 'w') as fh:
+                fh.write('>a\nACGT\n>b\nACG\n')
+            with self.assertRaisesRegex(ValueError, 'not aligned'):
+                PackedAlignment.read(fp)
+
+    def test_save_load(self):
+        packed = PackedAlignment.from_tabular_msa(self.msa)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fp = os.path.join(temp_dir, 'aln.npz')
+            packed.save(fp)
+            self.assertEqual(PackedAlignment.load(fp), packed)
+
+
+if __name__ == "__main__":
+    unittest.main()
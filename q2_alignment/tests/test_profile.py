@@ -0,0 +1,106 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import pstats
+import tempfile
+import unittest
+from unittest import mock
+
+import skbio
+
+from q2_alignment import mask, add_stage_hook, remove_stage_hook
+from q2_alignment._profile import _stage, _profiled
+
+
+class StageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.hook = lambda stage, seconds: self.calls.append((stage, seconds))
+        add_stage_hook(self.hook)
+
+    def tearDown(self):
+        remove_stage_hook(self.hook)
+
+    def test_stage(self):
+        with _stage('test.stage'):
+            pass
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.calls[0][0], 'test.stage')
+        self.assertGreaterEqual(self.calls[0][1], 0.0)
+
+    def test_logging(self):
+        with self.assertLogs('q2_alignment', level='DEBUG') as cm:
+            with _stage('test.stage'):
+                pass
+        self.assertIn('test.stage', cm.output[0])
+
+    def test_mask_stages(self):
+        alignment = skbio.TabularMSA(
+            [skbio.DNA('AGA', metadata={'id': 'seq1', 'description': ''}),
+             skbio.DNA('-GA', metadata={'id': 'seq2', 'description': ''})])
+        mask(alignment)
+        self.assertEqual([stage for stage, _ in self.calls],
+                         ['mask.frequencies', 'mask.gap_mask',
+                          'mask.conservation_mask', 'mask.apply_mask'])
+
+    def test_no_hooks(self):
+        remove_stage_hook(self.hook)
+        try:
+            with _stage('test.stage'):
+                pass
+        finally:
+            add_stage_hook(self.hook)
+        self.assertEqual(self.calls, [])
+
+
+class ProfiledTests(unittest.TestCase):
+
+    def test_disabled(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with mock.patch.dict(os.environ,
+                                 {'Q2_ALIGNMENT_PROFILE_DIR': temp_dir}):
+                with _profiled('test'):
+                    pass
+            self.assertEqual(os.listdir(temp_dir), [])
+
+    def test_cprofile(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with mock.patch.dict(os.environ,
+                                 {'Q2_ALIGNMENT_PROFILE': 'cprofile',
+                                  'Q2_ALIGNMENT_PROFILE_DIR': temp_dir}):
+                with _profiled('test'):
+                    sorted(range(10))
+            fps = os.listdir(temp_dir)
+            self.assertEqual(len(fps), 1)
+            self.assertTrue(fps[0].startswith('test-'))
+            self.assertTrue(fps[0].endswith('.prof'))
+            pstats.Stats(os.path.join(temp_dir, fps[0]))
+
+    def test_tracemalloc(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with mock.patch.dict(os.environ,
+                                 {'Q2_ALIGNMENT_PROFILE': 'tracemalloc',
+                                  'Q2_ALIGNMENT_PROFILE_DIR': temp_dir}):
+                with _profiled('test'):
+                    [0] * 1000
+            fps = os.listdir(temp_dir)
+            self.assertEqual(len(fps), 1)
+            with open(os.path.join(temp_dir, fps[0])) as fh:
+                self.assertIn('Peak traced memory', fh.read())
+
+    def test_unknown_profiler(self):
+        with mock.patch.dict(os.environ, {'Q2_ALIGNMENT_PROFILE': 'perf'}):
+            with self.assertRaisesRegex(ValueError, 'perf'):
+                with _profiled('test'):
+                    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import numpy.testing as npt
+import skbio
+
+from q2_alignment._packed import PackedAlignment
+from q2_alignment._sparse import SparseAlignment
+
+
+def _msa(*seqs):
+    return skbio.TabularMSA(
+        [skbio.DNA(seq, metadata={'id': 'seq%d' % (i + 1), 'description': ''})
+         for i, seq in enumerate(seqs)])
+
+
+class SparseAlignmentTests(unittest.TestCase):
+
+    def setUp(self):
+        self.msa = _msa('--AC--G-', '--------', 'TTAC-NN-', '-A------')
+
+    def test_runs(self):
+        sparse = SparseAlignment.from_tabular_msa(self.msa)
+        npt.assert_array_equal(sparse.starts, [2, 6, 0, 5, 1])
+        npt.assert_array_equal(sparse.ends, [4, 7, 4, 7, 2])
+        npt.assert_array_equal(sparse.run_offsets, [0, 2, 2, 4, 5])
+        self.assertEqual(len(sparse.residues), 10)
+        self.assertEqual(sparse.shape.sequence, 4)
+        self.assertEqual(sparse.shape.position, 8)
+
+    def test_tabular_msa_roundtrip(self):
+        sparse = SparseAlignment.from_tabular_msa(self.msa)
+        self.assertEqual(sparse.to_tabular_msa(), self.msa)
+
+    def test_column_counts_match_packed(self):
+        sparse = SparseAlignment.from_tabular_msa(self.msa)
+        packed = PackedAlignment.from_tabular_msa(self.msa)
+        npt.assert_array_equal(sparse.column_counts(),
+                               packed.column_counts())
+
+    def test_masked(self):
+        sparse = SparseAlignment.from_tabular_msa(self.msa)
+        mask = np.array([False, True, True, False, True, True, True, False])
+        obs = sparse.masked(mask)
+        self.assertEqual(obs.to_tabular_msa(), self.msa[:, mask])
+        self.assertEqual(obs, SparseAlignment.from_tabular_msa(
+            self.msa[:, mask]))
+
+    def test_masked_all_gaps(self):
+        sparse = SparseAlignment.from_tabular_msa(self.msa)
+        obs = sparse.masked([True, False, False, False, False, False, False,
+                             True])
+        self.assertEqual(obs.to_tabular_msa(),
+                         _msa('--', '--', 'T-', '--'))
+        self.assertEqual(len(obs.residues), 1)
+
+    def test_residue_blocks(self):
+        # Blocks of runs may end in the middle of a row.
+        sparse = SparseAlignment.from_tabular_msa(self.msa)
+        packed = PackedAlignment.from_tabular_msa(self.msa)
+        mask = np.array([False, True, True, False, True, True, True, False])
+        for block_residues in (1, 2, 3):
+            with mock.patch('q2_alignment._sparse._BLOCK_RESIDUES',
+                            block_residues):
+                npt.assert_array_equal(sparse.column_counts(),
+                                       packed.column_counts())
+                self.assertEqual(sparse.masked(mask),
+                                 SparseAlignment.from_tabular_msa(
+                                     self.msa[:, mask]))
+                self.assertEqual(sparse.to_tabular_msa(), self.msa)
+
+    def test_iter_rows_blocks(self):
+        sparse = SparseAlignment.from_tabular_msa(self.msa)
+        blocks = list(sparse.iter_rows(block_size=3))
+        self.assertEqual([ids for ids, _ in blocks],
+                         [['seq1', 'seq2', 'seq3'], ['seq4']])
+        self.assertEqual(blocks[1][1].tobytes(), b'-A------')
+
+    def test_read_write(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fp = os.path.join(temp_dir, 'aln.fasta')
+            self.msa.write(fp)
+            sparse = SparseAlignment.read(fp)
+            self.assertEqual(sparse,
+                             SparseAlignment.from_tabular_msa(self.msa))
+
+            out_fp = os.path.join(temp_dir, 'out.fasta')
+            sparse.write(out_fp)
+            with open(out_fp) as fh:
+                self.assertEqual(fh.read(),
+                                 '>seq1\n--AC--G-\n>seq2\n--------\n'
+                                 '>seq3\nTTAC-NN-\n>seq4\n-A------\n')
+
+    def test_read_unaligned(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fp = os.path.join(temp_dir, 'seqs.fasta')
+            with open(fp, 'w') as fh:
+                fh.write('>a\nACGT\n>b\nACG\n')
+            with self.assertRaisesRegex(ValueError, 'not aligned.*b'):
+                SparseAlignment.read(fp)
+
+    def test_inconsistent_runs(self):
+        with self.assertRaisesRegex(ValueError, 'one position per residue'):
+            SparseAlignment(['a'], 4, [0], [2], [0, 1], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import skbio
+
+from q2_alignment import summarize, PackedAlignment
+from q2_alignment._summary import _scan
+
+
+class SummarizeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA(
+            [skbio.DNA('ACGTA-', metadata={'id': 'seq1'}),
+             skbio.DNA('ACGAA-', metadata={'id': 'seq2'}),
+             skbio.DNA('ATGCR-', metadata={'id': 'seq3'}),
+             skbio.DNA('ACTC--', metadata={'id': 'seq4'})]))
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_summarize(self):
+        summarize(self.output_dir, self.alignment)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.output_dir, 'index.html')))
+
+        columns = pd.read_csv(
+            os.path.join(self.output_dir, 'column-summary.tsv'), sep='\t',
+            index_col='position')
+        npt.assert_allclose(columns['gap_frequency'],
+                            [0, 0, 0, 0, 0.25, 1])
+        npt.assert_allclose(columns['conservation'],
+                            [1, 0.75, 0.75, 0.5, 2 / 3, 0])
+        npt.assert_allclose(
+            columns['entropy'],
+            [0, 0.811278, 0.811278, 1.5, 0.918296, 0], atol=1e-6)
+        self.assertEqual(list(columns['most_common']),
+                         ['A', 'C', 'G', 'C', 'A', '-'])
+
+        sequences = pd.read_csv(
+            os.path.join(self.output_dir, 'sequence-summary.tsv'), sep='\t',
+            index_col='id')
+        self.assertEqual(list(sequences.index),
+                         ['seq1', 'seq2', 'seq3', 'seq4'])
+        self.assertEqual(list(sequences['length']), [5, 5, 5, 4])
+        npt.assert_allclose(sequences['gap_frequency'],
+                            [1 / 6, 1 / 6, 1 / 6, 2 / 6])
+
+    def test_scan_in_blocks(self):
+        counts, row_gaps = _scan(self.alignment, block_elements=7)
+        npt.assert_array_equal(counts, self.alignment.column_counts())
+        npt.assert_array_equal(row_gaps, [1, 1, 1, 2])
+        self.assertEqual(counts.dtype, np.int64)
+
+    def test_empty_input(self):
+        alignment = PackedAlignment.from_tabular_msa(skbio.TabularMSA([]))
+        with self.assertRaisesRegex(ValueError, 'empty'):
+            summarize(self.output_dir, alignment)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2020, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import skbio
+from qiime2.plugin.testing import TestPluginBase
+from q2_types.feature_data import AlignedDNAFASTAFormat
+
+from q2_alignment import PackedAlignment, SparseAlignment, MappedAlignment
+from q2_alignment._format import (ColumnProfileFormat, PositionalMaskFormat,
+                                  SequenceOrientationFormat)
+from q2_alignment._fasta import _write_fasta
+from q2_alignment._transformer import _n_jobs
+
+
+class PackedAlignmentTransformerTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_aligned_dna_fasta_format_to_packed_alignment(self):
+        _, obs = self.transform_format(AlignedDNAFASTAFormat, PackedAlignment,
+                                       'aligned-dna-sequences-1.fasta')
+        exp = skbio.TabularMSA.read(
+            self.get_data_path('aligned-dna-sequences-1.fasta'),
+            constructor=skbio.DNA)
+        self.assertEqual(obs, PackedAlignment.from_tabular_msa(exp))
+
+    def test_aligned_dna_fasta_format_to_packed_alignment_in_parallel(self):
+        exp = skbio.TabularMSA.read(
+            self.get_data_path('aligned-dna-sequences-1.fasta'),
+            constructor=skbio.DNA)
+        # Split even this small file into chunks, parsed by two workers.
+        with mock.patch('q2_alignment._fasta._CHUNK_BYTES', 8), \
+                mock.patch.dict('os.environ', {'Q2_ALIGNMENT_N_JOBS': '2'}), \
+                mock.patch('q2_alignment._fasta.ProcessPoolExecutor',
+                           wraps=ProcessPoolExecutor) as executor:
+            _, obs = self.transform_format(AlignedDNAFASTAFormat,
+                                           PackedAlignment,
+                                           'aligned-dna-sequences-1.fasta')
+        self.assertEqual(executor.call_args[1]['max_workers'], 2)
+        self.assertEqual(obs, PackedAlignment.from_tabular_msa(exp))
+
+    def test_packed_alignment_to_aligned_dna_fasta_format(self):
+        exp = skbio.TabularMSA.read(
+            self.get_data_path('aligned-dna-sequences-1.fasta'),
+            constructor=skbio.DNA)
+        transformer = self.get_transformer(PackedAlignment,
+                                           AlignedDNAFASTAFormat)
+        obs = transformer(PackedAlignment.from_tabular_msa(exp))
+        self.assertEqual(
+            skbio.TabularMSA.read(str(obs), constructor=skbio.DNA), exp)
+
+    def test_packed_alignment_to_aligned_dna_fasta_format_in_parallel(self):
+        exp = skbio.TabularMSA.read(
+            self.get_data_path('aligned-dna-sequences-1.fasta'),
+            constructor=skbio.DNA)
+        transformer = self.get_transformer(PackedAlignment,
+                                           AlignedDNAFASTAFormat)
+        with mock.patch.dict('os.environ', {'Q2_ALIGNMENT_N_JOBS': '2'}), \
+                mock.patch('q2_alignment._fasta._write_fasta',
+                           wraps=_write_fasta) as write_fasta:
+            obs = transformer(PackedAlignment.from_tabular_msa(exp))
+        # The alignment is formatted by the same number of workers as it is
+        # read with.
+        self.assertEqual(write_fasta.call_args[0][3], 2)
+        self.assertEqual(
+            skbio.TabularMSA.read(str(obs), constructor=skbio.DNA), exp)
+
+
+class NJobsTests(unittest.TestCase):
+
+    def test_default(self):
+        with mock.patch.dict('os.environ'):
+            os.environ.pop('Q2_ALIGNMENT_N_JOBS', None)
+            n_jobs = _n_jobs()
+        # Limited to the CPUs this process may use, not all of the machine's.
+        if hasattr(os, 'sched_getaffinity'):
+            self.assertEqual(n_jobs, len(os.sched_getaffinity(0)))
+        self.assertGreaterEqual(n_jobs, 1)
+
+    def test_environment_variable(self):
+        with mock.patch.dict('os.environ', {'Q2_ALIGNMENT_N_JOBS': '3'}):
+            self.assertEqual(_n_jobs(), 3)
+        for value in ['0', '-1', 'many', '']:
+            with mock.patch.dict('os.environ',
+                                 {'Q2_ALIGNMENT_N_JOBS': value}):
+                with self.assertRaisesRegex(ValueError,
+                                            'Q2_ALIGNMENT_N_JOBS'):
+                    _n_jobs()
+
+
+class SparseAlignmentTransformerTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_aligned_dna_fasta_format_to_sparse_alignment(self):
+        _, obs = self.transform_format(AlignedDNAFASTAFormat, SparseAlignment,
+                                       'aligned-dna-sequences-1.fasta')
+        exp = skbio.TabularMSA.read(
+            self.get_data_path('aligned-dna-sequences-1.fasta'),
+            constructor=skbio.DNA)
+        self.assertEqual(obs, SparseAlignment.from_tabular_msa(exp))
+
+    def test_sparse_alignment_to_aligned_dna_fasta_format(self):
+        exp = skbio.TabularMSA.read(
+            self.get_data_path('aligned-dna-sequences-1.fasta'),
+            constructor=skbio.DNA)
+        transformer = self.get_transformer(SparseAlignment,
+                                           AlignedDNAFASTAFormat)
+        obs = transformer(SparseAlignment.from_tabular_msa(exp))
+        self.assertEqual(
+            skbio.TabularMSA.read(str(obs), constructor=skbio.DNA), exp)
+
+
+class MappedAlignmentTransformerTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_aligned_dna_fasta_format_to_mapped_alignment(self):
+        _, obs = self.transform_format(AlignedDNAFASTAFormat, MappedAlignment,
+                                       'aligned-dna-sequences-1.fasta')
+        exp = skbio.TabularMSA.read(
+            self.get_data_path('aligned-dna-sequences-1.fasta'),
+            constructor=skbio.DNA)
+        self.assertEqual(obs.to_packed(),
+                         PackedAlignment.from_tabular_msa(exp))
+
+    def test_mapped_alignment_to_aligned_dna_fasta_format(self):
+        exp = skbio.TabularMSA.read(
+            self.get_data_path('aligned-dna-sequences-1.fasta'),
+            constructor=skbio.DNA)
+        transformer = self.get_transformer(MappedAlignment,
+                                           AlignedDNAFASTAFormat)
+        obs = transformer(MappedAlignment.read(
+            self.get_data_path('aligned-dna-sequences-1.fasta')))
+        self.assertEqual(
+            skbio.TabularMSA.read(str(obs), constructor=skbio.DNA), exp)
+
+
+class ColumnProfileTransformerTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_column_profile_format_to_dataframe(self):
+        _, obs = self.transform_format(ColumnProfileFormat, pd.DataFrame,
+                                       'column-profile-1.tsv')
+        self.assertEqual(obs.shape, (7, 16))
+        self.assertEqual(obs.index.name, 'position')
+        self.assertEqual(list(obs['G']), [0, 2, 2, 2, 2, 2, 1])
+        self.assertEqual(list(obs['-']), [0, 0, 0, 0, 0, 0, 1])
+
+    def test_dataframe_to_column_profile_format(self):
+        _, exp = self.transform_format(ColumnProfileFormat, pd.DataFrame,
+                                       'column-profile-1.tsv')
+        transformer = self.get_transformer(pd.DataFrame, ColumnProfileFormat)
+        obs = transformer(exp)
+        with open(str(obs)) as obs_fh, \
+                open(self.get_data_path('column-profile-1.tsv')) as exp_fh:
+            self.assertEqual(obs_fh.read(), exp_fh.read())
+
+
+class PositionalMaskTransformerTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_positional_mask_format_to_ndarray(self):
+        _, obs = self.transform_format(PositionalMaskFormat, np.ndarray,
+                                       'positional-mask-1.bin')
+        npt.assert_array_equal(
+            obs, [True, False, True, True, False, False, True, False, True,
+                  True])
+        self.assertEqual(obs.dtype, bool)
+
+    def test_ndarray_to_positional_mask_format(self):
+        exp = np.array([False, True] * 9 + [True])
+        transformer = self.get_transformer(np.ndarray, PositionalMaskFormat)
+        obs = transformer(exp)
+        obs.validate()
+        transformer = self.get_transformer(PositionalMaskFormat, np.ndarray)
+        npt.assert_array_equal(transformer(obs), exp)
+
+
+class SequenceOrientationTransformerTests(TestPluginBase):
+
+    package = 'q2_alignment.tests'
+
+    def test_sequence_orientation_format_to_dataframe(self):
+        _, obs = self.transform_format(SequenceOrientationFormat,
+                                       pd.DataFrame,
+                                       'sequence-orientation-1.tsv')
+        self.assertEqual(obs.index.name, 'id')
+        self.assertEqual(list(obs.index), ['seq1', 'seq2'])
+        self.assertEqual(list(obs['reverse_complemented']), [False, True])
+        self.assertEqual(list(obs['reverse_similarity']), [0.2, 0.8])
+
+    def test_dataframe_to_sequence_orientation_format(self):
+        _, exp = self.transform_format(SequenceOrientationFormat,
+                                       pd.DataFrame,
+                                       'sequence-orientation-1.tsv')
+        transformer = self.get_transformer(pd.DataFrame,
+                                           SequenceOrientationFormat)
+        obs = transformer(exp)
+        with open(str(obs)) as obs_fh, \
+                open(self.get_data_path(
+                    'sequence-orientation-1.tsv')) as exp_fh:
+            self.assertEqual(obs_fh.read(), exp_fh.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,7 +15,7 @@ setup(
     name="q2-alignment",
     version=versioneer.get_version(),
     cmdclass=versioneer.get_cmdclass(),
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     author="Greg Caporaso",
     author_email="gregcaporaso@gmail.com",
     description="Create and work with alignments in QIIME 2.",